@@ -0,0 +1,80 @@
+"""
+Cold-start time of the eido package and CLI subcommands
+
+Every measurement runs in a fresh interpreter. The results are printed as
+JSON; with --budget the script exits with an error if the median time of
+any command exceeds it.
+
+    python benchmarks/startup.py --repeat 10 --budget 0.5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+COMMANDS = {
+    "import eido": ["-c", "import eido"],
+    "eido --version": ["-m", "eido", "--version"],
+    "eido validate --help": ["-m", "eido", "validate", "--help"],
+    "eido convert --help": ["-m", "eido", "convert", "--help"],
+    "eido inspect --help": ["-m", "eido", "inspect", "--help"],
+    "eido convert --list": ["-m", "eido", "convert", "--list"],
+    "eido cache list": ["-m", "eido", "cache", "list"],
+}
+
+
+def time_command(args, repeat):
+    """
+    Time a command run in fresh interpreters
+
+    :param list[str] args: arguments to the Python interpreter
+    :param int repeat: number of runs
+    :return list[float]: wall time of every run in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per command.")
+    parser.add_argument(
+        "--budget", type=float, default=None, help="Maximum median time in seconds."
+    )
+    parser.add_argument(
+        "commands", nargs="*", choices=[[], *COMMANDS], help="Commands to time."
+    )
+    args = parser.parse_args()
+
+    baseline = statistics.median(time_command(["-c", "pass"], args.repeat))
+    results = {"interpreter": baseline, "commands": {}}
+    over_budget = []
+    for name in args.commands or COMMANDS:
+        times = time_command(COMMANDS[name], args.repeat)
+        median = statistics.median(times)
+        results["commands"][name] = {
+            "median": median,
+            "min": min(times),
+            "overhead": median - baseline,
+        }
+        if args.budget is not None and median > args.budget:
+            over_budget.append(name)
+    print(json.dumps(results, indent=2))
+    if over_budget:
+        sys.exit(f"Over the {args.budget}s budget: {', '.join(over_budget)}")
+
+
+if __name__ == "__main__":
+    main()
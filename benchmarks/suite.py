@@ -0,0 +1,546 @@
+"""
+Wall time and throughput of the eido API on synthetic PEPs
+
+Every combination of the scenario parameters is generated with
+synthetic.make_pep and every API is timed on it. The results are written
+as JSON; with --compare the script exits with an error if any API got
+slower than in a previous result file by more than the tolerance, and with
+--max-exponent if the time of any API grows faster with the number of
+samples than the given power of it.
+
+With --memory, the APIs run under tracemalloc and the peak and retained
+allocations of every one of them are reported instead of times; the
+per-sample memory budgets given with --memory-budget are then enforced.
+
+    python benchmarks/suite.py --samples 1000 10000 100000 --fanout 0 3 \\
+        --output results.json
+    python benchmarks/suite.py --samples 1000 10000 --compare results.json
+    python benchmarks/suite.py --memory --memory-budget '*=64KiB' \\
+        validate_project=16KiB
+"""
+
+import argparse
+import contextlib
+import gc
+import importlib
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timezone
+
+from eido import get_pep_filter
+from synthetic import make_pep
+
+RESULTS_FORMAT_VERSION = 1
+
+# samples the per-sample APIs are timed on, at most
+DEFAULT_SAMPLE_LIMIT = 1000
+
+
+def _load_project(pep):
+    from peppy import Project
+
+    return Project(pep["config"])
+
+
+def _read_schema(project, pep, limit):
+    from eido import read_schema
+    from eido.schema import clear_schema_cache
+
+    clear_schema_cache()
+    read_schema(pep["schema"])
+    return len(project.samples)
+
+
+def _project_to_dict(project, pep, limit):
+    project.to_dict()
+    return len(project.samples)
+
+
+def _validate_project(project, pep, limit):
+    from eido import validate_project
+    from eido.exceptions import EidoValidationError
+
+    with contextlib.suppress(EidoValidationError):
+        validate_project(project, pep["schema"])
+    return len(project.samples)
+
+
+def _validate_sample(project, pep, limit):
+    from eido import validate_sample
+    from eido.exceptions import EidoValidationError
+
+    samples = project.samples[:limit]
+    for i in range(len(samples)):
+        with contextlib.suppress(EidoValidationError):
+            validate_sample(project, i, pep["schema"])
+    return len(samples)
+
+
+def _validate_input_files(project, pep, limit):
+    from eido import validate_input_files
+    from eido.exceptions import EidoValidationError, PathAttrNotFoundError
+
+    with warnings.catch_warnings(), contextlib.suppress(
+        EidoValidationError, PathAttrNotFoundError
+    ):
+        warnings.simplefilter("ignore")
+        validate_input_files(project, pep["schema"])
+    return len(project.samples)
+
+
+def _get_input_files_size(project, pep, limit):
+    from eido import StatCache, get_input_files_size, read_schema
+
+    from eido.exceptions import EidoValidationError
+
+    schemas = read_schema(pep["schema"])
+    stat_cache = StatCache()
+    samples = project.samples[:limit]
+    for sample in samples:
+        with contextlib.suppress(EidoValidationError):
+            get_input_files_size(sample, schemas, stat_cache=stat_cache)
+    return len(samples)
+
+
+def _convert(target_format):
+    def _convert_project(project, pep, limit):
+        from eido.conversion import run_filter
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {
+                key: os.path.join(directory, key)
+                for key in ["project", "samples", "subsamples"]
+            }
+            run_filter(
+                project,
+                target_format,
+                verbose=False,
+                plugin_kwargs={"paths": paths, "stream": True},
+            )
+        return len(project.samples)
+
+    return _convert_project
+
+
+def _inspect_project(project, pep, limit):
+    from eido import inspect_project
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        inspect_project(project)
+        names = [s.sample_name for s in project.samples[:limit]]
+        inspect_project(project, sample_names=names)
+    return len(names)
+
+
+APIS = {
+    "read_schema": _read_schema,
+    "project_to_dict": _project_to_dict,
+    "validate_project": _validate_project,
+    "validate_sample": _validate_sample,
+    "validate_input_files": _validate_input_files,
+    "get_input_files_size": _get_input_files_size,
+    "convert_project:csv": _convert("csv"),
+    "convert_project:yaml-samples": _convert("yaml-samples"),
+    "convert_project:jsonl": _convert("jsonl"),
+    "inspect_project": _inspect_project,
+}
+
+
+def scenario_id(params):
+    return ",".join(f"{k}={v}" for k, v in params.items())
+
+
+def time_api(api, project, pep, repeat, limit):
+    """
+    Time an API on a project
+
+    :param callable api: function running the API, returning the number of
+        samples it processed
+    :param peppy.Project project: project to run the API on
+    :param dict[str, str] pep: paths to the project config and schema
+    :param int repeat: number of runs
+    :param int limit: maximum number of samples for the per-sample APIs
+    :return dict: times of the runs in seconds, their median and minimum,
+        and the number of samples processed per second
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = api(project, pep, limit)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {
+        "times": times,
+        "median": median,
+        "min": min(times),
+        "items": items,
+        "items_per_second": items / median if median else None,
+    }
+
+
+class PhasePeaks:
+    """
+    Span callback recording the peak traced memory of every eido phase
+
+    The peak is read and reset whenever a phase ends, so the peak of a phase
+    covers the time since the previous phase ended, and includes the peaks
+    of the phases nested in it.
+    """
+
+    def __init__(self):
+        self.peaks = {}
+        self.overall = 0
+        self._nested = {}
+
+    def __call__(self, span):
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        peak = max(peak, self._nested.pop(id(span), 0))
+        self.overall = max(self.overall, peak)
+        self.peaks[span.path] = max(self.peaks.get(span.path, 0), peak)
+        if span.parent is not None:
+            parent = id(span.parent)
+            self._nested[parent] = max(self._nested.get(parent, 0), peak)
+
+
+def trace_api(api, project, pep, limit):
+    """
+    Measure the memory allocated by an API on a project, with tracemalloc
+
+    :param callable api: function running the API, returning the number of
+        samples it processed
+    :param peppy.Project project: project to run the API on
+    :param dict[str, str] pep: paths to the project config and schema
+    :param int limit: maximum number of samples for the per-sample APIs
+    :return dict: peak and retained allocations in bytes, in total and
+        per processed sample, and the peak of every eido phase
+    """
+    from eido import add_span_callback, remove_span_callback
+
+    phases = PhasePeaks()
+    gc.collect()
+    tracemalloc.start()
+    add_span_callback(phases)
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        items = api(project, pep, limit)
+        _, peak = tracemalloc.get_traced_memory()
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        remove_span_callback(phases)
+        tracemalloc.stop()
+    peak = max(peak, phases.overall) - start
+    retained = max(current - start, 0)
+    return {
+        "peak": peak,
+        "retained": retained,
+        "items": items,
+        "peak_per_sample": peak / items if items else None,
+        "retained_per_sample": retained / items if items else None,
+        "phases": {path: max(p - start, 0) for path, p in phases.peaks.items()},
+    }
+
+
+def warm_up():
+    """
+    Run the one-off work of eido outside of the measurements
+
+    Imports the modules eido loads lazily and validates a small project, so
+    that jsonschema and its internals are loaded before the first traced run.
+    """
+    from eido import validate_project
+    from eido.exceptions import EidoValidationError
+
+    for module in ["peppy", "jsonschema", "eido.validation", "eido.inspection"]:
+        importlib.import_module(module)
+    for name in ["csv", "yaml-samples", "jsonl"]:
+        get_pep_filter(name)
+    with tempfile.TemporaryDirectory() as directory:
+        pep = make_pep(directory, samples=10)
+        with contextlib.suppress(EidoValidationError):
+            validate_project(_load_project(pep), pep["schema"])
+
+
+def run_scenario(params, apis, repeat, limit, memory=False):
+    """
+    Generate a synthetic PEP and time the APIs on it
+
+    :param dict params: parameters of synthetic.make_pep
+    :param Iterable[str] apis: names of the APIs to time
+    :param int repeat: number of runs of every API
+    :param int limit: maximum number of samples for the per-sample APIs
+    :param bool memory: measure the memory allocations instead of the times
+    :return dict[str, dict]: timings or allocations by API
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        pep = make_pep(directory, **params)
+        if memory:
+            loaded = {}
+
+            def _load(project, pep, limit):
+                loaded["project"] = _load_project(pep)
+                return params["samples"]
+
+            results = {"load_project": trace_api(_load, None, pep, limit)}
+            project = loaded.pop("project")
+        else:
+            start = time.perf_counter()
+            project = _load_project(pep)
+            load_time = time.perf_counter() - start
+            results = {
+                "load_project": {
+                    "times": [load_time],
+                    "median": load_time,
+                    "min": load_time,
+                    "items": params["samples"],
+                    "items_per_second": params["samples"] / load_time,
+                }
+            }
+        for name in apis:
+            if memory:
+                results[name] = trace_api(APIS[name], project, pep, limit)
+                summary = f"peak {results[name]['peak'] / 1024**2:.1f}MiB"
+            else:
+                results[name] = time_api(APIS[name], project, pep, repeat, limit)
+                summary = f"{results[name]['median']:.4f}s"
+            print(f"{scenario_id(params)} {name}: {summary}", file=sys.stderr)
+    return results
+
+
+def get_scaling(scenarios, key="median"):
+    """
+    Estimate how the time of every API grows with the number of samples
+
+    The exponent is the slope of the log of the median time against the log
+    of the number of samples processed, between scenarios that differ in the
+    number of samples only: 1 is linear scaling.
+
+    :param list[dict] scenarios: results of the scenarios
+    :param str key: measurement to estimate the growth of, e.g. 'peak'
+        for the peak memory
+    :return dict[str, float]: largest exponent of every API
+    """
+    groups = {}
+    for scenario in scenarios:
+        other_params = tuple(
+            (k, v) for k, v in scenario["params"].items() if k != "samples"
+        )
+        groups.setdefault(other_params, []).append(scenario)
+    exponents = {}
+    for group in groups.values():
+        group.sort(key=lambda s: s["params"]["samples"])
+        for smaller, larger in zip(group, group[1:]):
+            for api, result in larger["results"].items():
+                before = smaller["results"].get(api)
+                if (
+                    before is None
+                    or result["items"] == before["items"]
+                    or min(result[key], before[key]) <= 0
+                ):
+                    continue
+                exponent = math.log(result[key] / before[key]) / math.log(
+                    result["items"] / before["items"]
+                )
+                exponents[api] = max(exponent, exponents.get(api, -math.inf))
+    return exponents
+
+
+def compare(results, baseline, tolerance, key="median"):
+    """
+    Find the APIs that got slower than in the baseline results
+
+    :param dict results: current results
+    :param dict baseline: previous results
+    :param float tolerance: allowed relative increase of the measurement
+    :param str key: measurement to compare, e.g. 'peak' for the peak memory
+    :return list[str]: descriptions of the regressions
+    """
+    previous = {s["id"]: s["results"] for s in baseline["scenarios"]}
+    regressions = []
+    for scenario in results["scenarios"]:
+        for api, result in scenario["results"].items():
+            before = previous.get(scenario["id"], {}).get(api)
+            if before is None or key not in before or not before[key]:
+                continue
+            ratio = result[key] / before[key]
+            if ratio > 1 + tolerance:
+                regressions.append(f"{scenario['id']} {api}: {ratio:.2f}x {key}")
+    return regressions
+
+
+def parse_size(size):
+    """
+    Parse a number of bytes, optionally with a binary unit: KiB, MiB or GiB
+
+    :param str size: size like '512', '64KiB' or '1.5MiB'
+    :return float: number of bytes
+    """
+    match = re.fullmatch(r"([0-9.]+)\s*([KMG]i?B?)?", size.strip(), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid size: {size}")
+    unit = (match.group(2) or "B")[0].upper()
+    return float(match.group(1)) * 1024 ** "BKMG".index(unit)
+
+
+def check_memory_budgets(results, budgets):
+    """
+    Find the APIs that allocated more memory per sample than their budget
+
+    :param dict results: results of a memory run
+    :param dict[str, float] budgets: maximum peak allocation per sample in
+        bytes, by API name; '*' applies to the APIs without a budget
+    :return list[str]: descriptions of the exceeded budgets
+    """
+    exceeded = []
+    for scenario in results["scenarios"]:
+        for api, result in scenario["results"].items():
+            budget = budgets.get(api, budgets.get("*"))
+            per_sample = result["peak_per_sample"]
+            if budget is not None and per_sample is not None and per_sample > budget:
+                exceeded.append(
+                    f"{scenario['id']} {api}: {per_sample:.0f} bytes per sample, "
+                    f"budget {budget:.0f}"
+                )
+    return exceeded
+
+
+def _get_environment():
+    from importlib.metadata import version
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "packages": {
+            name: version(name) for name in ["eido", "peppy", "jsonschema", "pandas"]
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.strip().splitlines()[1:]),
+    )
+    parser.add_argument("--samples", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--columns", type=int, nargs="+", default=[10])
+    parser.add_argument("--fanout", type=int, nargs="+", default=[0])
+    parser.add_argument("--import-depth", type=int, nargs="+", default=[0])
+    parser.add_argument("--error-rate", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--api", nargs="+", choices=list(APIS), default=list(APIS), dest="apis"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per API.")
+    parser.add_argument(
+        "--sample-limit",
+        type=int,
+        default=DEFAULT_SAMPLE_LIMIT,
+        help="Maximum number of samples the per-sample APIs are timed on.",
+    )
+    parser.add_argument("--output", help="File to write the results to.")
+    parser.add_argument("--compare", help="Previous results to compare to.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative slowdown compared to the previous results.",
+    )
+    parser.add_argument(
+        "--max-exponent",
+        type=float,
+        default=None,
+        help="Maximum growth exponent of the time with the number of samples.",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="Measure peak and retained allocations instead of times.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        nargs="+",
+        default=[],
+        metavar="API=SIZE",
+        help="Maximum peak allocation per sample of an API, e.g. "
+        "validate_project=16KiB; use * for all the other APIs.",
+    )
+    args = parser.parse_args()
+    budgets = {}
+    for budget in args.memory_budget:
+        api, _, size = budget.partition("=")
+        if api != "*" and api not in APIS and api != "load_project":
+            parser.error(f"Unknown API in memory budget: {api}")
+        budgets[api] = parse_size(size)
+    key = "peak" if args.memory else "median"
+    if args.memory:
+        warm_up()
+
+    scenarios = []
+    for samples, columns, fanout, import_depth, error_rate in itertools.product(
+        args.samples, args.columns, args.fanout, args.import_depth, args.error_rate
+    ):
+        params = {
+            "samples": samples,
+            "columns": columns,
+            "fanout": fanout,
+            "import_depth": import_depth,
+            "error_rate": error_rate,
+            "seed": args.seed,
+        }
+        scenarios.append(
+            {
+                "id": scenario_id(params),
+                "params": params,
+                "results": run_scenario(
+                    params, args.apis, args.repeat, args.sample_limit, args.memory
+                ),
+            }
+        )
+    results = {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "mode": "memory" if args.memory else "time",
+        "environment": _get_environment(),
+        "scenarios": scenarios,
+        "scaling": get_scaling(scenarios, key),
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    failures = []
+    if args.compare:
+        with open(args.compare) as f:
+            failures.extend(compare(results, json.load(f), args.tolerance, key))
+    if args.max_exponent is not None:
+        failures.extend(
+            f"{api}: {key} grows as samples^{exponent:.2f}"
+            for api, exponent in results["scaling"].items()
+            if exponent > args.max_exponent
+        )
+    if args.memory:
+        failures.extend(check_memory_budgets(results, budgets))
+    if failures:
+        sys.exit("\n".join(["Benchmark regressions:"] + failures))
+
+
+if __name__ == "__main__":
+    main()
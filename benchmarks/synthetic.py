@@ -0,0 +1,194 @@
+"""
+Deterministic generator of synthetic PEPs and schemas for the benchmarks
+
+The same parameters always give the same files, so the results of runs on
+different machines or eido versions can be compared.
+
+    python benchmarks/synthetic.py /tmp/pep --samples 10000 --fanout 3
+"""
+
+import argparse
+import csv
+import os
+import random
+
+import yaml
+
+PROTOCOLS = ["RNA-seq", "ATAC-seq", "WGS", "ChIP-seq"]
+
+# number of distinct input files the samples refer to
+INPUT_FILES = 100
+
+
+def make_pep(
+    directory,
+    samples=1000,
+    columns=10,
+    fanout=0,
+    import_depth=0,
+    error_rate=0.0,
+    seed=0,
+):
+    """
+    Write a synthetic PEP, its input files and a schema to validate it with
+
+    Every sample has a protocol, an input file and `columns` more string
+    attributes. With a subsample fan-out, the input files are listed in
+    a subsample table instead, `fanout` of them per sample. A fraction
+    `error_rate` of the samples have an invalid protocol and a missing
+    input file.
+
+    :param str directory: directory to write the PEP to
+    :param int samples: number of samples
+    :param int columns: number of extra sample attributes
+    :param int fanout: number of subsamples of every sample, 0 for no
+        subsample table
+    :param int import_depth: length of the chain of schemas the schema imports
+    :param float error_rate: fraction of the samples that are invalid
+    :param int seed: seed of the random values
+    :return dict[str, str]: paths to the project config ('config') and
+        the schema ('schema')
+    """
+    rng = random.Random(seed)
+    directory = os.path.abspath(directory)
+    os.makedirs(os.path.join(directory, "data"), exist_ok=True)
+    for i in range(INPUT_FILES):
+        with open(os.path.join(directory, "data", f"input_{i}.txt"), "w") as f:
+            f.write("x" * (1 + i))
+
+    invalid = set(rng.sample(range(samples), int(round(samples * error_rate))))
+
+    def _input_file(i, j=0):
+        if i in invalid:
+            return os.path.join(directory, "data", f"missing_{i}_{j}.txt")
+        return os.path.join(directory, "data", f"input_{(i + j) % INPUT_FILES}.txt")
+
+    extra_columns = [f"attribute_{j}" for j in range(columns)]
+    header = ["sample_name", "protocol"] + extra_columns
+    if not fanout:
+        header.append("input_file")
+    with open(os.path.join(directory, "sample_table.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(samples):
+            row = [
+                f"sample_{i}",
+                "INVALID" if i in invalid else rng.choice(PROTOCOLS),
+            ] + [f"value_{rng.randrange(1000)}" for _ in extra_columns]
+            if not fanout:
+                row.append(_input_file(i))
+            writer.writerow(row)
+
+    config = {"pep_version": "2.1.0", "sample_table": "sample_table.csv"}
+    if fanout:
+        with open(os.path.join(directory, "subsample_table.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["sample_name", "subsample_name", "input_file"])
+            for i in range(samples):
+                for j in range(fanout):
+                    writer.writerow([f"sample_{i}", f"sub_{j}", _input_file(i, j)])
+        config["subsample_table"] = ["subsample_table.csv"]
+    config_path = os.path.join(directory, "project_config.yaml")
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f)
+
+    return {
+        "config": config_path,
+        "schema": _make_schema_chain(directory, extra_columns, import_depth),
+    }
+
+
+def _make_schema_chain(directory, extra_columns, import_depth):
+    """
+    Write a schema importing a chain of `import_depth` other schemas
+
+    Every imported schema constrains one more of the extra attributes.
+
+    :param str directory: directory to write the schemas to
+    :param list[str] extra_columns: names of the extra sample attributes
+    :param int import_depth: number of schemas in the import chain
+    :return str: path to the top schema
+    """
+    path = None
+    for depth in range(import_depth, 0, -1):
+        attribute = extra_columns[depth % len(extra_columns)] if extra_columns else None
+        schema = {
+            "description": f"imported schema {depth}",
+            "properties": {
+                "samples": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": (
+                            {attribute: {"type": "string", "pattern": "^value_"}}
+                            if attribute
+                            else {}
+                        ),
+                    },
+                }
+            },
+        }
+        if path is not None:
+            schema["imports"] = [path]
+        path = os.path.join(directory, f"schema_{depth}.yaml")
+        with open(path, "w") as f:
+            yaml.safe_dump(schema, f)
+
+    schema = {
+        "description": "synthetic PEP schema",
+        "properties": {
+            "samples": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "sample_name": {"type": "string"},
+                        "protocol": {"type": "string", "enum": PROTOCOLS},
+                        "input_file": {
+                            "anyOf": [
+                                {"type": "string"},
+                                {"type": "array", "items": {"type": "string"}},
+                            ]
+                        },
+                        **{c: {"type": "string"} for c in extra_columns},
+                    },
+                    "required": ["sample_name", "protocol", "input_file"],
+                    "tangible": ["input_file"],
+                    "sizing": ["input_file"],
+                },
+            }
+        },
+        "required": ["samples"],
+    }
+    if path is not None:
+        schema["imports"] = [path]
+    path = os.path.join(directory, "schema.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(schema, f)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory", help="Directory to write the PEP to.")
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--fanout", type=int, default=0)
+    parser.add_argument("--import-depth", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = make_pep(
+        args.directory,
+        samples=args.samples,
+        columns=args.columns,
+        fanout=args.fanout,
+        import_depth=args.import_depth,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    print(yaml.safe_dump(paths), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Throughput of the YAML filters on a synthetic PEP
+
+Compares the previous implementation of the yaml-samples and yaml filters,
+which dumped all the samples at once with the pure Python emitter, to the
+current one, with libyaml when available and without it. The outputs are
+checked to be identical and the results printed as JSON.
+
+    python benchmarks/yaml_filters.py --samples 20000 --repeat 3
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+
+import yaml
+from peppy import Project
+
+from eido import conversion_plugins
+from eido.conversion_plugins import yaml_pep_filter, yaml_samples_pep_filter
+from synthetic import make_pep
+
+
+def legacy_yaml_samples_pep_filter(p, **kwargs):
+    return {
+        "samples": yaml.dump([s.to_dict() for s in p.samples], default_flow_style=False)
+    }
+
+
+def legacy_yaml_pep_filter(p, **kwargs):
+    return {"project": yaml.dump(p.config, default_flow_style=False)}
+
+
+def pure_python(filter_fun):
+    """
+    Run a filter with the pure Python YAML emitter, as without libyaml
+    """
+
+    def _filter(p, **kwargs):
+        get_dumper = conversion_plugins._get_yaml_dumper
+        conversion_plugins._get_yaml_dumper = lambda: yaml.Dumper
+        try:
+            return filter_fun(p, **kwargs)
+        finally:
+            conversion_plugins._get_yaml_dumper = get_dumper
+
+    return _filter
+
+
+def streamed(filter_fun):
+    """
+    Run a filter with streamed output, consumed chunk by chunk
+    """
+
+    def _filter(p, **kwargs):
+        return {
+            k: "".join(v) if not isinstance(v, str) else v
+            for k, v in filter_fun(p, stream=True).items()
+        }
+
+    return _filter
+
+
+FILTERS = {
+    "yaml-samples": {
+        "legacy": legacy_yaml_samples_pep_filter,
+        "libyaml": yaml_samples_pep_filter,
+        "libyaml streamed": streamed(yaml_samples_pep_filter),
+        "python": pure_python(yaml_samples_pep_filter),
+    },
+    "yaml": {
+        "legacy": legacy_yaml_pep_filter,
+        "libyaml": yaml_pep_filter,
+        "python": pure_python(yaml_pep_filter),
+    },
+}
+
+
+def time_filter(filter_fun, p, repeat):
+    """
+    Time a filter run on a project
+
+    :param callable filter_fun: filter function
+    :param peppy.Project p: project to convert
+    :param int repeat: number of runs
+    :return (list[float], dict[str, str]): wall time of every run in seconds
+        and the result of the last run
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = filter_fun(p)
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=10000, help="Sample count.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per filter.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        p = Project(make_pep(directory, samples=args.samples)["config"])
+        results = {
+            "samples": args.samples,
+            "libyaml": yaml.__with_libyaml__,
+            "filters": {},
+        }
+        mismatches = []
+        for filter_name, implementations in FILTERS.items():
+            results["filters"][filter_name] = {}
+            legacy_output = None
+            for name, filter_fun in implementations.items():
+                times, output = time_filter(filter_fun, p, args.repeat)
+                median = statistics.median(times)
+                n_bytes = sum(len(v) for v in output.values())
+                results["filters"][filter_name][name] = {
+                    "median": median,
+                    "samples_per_second": args.samples / median,
+                    "megabytes_per_second": n_bytes / median / 1024**2,
+                }
+                if legacy_output is None:
+                    legacy_output = output
+                elif output != legacy_output:
+                    mismatches.append(f"{filter_name} ({name})")
+    print(json.dumps(results, indent=2))
+    if mismatches:
+        sys.exit(f"Output differs from the legacy filter: {', '.join(mismatches)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,28 +2,143 @@
 Project configuration
 """
 
+from importlib import import_module
+
 from ._version import __version__
 from .const import *
-from .conversion import *
-from .conversion_plugins import *
 from .exceptions import *
-from .inspection import *
-from .schema import *
-from .validation import *
+
+# The public functions and classes are imported from their modules on first
+# access, so that `import eido` does not pull in pandas, peppy or jsonschema
+_LAZY_ATTRS = {
+    "pep_conversion_plugins": "conversion",
+    "convert_project": "conversion",
+    "convert_project_multi": "conversion",
+    "run_filter": "conversion",
+    "FilterContext": "conversion",
+    "get_filter_context": "conversion",
+    "save_result": "conversion",
+    "get_available_pep_filters": "conversion",
+    "get_pep_filter": "conversion",
+    "clear_filter_registry": "conversion",
+    "basic_pep_filter": "conversion_plugins",
+    "yaml_samples_pep_filter": "conversion_plugins",
+    "yaml_pep_filter": "conversion_plugins",
+    "csv_pep_filter": "conversion_plugins",
+    "processed_pep_filter": "conversion_plugins",
+    "parquet_pep_filter": "conversion_plugins",
+    "arrow_pep_filter": "conversion_plugins",
+    "feather_pep_filter": "conversion_plugins",
+    "jsonl_pep_filter": "conversion_plugins",
+    "start_debug_trace": "debug_trace",
+    "stop_debug_trace": "debug_trace",
+    "StatCache": "file_probe",
+    "Span": "instrumentation",
+    "SpanRecorder": "instrumentation",
+    "span": "instrumentation",
+    "instrumented": "instrumentation",
+    "add_span_callback": "instrumentation",
+    "remove_span_callback": "instrumentation",
+    "inspect_project": "inspection",
+    "get_input_files_size": "inspection",
+    "get_project_input_files_size": "inspection",
+    "preprocess_schema": "schema",
+    "read_schema": "schema",
+    "clear_schema_cache": "schema",
+    "configure_schema_cache": "schema_cache",
+    "list_cached_schemas": "schema_cache",
+    "prune_schema_cache": "schema_cache",
+    "SchemaProfiler": "schema_profiler",
+    "iter_streamed_validation_errors": "streaming",
+    "validate_project_stream": "streaming",
+    "validate_sample_table": "table_validation",
+    "get_validator": "validation",
+    "validator_cache_info": "validation",
+    "clear_validator_cache": "validation",
+    "iter_validation_errors": "validation",
+    "validate_project": "validation",
+    "validate_sample": "validation",
+    "validate_config": "validation",
+    "get_missing_input_files": "validation",
+    "validate_input_files": "validation",
+}
+
+_SUBMODULES = {
+    "argparser",
+    "cli",
+    "conversion",
+    "conversion_plugins",
+    "debug_trace",
+    "file_probe",
+    "inspection",
+    "instrumentation",
+    "output_formatters",
+    "schema",
+    "schema_cache",
+    "schema_profiler",
+    "streaming",
+    "table_validation",
+    "validation",
+}
 
 __all__ = [
     "validate_project",
     "validate_sample",
     "validate_config",
+    "iter_validation_errors",
+    "validate_sample_table",
+    "validate_project_stream",
+    "iter_streamed_validation_errors",
     "read_schema",
+    "clear_schema_cache",
+    "configure_schema_cache",
+    "list_cached_schemas",
+    "prune_schema_cache",
     "inspect_project",
     "get_available_pep_filters",
+    "get_pep_filter",
     "convert_project",
+    "convert_project_multi",
+    "FilterContext",
+    "get_filter_context",
     "basic_pep_filter",
     "yaml_pep_filter",
     "csv_pep_filter",
     "yaml_samples_pep_filter",
+    "parquet_pep_filter",
+    "arrow_pep_filter",
+    "feather_pep_filter",
+    "jsonl_pep_filter",
     "EidoValidationError",
     "validate_input_files",
     "get_input_files_size",
+    "get_project_input_files_size",
+    "get_missing_input_files",
+    "StatCache",
+    "get_validator",
+    "validator_cache_info",
+    "clear_validator_cache",
+    "Span",
+    "SpanRecorder",
+    "span",
+    "add_span_callback",
+    "remove_span_callback",
+    "SchemaProfiler",
+    "start_debug_trace",
+    "stop_debug_trace",
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        value = getattr(import_module(f".{_LAZY_ATTRS[name]}", __name__), name)
+    elif name in _SUBMODULES:
+        value = import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS) | _SUBMODULES)
@@ -1,7 +1,7 @@
+from argparse import ArgumentTypeError
+from importlib.metadata import PackageNotFoundError, version
 from logging import CRITICAL, DEBUG, ERROR, INFO, WARN
 
-from peppy.const import SAMPLE_NAME_ATTR
-from peppy import __version__ as peppy_version
 from ubiquerg import VersionInHelpParser
 
 from . import __version__
@@ -9,9 +9,33 @@ from .const import *
 
 LEVEL_BY_VERBOSITY = [ERROR, CRITICAL, WARN, INFO, DEBUG]
 
+# peppy.const.SAMPLE_NAME_ATTR, not imported since importing peppy is slow
+SAMPLE_NAME_ATTR = "sample_name"
+
+try:
+    peppy_version = version("peppy")
+except PackageNotFoundError:
+    peppy_version = "unknown"
+
 version_combined = f"{__version__} (peppy {peppy_version})"
 
 
+def _positive_int(value):
+    """
+    Parse a command line value that has to be a positive integer
+
+    :param str value: command line value
+    :return int: the parsed value
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise ArgumentTypeError(f"has to be a positive integer, got: {number}")
+    return number
+
+
 def build_argparser():
     banner = "%(prog)s - Interact with PEPs"
     additional_description = "\nhttp://eido.databio.org/"
@@ -38,6 +62,39 @@ def build_argparser():
         action="store_true",
         help="Turn on debug mode (default: %(default)s)",
     )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Do not use the on-disk schema cache and filter index (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--offline",
+        dest="offline",
+        action="store_true",
+        help="Read remote schemas from the schema cache only (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="Print the time spent in every phase of the run to stderr",
+    )
+    parser.add_argument(
+        "--profile-json",
+        dest="profile_json",
+        metavar="FILE",
+        default=None,
+        help="Write the time spent in every phase of the run as JSON to FILE, "
+        "'-' for stdout",
+    )
+    parser.add_argument(
+        "--debug-trace",
+        dest="debug_trace",
+        metavar="FILE",
+        default=None,
+        help="Write the objects and schemas validated, as JSON lines, to FILE",
+    )
     sps = {}
     for cmd, desc in SUBPARSER_MSGS.items():
         subparser = subparsers.add_parser(cmd, description=desc, help=desc)
@@ -80,6 +137,32 @@ def build_argparser():
 
         sps[cmd] = subparser
 
+    cache_msg = "Inspect, prune or warm the on-disk schema cache"
+    sps[CACHE_CMD] = subparsers.add_parser(
+        CACHE_CMD, description=cache_msg, help=cache_msg
+    )
+    sps[CACHE_CMD].add_argument(
+        "action",
+        choices=["list", "prune", "warm"],
+        help="List the cached schemas, evict the least recently used ones "
+        "or cache the given schemas.",
+    )
+    sps[CACHE_CMD].add_argument(
+        "schemas",
+        metavar="S",
+        nargs="*",
+        help="Paths or URLs of the schemas to cache.",
+    )
+    sps[CACHE_CMD].add_argument(
+        "--max-size",
+        required=False,
+        type=int,
+        default=None,
+        help="Size of the cache in bytes to prune it to. "
+        "Use 0 to clear the cache (default: the configured maximum size).",
+        metavar="B",
+    )
+
     sps[VALIDATE_CMD].add_argument(
         "-s",
         "--schema",
@@ -88,6 +171,65 @@ def build_argparser():
         metavar="S",
     )
 
+    sps[VALIDATE_CMD].add_argument(
+        "-j",
+        "--jobs",
+        required=False,
+        type=int,
+        default=None,
+        help="Number of processes to validate samples with. "
+        "Use 0 to use all available CPUs (default: validate in a single process).",
+        metavar="N",
+    )
+
+    sps[VALIDATE_CMD].add_argument(
+        "--chunk-size",
+        required=False,
+        type=_positive_int,
+        default=None,
+        help="Number of samples validated by one process at a time, "
+        "or number of sample table rows read at a time with --stream.",
+        metavar="N",
+    )
+
+    sps[VALIDATE_CMD].add_argument(
+        "--max-errors",
+        required=False,
+        type=_positive_int,
+        default=None,
+        help="Stop the validation after this many errors are found.",
+        metavar="N",
+    )
+
+    sps[VALIDATE_CMD].add_argument(
+        "--stream",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Read the sample table in chunks and report errors as they are found. "
+        "Memory use depends on the chunk size, not on the project size. "
+        "Sample modifiers are not applied.",
+    )
+
+    sps[VALIDATE_CMD].add_argument(
+        "--profile-schema",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Time every schema rule during the validation and print the most "
+        "expensive ones. Validates in a single process.",
+    )
+
+    sps[VALIDATE_CMD].add_argument(
+        "--profile-schema-limit",
+        required=False,
+        type=int,
+        default=20,
+        help="Number of schema rules listed by --profile-schema "
+        "(default: %(default)s).",
+        metavar="N",
+    )
+
     sps[INSPECT_CMD].add_argument(
         "-n",
         "--sample-name",
@@ -130,8 +272,19 @@ def build_argparser():
         "-f",
         "--format",
         required=False,
-        default="yaml",
-        help="Output format (name of filter; use -l to see available).",
+        action="append",
+        default=None,
+        help="Output format (name of filter; use -l to see available). "
+        "Repeat to convert to several formats at once.",
+    )
+
+    sps[CONVERT_CMD].add_argument(
+        "-j",
+        "--jobs",
+        required=False,
+        type=int,
+        default=1,
+        help="Number of filters to run in parallel, with several formats.",
     )
 
     sps[CONVERT_CMD].add_argument(
@@ -174,6 +327,8 @@ def build_argparser():
         "-p",
         "--paths",
         nargs="+",
-        help="Paths to dump conversion result as key=value pairs.",
+        help="Paths to dump conversion result as key=value pairs. "
+        "Prefix a pair with the format name to route the result of "
+        "one filter only (e.g. csv:samples=out.csv).",
     )
     return parser, sps
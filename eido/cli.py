@@ -1,19 +1,34 @@
+import atexit
 import logging
 import sys
+import time
+from itertools import islice
 
 from logmuse import init_logger
-from peppy import Project
 
-from .argparser import LEVEL_BY_VERBOSITY, build_argparser
+from .argparser import LEVEL_BY_VERBOSITY, SAMPLE_NAME_ATTR, build_argparser
 from .const import *
 from .conversion import (
+    configure_filter_index,
     convert_project,
+    convert_project_multi,
     get_available_pep_filters,
-    pep_conversion_plugins,
+    get_pep_filter,
 )
+from .debug_trace import start_debug_trace
 from .exceptions import EidoFilterError, EidoValidationError
-from .inspection import inspect_project
-from .validation import validate_config, validate_project, validate_sample
+from .instrumentation import add_span_callback, remove_span_callback, span
+from .schema_cache import (
+    configure_schema_cache,
+    get_cache_dir,
+    list_cached_schemas,
+    load_cached_schemas,
+    prune_schema_cache,
+    schema_cache_enabled,
+)
+
+# peppy, pandas and jsonschema are imported by the subcommands that need them,
+# so that the CLI starts fast
 
 
 def _parse_filter_args_str(input):
@@ -34,12 +49,40 @@ def _parse_filter_args_str(input):
     )
 
 
-def print_error_summary(errors_by_type):
-    """Print a summary of errors, organized by error type"""
+def _parse_paths(input, formats):
+    """
+    Parse the result paths, shared by all filters or routed to one of them
+
+    :param Iterable[str] input: user command line input, formatted as
+        key=path, or format:key=path for the results of a single filter
+    :param Iterable[str] formats: names of the requested filters
+    :return (dict | None, dict[str, dict]): paths shared by all the filters
+        and paths of every filter that has its own, by filter name
+    """
+    shared, routed = {}, {}
+    for x in input:
+        key, path = x.split("=", 1)
+        filter_name, _, result_key = key.rpartition(":")
+        if filter_name in formats:
+            routed.setdefault(filter_name, {})[result_key] = path
+        else:
+            shared[key] = path
+    by_format = {f: {**shared, **p} for f, p in routed.items()}
+    return shared or None, by_format
+
+
+def print_error_summary(errors_by_type, counts_by_type=None):
+    """
+    Print a summary of errors, organized by error type
+
+    :param dict errors_by_type: mapping of error types to lists of errors
+    :param dict counts_by_type: mapping of error types to the numbers of errors,
+        if the lists of errors are not complete
+    """
     n_error_types = len(errors_by_type)
     print(f"Found {n_error_types} types of error:")
     for type in errors_by_type:
-        n = len(errors_by_type[type])
+        n = (counts_by_type or {}).get(type, len(errors_by_type[type]))
         msg = f"  - {type}: ({n} samples) "
         if n < 50:
             msg += ", ".join([x["sample_name"] for x in errors_by_type[type]])
@@ -54,6 +97,187 @@ def print_error_summary(errors_by_type):
     return final_msg
 
 
+def _validate_stream(args):
+    """
+    Validate a PEP reading its sample table in chunks, printing errors as found
+
+    :param argparse.Namespace args: parsed command line arguments
+    :return bool: whether the validation was successful
+    """
+    from .streaming import DEFAULT_CHUNK_SIZE, iter_streamed_validation_errors
+
+    errors_by_type = {}
+    counts_by_type = {}
+    errors = iter_streamed_validation_errors(
+        args.pep,
+        args.schema,
+        chunk_size=args.chunk_size or DEFAULT_CHUNK_SIZE,
+        sample_table_index=args.st_index,
+    )
+    for error in islice(errors, args.max_errors):
+        print(error["message"])
+        n = counts_by_type.get(error["type"], 0)
+        counts_by_type[error["type"]] = n + 1
+        # the summary lists sample names only for the less frequent errors
+        if n < 50:
+            errors_by_type.setdefault(error["type"], []).append(error)
+    if errors_by_type:
+        print_error_summary(errors_by_type, counts_by_type)
+        return False
+    return True
+
+
+def _get_stream_conflicts(args):
+    """
+    Find the validate options that have no effect with --stream
+
+    :param argparse.Namespace args: parsed command line arguments
+    :return list[str]: options given along with --stream that it ignores
+    """
+    given = {
+        "--sample-name": args.sample_name is not None,
+        "--just-config": args.just_config,
+        "--amendments": bool(args.amendments),
+        "--sst-index": args.sst_index != SAMPLE_NAME_ATTR,
+    }
+    return [option for option, is_given in given.items() if is_given]
+
+
+def _validate(args):
+    """
+    Validate the PEP given on the command line, printing the errors found
+
+    :param argparse.Namespace args: parsed command line arguments
+    :return bool: whether the validation was successful
+    """
+    if args.stream:
+        _LOGGER.debug(f"Streaming the sample table of: {args.pep}")
+        if not _validate_stream(args):
+            return False
+        _LOGGER.info("Validation successful")
+        return True
+
+    from .validation import validate_config, validate_project, validate_sample
+
+    _LOGGER.debug(f"Creating a Project object from: {args.pep}")
+    p = _load_project(args)
+    if args.sample_name:
+        try:
+            args.sample_name = int(args.sample_name)
+        except ValueError:
+            pass
+        _LOGGER.debug(
+            f"Comparing Sample ('{args.pep}') in Project ('{args.pep}') "
+            f"against a schema: {args.schema}"
+        )
+        validator = validate_sample
+        arguments = [p, args.sample_name, args.schema]
+        kwargs = {}
+    elif args.just_config:
+        _LOGGER.debug(
+            f"Comparing Project ('{args.pep}') against a schema: {args.schema}"
+        )
+        validator = validate_config
+        arguments = [p, args.schema]
+        kwargs = {}
+    else:
+        _LOGGER.debug(
+            f"Comparing Project ('{args.pep}') against a schema: {args.schema}"
+        )
+        validator = validate_project
+        arguments = [p, args.schema]
+        kwargs = {
+            "workers": args.jobs,
+            "chunk_size": args.chunk_size,
+            "max_errors": args.max_errors,
+        }
+    try:
+        with span("cli.validate"):
+            validator(*arguments, **kwargs)
+    except EidoValidationError as e:
+        with span("cli.print_errors"):
+            print_error_summary(e.errors_by_type)
+        return False
+    _LOGGER.info("Validation successful")
+    return True
+
+
+def _run_cache_command(args):
+    """
+    Inspect, prune or warm the on-disk schema cache
+
+    :param argparse.Namespace args: parsed command line arguments
+    """
+    if args.action == "warm":
+        from .schema import _get_schema_location, read_schema
+
+        if not schema_cache_enabled():
+            _LOGGER.error("The schema cache is disabled, no schemas were cached")
+            sys.exit(1)
+        for schema in args.schemas:
+            read_schema(schema)
+            if load_cached_schemas(_get_schema_location(schema)) is None:
+                _LOGGER.warning(f"Schema could not be cached: {schema}")
+            else:
+                _LOGGER.info(f"Cached schema: {schema}")
+    elif args.action == "prune":
+        n = prune_schema_cache(args.max_size)
+        _LOGGER.info(f"Evicted {n} cached schemas")
+    else:
+        entries = list_cached_schemas()
+        print(f"Schema cache: {get_cache_dir()}")
+        for entry in entries:
+            last_used = time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(entry["last_used"])
+            )
+            print(f"  {entry['location']} ({entry['size']} bytes, used {last_used})")
+        total = sum(e["size"] for e in entries)
+        print(f"{len(entries)} cached schemas, {total} bytes")
+
+
+def _load_project(args):
+    """
+    Create the Project object for the PEP given on the command line
+
+    :param argparse.Namespace args: parsed command line arguments
+    :return peppy.Project: the project
+    """
+    from peppy import Project
+
+    with span("cli.load_project"):
+        return Project(
+            args.pep,
+            sample_table_index=args.st_index,
+            subsample_table_index=args.sst_index,
+            amendments=args.amendments,
+        )
+
+
+def _start_profile(print_summary=True, json_path=None):
+    """
+    Record the phases of the run and report them when the process exits
+
+    :param bool print_summary: whether to print a table of the phases to stderr
+    :param str json_path: path to write the spans to as JSON, '-' for stdout
+    """
+    from .instrumentation import SpanRecorder
+
+    recorder = SpanRecorder()
+    add_span_callback(recorder)
+
+    def _report():
+        remove_span_callback(recorder)
+        if print_summary:
+            print(recorder.format_summary(), file=sys.stderr)
+        if json_path == "-":
+            print(recorder.to_json())
+        elif json_path:
+            with open(json_path, "w") as f:
+                f.write(recorder.to_json())
+
+    atexit.register(_report)
+
+
 def main():
     """Primary workflow"""
     parser, sps = build_argparser()
@@ -79,6 +303,18 @@ def main():
     global _LOGGER
     _LOGGER = init_logger(name=PKG_NAME, **logger_kwargs)
 
+    configure_schema_cache(enabled=not args.no_cache, offline=args.offline or None)
+    configure_filter_index(enabled=not args.no_cache)
+    if args.profile or args.profile_json:
+        _start_profile(args.profile, args.profile_json)
+    if args.debug_trace:
+        # the file is closed with the other logging handlers at exit
+        start_debug_trace(args.debug_trace)
+
+    if args.command == CACHE_CMD:
+        _run_cache_command(args)
+        sys.exit(0)
+
     if args.command == CONVERT_CMD:
         filters = get_available_pep_filters()
         if args.list:
@@ -88,87 +324,76 @@ def main():
             for filter_name in filters:
                 _LOGGER.info(f" - {filter_name}")
             sys.exit(0)
-        if not "format" in args:
-            _LOGGER.info("The following arguments are required: --format")
-            sps[CONVERT_CMD].print_help(sys.stderr)
-            sys.exit(1)
+        formats = args.format or ["yaml"]
         if args.describe:
-            if args.format not in filters:
-                raise EidoFilterError(
-                    f"'{args.format}' filter not found. Available filters: {', '.join(filters)}"
-                )
-            filter_functions_by_name = pep_conversion_plugins()
-            print(filter_functions_by_name[args.format].__doc__)
+            for filter_name in formats:
+                if filter_name not in filters:
+                    raise EidoFilterError(
+                        f"'{filter_name}' filter not found. Available filters: {', '.join(filters)}"
+                    )
+                print(get_pep_filter(filter_name).__doc__)
             sys.exit(0)
         if args.pep is None:
             sps[CONVERT_CMD].print_help(sys.stderr)
             _LOGGER.info("The following arguments are required: PEP")
             sys.exit(1)
-        if args.paths:
-            paths = {y[0]: y[1] for y in [x.split("=") for x in args.paths]}
-        else:
-            paths = None
+        paths, paths_by_format = _parse_paths(args.paths or [], formats)
 
-        p = Project(
-            args.pep,
-            sample_table_index=args.st_index,
-            subsample_table_index=args.sst_index,
-            amendments=args.amendments,
-        )
+        p = _load_project(args)
         plugin_kwargs = _parse_filter_args_str(args.args)
 
         # append paths
         plugin_kwargs["paths"] = paths
+        # let the filters that support it write the output incrementally
+        plugin_kwargs["stream"] = True
 
-        convert_project(p, args.format, plugin_kwargs)
+        if len(formats) == 1:
+            if formats[0] in paths_by_format:
+                plugin_kwargs["paths"] = paths_by_format[formats[0]]
+            convert_project(p, formats[0], plugin_kwargs)
+        else:
+            conv_results = convert_project_multi(
+                p, formats, plugin_kwargs, paths=paths_by_format, workers=args.jobs
+            )
+            if args.jobs > 1:
+                # the filters did not print their results, to keep them apart
+                for filter_name in formats:
+                    for result in conv_results[filter_name].values():
+                        if isinstance(result, str):
+                            sys.stdout.write(result)
         _LOGGER.info("Conversion successful")
         sys.exit(0)
 
-    _LOGGER.debug(f"Creating a Project object from: {args.pep}")
-    if args.command == VALIDATE_CMD:
-        p = Project(
-            args.pep,
-            sample_table_index=args.st_index,
-            subsample_table_index=args.sst_index,
-            amendments=args.amendments,
-        )
-        if args.sample_name:
-            try:
-                args.sample_name = int(args.sample_name)
-            except ValueError:
-                pass
-            _LOGGER.debug(
-                f"Comparing Sample ('{args.pep}') in Project ('{args.pep}') "
-                f"against a schema: {args.schema}"
-            )
-            validator = validate_sample
-            arguments = [p, args.sample_name, args.schema]
-        elif args.just_config:
-            _LOGGER.debug(
-                f"Comparing Project ('{args.pep}') against a schema: {args.schema}"
-            )
-            validator = validate_config
-            arguments = [p, args.schema]
-        else:
-            _LOGGER.debug(
-                f"Comparing Project ('{args.pep}') against a schema: {args.schema}"
+    if args.command == VALIDATE_CMD and args.stream:
+        conflicts = _get_stream_conflicts(args)
+        if conflicts:
+            sps[VALIDATE_CMD].error(
+                f"--stream validates the sample table as is, it cannot be "
+                f"combined with: {', '.join(conflicts)}"
             )
-            validator = validate_project
-            arguments = [p, args.schema]
-        try:
-            validator(*arguments)
-        except EidoValidationError as e:
-            print_error_summary(e.errors_by_type)
+
+    if args.command == VALIDATE_CMD and args.profile_schema:
+        from .schema_profiler import SchemaProfiler
+
+        if args.jobs not in (None, 1):
+            _LOGGER.info("Profiling the schema, validating in a single process")
+            args.jobs = None
+        profiler = SchemaProfiler()
+        with profiler:
+            success = _validate(args)
+        print(profiler.format_report(limit=args.profile_schema_limit))
+        if not success:
+            return False
+        sys.exit(0)
+
+    if args.command == VALIDATE_CMD:
+        if not _validate(args):
             return False
-        _LOGGER.info("Validation successful")
         sys.exit(0)
 
     if args.command == INSPECT_CMD:
-        p = Project(
-            args.pep,
-            sample_table_index=args.st_index,
-            subsample_table_index=args.sst_index,
-            amendments=args.amendments,
-        )
+        from .inspection import inspect_project
+
+        p = _load_project(args)
         inspect_project(p, args.sample_name, args.attr_limit)
         sys.exit(0)
@@ -8,6 +8,7 @@ INSPECT_CMD = "inspect"
 VALIDATE_CMD = "validate"
 CONVERT_CMD = "convert"
 FILTERS_CMD = "filters"
+CACHE_CMD = "cache"
 SUBPARSER_MSGS = {
     VALIDATE_CMD: "Validate a PEP or its components",
     INSPECT_CMD: "Inspect a PEP",
@@ -23,6 +24,7 @@ SIZING_KEY = "sizing"
 # sample schema input validation key names, these values are required by looper
 # to refer to the dict values
 MISSING_KEY = "missing"
+MISSING_INPUTS_KEY = "missing_inputs"
 REQUIRED_INPUTS_KEY = "required_inputs"
 ALL_INPUTS_KEY = "all_inputs"
 INPUT_FILE_SIZE_KEY = "input_file_size"
@@ -35,6 +37,7 @@ GENERAL = [
     "VALIDATE_CMD",
     "CONVERT_CMD",
     "FILTERS_CMD",
+    "CACHE_CMD",
     "SUBPARSER_MSGS",
 ]
 
@@ -42,6 +45,7 @@ SCHEMA_SECTIONS = ["PROP_KEY", "TANGIBLE_KEY", "SIZING_KEY"]
 
 SCHEMA_VALIDAION_KEYS = [
     "MISSING_KEY",
+    "MISSING_INPUTS_KEY",
     "REQUIRED_INPUTS_KEY",
     "ALL_INPUTS_KEY",
     "INPUT_FILE_SIZE_KEY",
@@ -1,37 +1,180 @@
 import sys
 
 if sys.version_info < (3, 10):
-    from importlib_metadata import entry_points
+    from importlib_metadata import EntryPoint, entry_points
 else:
-    from importlib.metadata import entry_points
+    from importlib.metadata import EntryPoint, entry_points
+import hashlib
 import inspect
+import json
 from logging import getLogger
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from contextvars import ContextVar
+from itertools import chain
+from threading import RLock
+from typing import Iterable, Union
 
 from .exceptions import *
+from .instrumentation import span
+from .schema_cache import get_cache_root
 
 _LOGGER = getLogger(__name__)
 
+FILTERS_GROUP = "pep.filters"
+
+# size of the write buffer of streamed filter results
+_BUFFER_SIZE = 1024**2
+
+# entry points of the installed filters by name, found once per process
+_FILTER_ENTRY_POINTS = None
+# filter functions by name, loaded and checked on first use
+_LOADED_FILTERS = {}
+_FILTERS_LOCK = RLock()
+_FILTER_INDEX_SETTINGS = {"enabled": False}
+# context of the filter run by the current thread
+_FILTER_CONTEXT = ContextVar("eido_filter_context", default=None)
+_ENV_VAR_PATTERN = re.compile(r"\$(?:(\w+)|\{([^}]*)\})")
+
+
+def configure_filter_index(enabled: bool) -> None:
+    """
+    Enable or disable the on-disk index of installed filters
+
+    The index saves scanning the metadata of all installed distributions
+    for filters. It is rebuilt when any directory on sys.path changes,
+    e.g. when a distribution is installed or removed. The CLI enables it.
+
+    :param bool enabled: whether to use the index
+    """
+    _FILTER_INDEX_SETTINGS["enabled"] = enabled
+
+
+def clear_filter_registry() -> None:
+    """
+    Forget the found and loaded filters, e.g. after installing a new one
+    """
+    global _FILTER_ENTRY_POINTS
+    with _FILTERS_LOCK:
+        _FILTER_ENTRY_POINTS = None
+        _LOADED_FILTERS.clear()
+
+
+def _get_distributions_fingerprint():
+    """
+    Fingerprint the installed distributions by the state of sys.path
+
+    :return str: hex digest of the sys.path entries and their modification times
+    """
+    h = hashlib.sha256()
+    for path in sys.path:
+        try:
+            mtime = os.stat(path or os.curdir).st_mtime_ns
+        except OSError:
+            mtime = None
+        h.update(f"{path}\0{mtime}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _get_filter_index_path():
+    return os.path.join(get_cache_root(), "filters.json")
+
+
+def _read_filter_index(fingerprint):
+    try:
+        with open(_get_filter_index_path()) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("fingerprint") != fingerprint:
+        return None
+    return index.get("filters")
+
+
+def _write_filter_index(fingerprint, filters):
+    path = _get_filter_index_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fingerprint": fingerprint, "filters": filters}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        _LOGGER.debug("Could not write the filter index: %s", e)
+
+
+def _find_filter_entry_points():
+    """
+    Find the entry points of the installed filters without loading them
+
+    :return dict[str, EntryPoint]: entry points by filter name
+    """
+    use_index = _FILTER_INDEX_SETTINGS["enabled"]
+    if use_index:
+        fingerprint = _get_distributions_fingerprint()
+        filters = _read_filter_index(fingerprint)
+        if filters is not None:
+            _LOGGER.debug("Using the filter index")
+            return {
+                name: EntryPoint(name, value, FILTERS_GROUP)
+                for name, value in filters.items()
+            }
+    eps = {ep.name: ep for ep in entry_points(group=FILTERS_GROUP)}
+    if use_index:
+        _write_filter_index(fingerprint, {name: ep.value for name, ep in eps.items()})
+    return eps
+
+
+def _get_filter_entry_points():
+    global _FILTER_ENTRY_POINTS
+    with _FILTERS_LOCK:
+        if _FILTER_ENTRY_POINTS is None:
+            _FILTER_ENTRY_POINTS = _find_filter_entry_points()
+        return _FILTER_ENTRY_POINTS
+
+
+def get_pep_filter(filter_name):
+    """
+    Get a filter function, loading only this filter on first use
+
+    :param str filter_name: name of the filter
+    :return function(peppy.Project, **kwargs): filter function
+    :raise EidoFilterError: if the filter is not installed or has an invalid
+        signature
+    """
+    with _FILTERS_LOCK:
+        if filter_name in _LOADED_FILTERS:
+            return _LOADED_FILTERS[filter_name]
+        eps = _get_filter_entry_points()
+        if filter_name not in eps:
+            raise EidoFilterError(
+                f"Requested filter ({filter_name}) not found. "
+                f"Available: {', '.join(eps)}"
+            )
+        plugin_fun = eps[filter_name].load()
+        if len(list(inspect.signature(plugin_fun).parameters)) != 2:
+            raise EidoFilterError(
+                f"Invalid filter plugin signature: {filter_name}. "
+                f"Filter functions must take 2 arguments: peppy.Project and **kwargs"
+            )
+        _LOADED_FILTERS[filter_name] = plugin_fun
+        return plugin_fun
+
 
 def pep_conversion_plugins():
     """
     Plugins registered by entry points in the current Python env
 
+    This loads every installed filter, use get_pep_filter to load just one.
+
     :return dict[dict[function(peppy.Project)]]: dict which keys
         are names of all possible hooks and values are dicts mapping
         registered functions names to their values
     :raise EidoFilterError: if any of the filters has an invalid signature.
     """
-    plugins = {}
-    for ep in entry_points(group="pep.filters"):
-        plugin_fun = ep.load()
-        if len(list(inspect.signature(plugin_fun).parameters)) != 2:
-            raise EidoFilterError(
-                f"Invalid filter plugin signature: {ep.name}. "
-                f"Filter functions must take 2 arguments: peppy.Project and **kwargs"
-            )
-        plugins[ep.name] = plugin_fun
-    return plugins
+    return {name: get_pep_filter(name) for name in _get_filter_entry_points()}
 
 
 def convert_project(prj, target_format, plugin_kwargs=None):
@@ -46,68 +189,277 @@ def convert_project(prj, target_format, plugin_kwargs=None):
     return run_filter(prj, target_format, plugin_kwargs=plugin_kwargs or dict())
 
 
+def convert_project_multi(
+    prj, target_formats, plugin_kwargs=None, paths=None, workers=1
+):
+    """
+    Convert a `peppy.Project` object to several formats
+
+    The project is loaded once and all the filters run on it, one after
+    another or in parallel threads. Filter results are printed only when the
+    filters run one after another, so that the outputs are not interleaved;
+    in parallel the results without a path are returned instead.
+
+    :param peppy.Project prj: a Project object to convert
+    :param Iterable[str] target_formats: the formats to convert the Project
+        object to
+    :param dict plugin_kwargs: kwargs to pass to all the plugin functions
+    :param dict[str, dict[str, str]] paths: paths to save the results of every
+        filter to, by filter name. Overrides the 'paths' of plugin_kwargs
+    :param int workers: number of filters to run at the same time
+    :return dict[str, dict]: results of every filter, by filter name
+    :raise EidoFilterError: if any of the requested filters is not defined,
+        or if filters run in parallel would write to the same path
+    """
+    plugin_kwargs = plugin_kwargs or dict()
+    paths = paths or dict()
+    target_formats = list(dict.fromkeys(target_formats))
+    # fail before any filter runs if one of them is not available
+    for target_format in target_formats:
+        get_pep_filter(target_format)
+    parallel = workers > 1 and len(target_formats) > 1
+    if parallel:
+        _check_distinct_paths(
+            {f: paths.get(f, plugin_kwargs.get("paths")) for f in target_formats}
+        )
+
+    def _convert(target_format):
+        filter_kwargs = dict(plugin_kwargs)
+        if target_format in paths:
+            filter_kwargs["paths"] = paths[target_format]
+        return run_filter(
+            prj,
+            target_format,
+            verbose=not parallel,
+            plugin_kwargs=filter_kwargs,
+        )
+
+    if not parallel:
+        return {f: _convert(f) for f in target_formats}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(target_formats, executor.map(_convert, target_formats)))
+
+
+def _check_distinct_paths(paths_by_format):
+    """
+    Make sure that no two filters write their results to the same file
+
+    :param dict[str, dict[str, str] | None] paths_by_format: paths to save the
+        results of every filter to, by filter name
+    :raise EidoFilterError: if a path is used by more than one filter
+    """
+    owners = {}
+    for target_format, paths in paths_by_format.items():
+        for path in set(os.path.abspath(p) for p in (paths or {}).values()):
+            if path in owners:
+                raise EidoFilterError(
+                    f"Filters '{owners[path]}' and '{target_format}' would both "
+                    f"write to: {path}. Prefix the paths with the format name, "
+                    f"e.g. {target_format}:samples=..."
+                )
+            owners[path] = target_format
+
+
+class FilterContext:
+    """
+    Scoped execution context of a filter run
+
+    Filters get the environment and result paths of their run from here,
+    rather than from process-wide state, so that several filters can run
+    at the same time in different threads.
+
+    :param dict[str, str] env: environment variables of the run, they take
+        precedence over the process environment
+    :param dict[str, str] paths: paths to save the filter results to
+    """
+
+    def __init__(self, env=None, paths=None):
+        self.env = dict(env or {})
+        self.paths = paths
+
+    def getenv(self, name: str, default: str = None) -> str:
+        """
+        Get the value of an environment variable in this context
+
+        :param str name: name of the variable
+        :param str default: value to return if the variable is not set
+        :return str: value of the variable
+        """
+        if name in self.env:
+            return self.env[name]
+        return os.environ.get(name, default)
+
+    def expandvars(self, value: str) -> str:
+        """
+        Expand the environment variables in a string, like os.path.expandvars
+
+        :param str value: string with $NAME or ${NAME} references
+        :return str: the string with the variables set in this context expanded
+        """
+
+        def _expand(match):
+            name = match.group(1) or match.group(2)
+            return self.getenv(name, match.group(0))
+
+        return _ENV_VAR_PATTERN.sub(_expand, value)
+
+
+def get_filter_context() -> FilterContext:
+    """
+    Get the context of the filter run by the current thread
+
+    Outside of a filter run, the context holds the process environment only.
+
+    :return FilterContext: the context of the current filter run
+    """
+    return _FILTER_CONTEXT.get() or FilterContext()
+
+
 def run_filter(prj, filter_name, verbose=True, plugin_kwargs=None):
     """
     Run a selected filter on a peppy.Project object
 
+    A filter returns a mapping of result names to either strings, bytes or
+    iterables of string or bytes chunks. Chunks are streamed to the result
+    path and to stdout, without building the whole output in memory.
+    Binary results are written to the result paths only.
+
+    The 'env' and 'paths' of plugin_kwargs are passed to the filter and are
+    available to it from get_filter_context() for the duration of the run;
+    the process environment is left untouched, so filters can be run
+    concurrently from several threads.
+
     :param peppy.Project prj: a Project to run filter on
     :param str filter_name: name of the filter to run
     :param dict plugin_kwargs: kwargs to pass to the plugin function
+    :return dict[str, str | bytes | None]: results of the filter. Streamed results
+        are None, as they are consumed while written; streamed results that
+        were neither written nor printed are joined into strings
     :raise EidoFilterError: if the requested filter is not defined
     """
     # convert to empty dictionary if no plugin_kwargs are passed
     plugin_kwargs = plugin_kwargs or dict()
 
     # get necessary objects
-    installed_plugins = pep_conversion_plugins()
-    installed_plugin_names = list(installed_plugins.keys())
     paths = plugin_kwargs.get("paths")
-    env = plugin_kwargs.get("env")
-
-    # set environment
-    if env is not None:
-        for var in env:
-            os.environ[var] = env[var]
+    context = FilterContext(env=plugin_kwargs.get("env"), paths=paths)
 
     # check for valid filter
-    if filter_name not in installed_plugin_names:
-        raise EidoFilterError(
-            f"Requested filter ({filter_name}) not found. "
-            f"Available: {', '.join(installed_plugin_names)}"
-        )
+    func = get_pep_filter(filter_name)
     _LOGGER.info(f"Running plugin {filter_name}")
-    func = installed_plugins[filter_name]
 
-    # run filter
-    conv_result = func(prj, **plugin_kwargs)
+    # the context is scoped to this run, streamed results are consumed in it
+    token = _FILTER_CONTEXT.set(context)
+    try:
+        with span("conversion.run_filter", filter=filter_name):
+            return _run_filter(prj, func, plugin_kwargs, paths, verbose)
+    finally:
+        _FILTER_CONTEXT.reset(token)
+
+
+def _run_filter(prj, func, plugin_kwargs, paths, verbose):
+    # run filter; streamed results are produced while they are written
+    with span("conversion.filter"):
+        conv_result = func(prj, **plugin_kwargs)
+
+    for result_key, result in conv_result.items():
+        with span("conversion.write", result=result_key):
+            conv_result[result_key] = _write_result(result_key, result, paths, verbose)
+
+    return conv_result
+
+
+def _write_result(result_key, result, paths=None, verbose=True):
+    """
+    Write a filter result to its path and/or stdout
 
-    # if paths supplied, write to disk
+    :param str result_key: name of the result
+    :param str | bytes | Iterable[str | bytes] result: result, or chunks of it
+    :param dict[str, str] paths: paths to save the filter results to
+    :param bool verbose: whether to print the result
+    :return str | bytes | None: the result, None if it was streamed
+    """
+    result_path = None
+    # if paths supplied, map conversion result to the specified path
     if paths is not None:
-        # map conversion result to the
-        # specified path
-        for result_key in conv_result:
-            result_path = paths.get(result_key)
-            if result_path is None:
-                _LOGGER.warning(
-                    f"Conversion plugin returned key that doesn't exist in specified paths: '{result_key}'."
+        result_path = paths.get(result_key)
+        if result_path is None:
+            _LOGGER.warning(
+                f"Conversion plugin returned key that doesn't exist in specified paths: '{result_key}'."
+            )
+        else:
+            # create path if it doesn't exist
+            if not os.path.exists(result_path) and os.path.isdir(
+                os.path.dirname(result_path)
+            ):
+                os.makedirs(os.path.dirname(result_path), exist_ok=True)
+    if isinstance(result, (str, bytes)):
+        if result_path is not None:
+            save_result(result_path, result)
+        if verbose and isinstance(result, str):
+            sys.stdout.write(result)
+        elif verbose and result_path is None:
+            _LOGGER.warning(
+                f"Binary result '{result_key}' is not printed, specify a path for it."
+            )
+        return result
+    binary, chunks = _peek_chunk_type(result)
+    # binary results are never printed
+    echo = verbose and not binary
+    if result_path is None and not echo:
+        return (b"" if binary else "").join(chunks)
+    _stream_result(chunks, result_path, echo=echo)
+    return None
+
+
+def _peek_chunk_type(chunks):
+    """
+    Check whether a stream of result chunks is binary, without consuming it
+
+    :param Iterable[str | bytes] chunks: chunks of a result
+    :return (bool, Iterable[str | bytes]): whether the chunks are bytes and
+        all the chunks
+    """
+    chunks = iter(chunks)
+    for first in chunks:
+        return isinstance(first, bytes), chain([first], chunks)
+    return False, iter(())
+
+
+def _stream_result(chunks, result_path=None, echo=False):
+    """
+    Write chunks of a filter result to a file and/or stdout as they come
+
+    :param Iterable[str | bytes] chunks: chunks of the result
+    :param str result_path: path to the file to write the result to
+    :param bool echo: whether to write the result to stdout too
+    """
+    binary, chunks = _peek_chunk_type(chunks)
+    with ExitStack() as stack:
+        outputs = [sys.stdout.buffer if binary else sys.stdout] if echo else []
+        if result_path is not None:
+            outputs.append(
+                stack.enter_context(
+                    open(result_path, "wb" if binary else "w", buffering=_BUFFER_SIZE)
                 )
-            else:
-                # create path if it doesn't exist
-                if not os.path.exists(result_path) and os.path.isdir(
-                    os.path.dirname(result_path)
-                ):
-                    os.makedirs(os.path.dirname(result_path), exist_ok=True)
-                save_result(result_path, conv_result[result_key])
-
-    if verbose:
-        for result_key in conv_result:
-            sys.stdout.write(conv_result[result_key])
+            )
+        for chunk in chunks:
+            for output in outputs:
+                output.write(chunk)
 
-    return conv_result
 
+def save_result(
+    result_path: str, content: Union[str, bytes, Iterable[Union[str, bytes]]]
+) -> None:
+    """
+    Save a filter result to a file
 
-def save_result(result_path: str, content: str) -> None:
-    with open(result_path, "w") as f:
+    :param str result_path: path to the file to write the result to
+    :param str | bytes | Iterable[str | bytes] content: result, or chunks of it
+    """
+    if not isinstance(content, (str, bytes)):
+        return _stream_result(content, result_path)
+    with open(result_path, "wb" if isinstance(content, bytes) else "w") as f:
         f.write(content)
 
 
@@ -115,6 +467,9 @@ def get_available_pep_filters():
     """
     Get a list of available target formats
 
+    Filters are found from the installed distributions metadata,
+    none of them is loaded.
+
     :return List[str]: a list of available formats
     """
-    return list(pep_conversion_plugins().keys())
+    return list(_get_filter_entry_points())
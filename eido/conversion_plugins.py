@@ -1,7 +1,18 @@
 """built-in PEP filters"""
 
-from typing import Dict
-from .output_formatters import MultilineOutputFormatter
+from typing import Dict, Iterable, Union
+
+from .exceptions import EidoFilterError
+from .output_formatters import (
+    MultilineOutputFormatter,
+    SampleSubsampleOutputFormatter,
+    _fit_to_length,
+)
+
+# number of samples serialized to YAML at a time
+_YAML_CHUNK_SAMPLES = 100
+# number of samples serialized to JSON lines at a time
+_JSONL_CHUNK_SAMPLES = 1000
 
 
 def basic_pep_filter(p, **kwargs) -> Dict[str, str]:
@@ -15,21 +26,19 @@ def basic_pep_filter(p, **kwargs) -> Dict[str, str]:
     return {"project": str(p)}
 
 
-def yaml_samples_pep_filter(p, **kwargs) -> Dict[str, str]:
+def yaml_samples_pep_filter(p, **kwargs) -> Dict[str, Union[str, Iterable[str]]]:
     """
     YAML samples PEP filter, that returns only Sample object representations.
 
     This filter can save the YAML to file, if kwargs include `path`.
+    With `stream` in kwargs, the YAML is returned in chunks of samples.
 
     :param peppy.Project p: a Project to run filter on
     """
-    from yaml import dump
-
-    samples_yaml = []
-    for s in p.samples:
-        samples_yaml.append(s.to_dict())
-
-    return {"samples": dump(samples_yaml, default_flow_style=False)}
+    chunks = _iter_yaml_samples(p.samples)
+    if kwargs.get("stream"):
+        return {"samples": chunks}
+    return {"samples": "".join(chunks)}
 
 
 def yaml_pep_filter(p, **kwargs) -> Dict[str, str]:
@@ -42,10 +51,54 @@ def yaml_pep_filter(p, **kwargs) -> Dict[str, str]:
     """
     from yaml import dump
 
-    return {"project": dump(p.config, default_flow_style=False)}
+    return {
+        "project": dump(p.config, Dumper=_get_yaml_dumper(), default_flow_style=False)
+    }
+
+
+def _get_yaml_dumper():
+    """
+    Get the libyaml based YAML dumper, or the pure Python one without libyaml
 
+    Both produce the same output, the libyaml one many times faster.
 
-def csv_pep_filter(p, **kwargs) -> Dict[str, str]:
+    :return type[yaml.Dumper]: YAML dumper class
+    """
+    try:
+        from yaml import CDumper as Dumper
+    except ImportError:
+        from yaml import Dumper
+    return Dumper
+
+
+def _iter_yaml_samples(samples, chunk_size: int = None) -> Iterable[str]:
+    """
+    Serialize samples to a YAML list, a few samples at a time
+
+    The items of a block sequence are independent of each other, so the
+    chunks add up to the same YAML as dumping the whole list at once.
+
+    :param Iterable[peppy.Sample] samples: samples to serialize
+    :param int chunk_size: number of samples in a chunk,
+        _YAML_CHUNK_SAMPLES by default
+    :return Iterable[str]: chunks of the YAML
+    """
+    from yaml import dump
+
+    chunk_size = chunk_size or _YAML_CHUNK_SAMPLES
+    dumper = _get_yaml_dumper()
+    chunk = []
+    empty = True
+    for sample in samples:
+        chunk.append(sample.to_dict())
+        if len(chunk) == chunk_size:
+            yield dump(chunk, Dumper=dumper, default_flow_style=False)
+            chunk, empty = [], False
+    if chunk or empty:
+        yield dump(chunk, Dumper=dumper, default_flow_style=False)
+
+
+def csv_pep_filter(p, **kwargs) -> Dict[str, Union[str, Iterable[str]]]:
     """
     CSV PEP filter, that returns Sample object representations
 
@@ -53,32 +106,297 @@ def csv_pep_filter(p, **kwargs) -> Dict[str, str]:
     `sample_table_path` and/or `subsample_table_path`.
 
     :param peppy.Project p: a Project to run filter on
+    :param bool stream: return the CSV as an iterable of lines
     """
+    if kwargs.get("stream"):
+        return {"samples": MultilineOutputFormatter.iter_format(p.samples)}
     return {"samples": MultilineOutputFormatter.format(p.samples)}
 
 
-def processed_pep_filter(p, **kwargs) -> Dict[str, str]:
+def jsonl_pep_filter(p, **kwargs) -> Dict[str, Union[str, bytes, Iterable]]:
+    """
+    JSON lines PEP filter, that returns one JSON object per sample
+
+    The samples are serialized as they are written, so consumers can read
+    the first samples while the next ones are produced.
+
+    This filter can save the JSON lines to file, if kwargs include `paths`
+    with a `samples` key.
+
+    :param peppy.Project p: a Project to run filter on
+    :param str subsamples: 'inline' to keep the attributes merged from
+        subsample tables as lists (default), 'expand' to write one object
+        per subsample instead, with the other attributes repeated
+    :param str compression: 'gzip' to compress the output
+    :param bool stream: return the output as an iterable of chunks
+    """
+    subsamples = kwargs.get("subsamples", "inline")
+    if subsamples not in ("inline", "expand"):
+        raise EidoFilterError(
+            f"Invalid subsamples option: {subsamples}. Use 'inline' or 'expand'."
+        )
+    compression = kwargs.get("compression")
+    if compression not in (None, "gzip"):
+        raise EidoFilterError(
+            f"Unsupported compression for the jsonl filter: {compression}"
+        )
+    chunks = _iter_json_lines(p.samples, expand=subsamples == "expand")
+    if compression == "gzip":
+        chunks = _iter_gzip(chunks)
+    if kwargs.get("stream"):
+        return {"samples": chunks}
+    return {"samples": (b"" if compression else "").join(chunks)}
+
+
+def _iter_json_lines(
+    samples, expand: bool = False, chunk_size: int = None
+) -> Iterable[str]:
+    """
+    Serialize samples to JSON lines, a few samples at a time
+
+    :param Iterable[peppy.Sample] samples: samples to serialize
+    :param bool expand: write one line per subsample of the samples with
+        attributes merged from subsample tables
+    :param int chunk_size: number of samples in a chunk,
+        _JSONL_CHUNK_SAMPLES by default
+    :return Iterable[str]: chunks of the JSON lines
+    """
+    import json
+
+    chunk_size = chunk_size or _JSONL_CHUNK_SAMPLES
+    lines = []
+    for sample in samples:
+        record = sample.to_dict()
+        records = _expand_record(record) if expand else [record]
+        lines.extend(json.dumps(r, default=str) + "\n" for r in records)
+        if len(lines) >= chunk_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def _expand_record(record: Dict) -> list:
+    """
+    Expand a sample to one record per value of its multi-value attributes
+
+    Like the CSV filter, the number of records is the length of the first
+    list attribute and the single values are repeated on every record.
+
+    :param dict record: sample attributes
+    :return list[dict]: records of the sample
+    """
+    n = next((len(v) for v in record.values() if isinstance(v, list)), None)
+    if n is None:
+        return [record]
+    columns = {k: _fit_to_length(v, n) for k, v in record.items()}
+    return [{k: v[i] for k, v in columns.items()} for i in range(n)]
+
+
+def _iter_gzip(chunks: Iterable[str]) -> Iterable[bytes]:
+    """
+    Compress text chunks to a gzip stream, chunk by chunk
+
+    Every chunk is flushed, so that readers can decompress all the chunks
+    written so far.
+
+    :param Iterable[str] chunks: chunks of text
+    :return Iterable[bytes]: chunks of the gzip stream
+    """
+    import zlib
+
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode("utf-8")) + compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+    yield compressor.flush()
+
+
+def processed_pep_filter(p, **kwargs) -> Dict[str, Union[str, Iterable[str]]]:
     """
     Processed PEP filter, that returns the converted sample and subsample tables.
     This filter can return the tables as a table or a document.
+    The subsample tables are written with their rows grouped by sample.
     :param peppy.Project p: a Project to run filter on
     :param bool samples_as_objects: Flag to write as a table
     :param bool subsamples_as_objects: Flag to write as a table
+    :param bool stream: return the tables as iterables of lines
     """
     # get params
     samples_as_objects = kwargs.get("samples_as_objects")
     subsamples_as_objects = kwargs.get("subsamples_as_objects")
 
     prj_repr = p.config
+    # the subsample tables refer to the samples by the sample table index
+    tables = SampleSubsampleOutputFormatter.iter_format(
+        p.sample_table, p.subsample_table, sample_key=p.st_index
+    )
+    if not kwargs.get("stream"):
+        tables = {name: "".join(chunks) for name, chunks in tables.items()}
 
-    return {
+    result = {
         "project": str(prj_repr),
-        "samples": (
-            str(p.samples) if samples_as_objects else str(p.sample_table.to_csv())
-        ),
-        "subsamples": (
-            str(p.subsamples)
-            if subsamples_as_objects
-            else str(p.subsample_table.to_csv())
-        ),
+        "samples": str(p.samples) if samples_as_objects else tables.pop("samples"),
     }
+    if subsamples_as_objects:
+        result["subsamples"] = str(p.subsamples)
+    else:
+        result.update({k: v for k, v in tables.items() if k != "samples"})
+    return result
+
+
+def _get_processed_tables(p) -> Dict:
+    """
+    Get the processed sample and subsample tables of a project by result name
+
+    :param peppy.Project p: a Project to get the tables of
+    :return dict[str, pandas.DataFrame]: tables by result name: 'samples',
+        'subsamples' or 'subsamples_1', 'subsamples_2'... if there are many
+    """
+    tables = {"samples": p.sample_table}
+    subsample_tables = p.subsample_table
+    if subsample_tables is None:
+        return tables
+    if not isinstance(subsample_tables, list):
+        tables["subsamples"] = subsample_tables
+        return tables
+    for i, table in enumerate(subsample_tables, 1):
+        tables[f"subsamples_{i}"] = table
+    return tables
+
+
+def _to_arrow_table(table):
+    """
+    Convert a table to Arrow, as list columns where any cell holds a list
+
+    Attributes merged from subsample tables hold lists for some samples only,
+    the single values of the other samples become one-element lists. Columns
+    mixing values of different types are converted to strings.
+
+    :param pandas.DataFrame table: table to convert
+    :return pyarrow.Table: converted table
+    """
+    import pyarrow as pa
+
+    table = table.copy()
+    for c in table.columns:
+        column = table[c]
+        if column.dtype != object:
+            continue
+        is_list = column.map(lambda v: isinstance(v, list))
+        values = [
+            x
+            for v in column
+            for x in (v if isinstance(v, list) else [v])
+            if not _is_missing(x)
+        ]
+        # values of different types, e.g. from derived or implied attributes,
+        # are written as text, like in the CSV output
+        types = {type(x) for x in values}
+        if len(types) > 1 and not types <= {int, float}:
+            column = column.map(
+                lambda v: (
+                    [None if _is_missing(x) else str(x) for x in v]
+                    if isinstance(v, list)
+                    else (None if _is_missing(v) else str(v))
+                )
+            )
+        if is_list.any():
+            column = [
+                v if isinstance(v, list) else (None if _is_missing(v) else [v])
+                for v in column
+            ]
+        table[c] = column
+    return pa.Table.from_pandas(table, preserve_index=False)
+
+
+def _is_missing(value) -> bool:
+    import pandas as pd
+
+    return not isinstance(value, list) and pd.isna(value)
+
+
+def _arrow_pep_filter(p, file_format: str, compression: str) -> Dict[str, bytes]:
+    """
+    Write the processed sample and subsample tables in an Arrow-based format
+
+    :param peppy.Project p: a Project to run filter on
+    :param str file_format: 'parquet', 'arrow' (IPC file) or 'feather'
+    :param str compression: compression codec, 'none' for no compression
+    :return dict[str, bytes]: files by result name
+    """
+    try:
+        import pyarrow as pa
+        from pyarrow import feather, parquet
+    except ImportError:
+        raise EidoFilterError(
+            f"The {file_format} filter requires pyarrow: pip install eido[arrow]"
+        )
+    if compression in (None, "none", "uncompressed"):
+        compression = None
+
+    results = {}
+    for name, table in _get_processed_tables(p).items():
+        sink = pa.BufferOutputStream()
+        try:
+            arrow_table = _to_arrow_table(table)
+            if file_format == "parquet":
+                parquet.write_table(
+                    arrow_table, sink, compression=compression or "none"
+                )
+            elif file_format == "feather":
+                feather.write_feather(
+                    arrow_table, sink, compression=compression or "uncompressed"
+                )
+            else:
+                options = pa.ipc.IpcWriteOptions(compression=compression)
+                with pa.ipc.new_file(sink, arrow_table.schema, options=options) as w:
+                    w.write_table(arrow_table)
+        except (ValueError, pa.ArrowException) as e:
+            raise EidoFilterError(f"Could not write {file_format} '{name}': {e}")
+        results[name] = sink.getvalue().to_pybytes()
+    return results
+
+
+def parquet_pep_filter(p, **kwargs) -> Dict[str, bytes]:
+    """
+    Parquet PEP filter, that returns the processed sample and subsample tables
+    as Parquet files. Requires pyarrow.
+
+    This filter can save the tables to files, if kwargs include `paths`
+    for 'samples' and 'subsamples'.
+
+    :param peppy.Project p: a Project to run filter on
+    :param str compression: compression codec: snappy (default), zstd, gzip,
+        brotli, lz4 or none
+    """
+    return _arrow_pep_filter(p, "parquet", kwargs.get("compression", "snappy"))
+
+
+def arrow_pep_filter(p, **kwargs) -> Dict[str, bytes]:
+    """
+    Arrow PEP filter, that returns the processed sample and subsample tables
+    as Arrow IPC files, which can be memory-mapped. Requires pyarrow.
+
+    This filter can save the tables to files, if kwargs include `paths`
+    for 'samples' and 'subsamples'.
+
+    :param peppy.Project p: a Project to run filter on
+    :param str compression: compression codec: none (default), lz4 or zstd
+    """
+    return _arrow_pep_filter(p, "arrow", kwargs.get("compression"))
+
+
+def feather_pep_filter(p, **kwargs) -> Dict[str, bytes]:
+    """
+    Feather PEP filter, that returns the processed sample and subsample tables
+    as Feather files. Requires pyarrow.
+
+    This filter can save the tables to files, if kwargs include `paths`
+    for 'samples' and 'subsamples'.
+
+    :param peppy.Project p: a Project to run filter on
+    :param str compression: compression codec: lz4 (default), zstd or none
+    """
+    return _arrow_pep_filter(p, "feather", kwargs.get("compression", "lz4"))
@@ -0,0 +1,81 @@
+"""
+Structured trace of the objects and schemas eido works on, for debugging
+
+The payloads, e.g. whole project dicts, are too large for the console log, so
+they are written as JSON lines to a file, one record per event:
+
+    handler = start_debug_trace("trace.jsonl")
+    validate_project(project, schema)
+    stop_debug_trace(handler)
+
+The records go through the 'eido.trace' logger, which does not propagate to
+the eido one and is enabled at the debug level only while a trace is written.
+Otherwise `trace_event` returns after a level check, before anything is
+serialized.
+"""
+
+import json
+import logging
+from logging import getLogger
+from typing import Any
+
+_TRACE_LOGGER = getLogger("eido.trace")
+_TRACE_LOGGER.propagate = False
+# the trace is off until a file is given, whatever the level of the eido logger
+_TRACE_LOGGER.setLevel(logging.INFO)
+
+
+class _JsonLinesFormatter(logging.Formatter):
+    """
+    Format trace records as JSON objects with the event, time and payload
+    """
+
+    def format(self, record):
+        return json.dumps(
+            {
+                "time": record.created,
+                "thread": record.threadName,
+                "event": record.getMessage(),
+                **getattr(record, "payload", {}),
+            },
+            default=str,
+        )
+
+
+def trace_event(event: str, **payload: Any) -> None:
+    """
+    Write an event to the debug trace, if one was started
+
+    :param str event: name of the event, e.g. 'validation.object'
+    :param payload: JSON serializable details of the event, other objects
+        are written as strings
+    """
+    if _TRACE_LOGGER.isEnabledFor(logging.DEBUG):
+        _TRACE_LOGGER.debug(event, extra={"payload": payload})
+
+
+def start_debug_trace(path: str) -> logging.Handler:
+    """
+    Write the debug trace events to a file, as JSON lines
+
+    :param str path: path to the file, it is overwritten
+    :return logging.Handler: handler writing the file, to pass to
+        stop_debug_trace
+    """
+    handler = logging.FileHandler(path, mode="w", encoding="utf-8")
+    handler.setFormatter(_JsonLinesFormatter())
+    _TRACE_LOGGER.addHandler(handler)
+    _TRACE_LOGGER.setLevel(logging.DEBUG)
+    return handler
+
+
+def stop_debug_trace(handler: logging.Handler) -> None:
+    """
+    Stop writing the debug trace to a file and close it
+
+    :param logging.Handler handler: handler returned by start_debug_trace
+    """
+    _TRACE_LOGGER.removeHandler(handler)
+    handler.close()
+    if not _TRACE_LOGGER.handlers:
+        _TRACE_LOGGER.setLevel(logging.INFO)
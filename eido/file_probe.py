@@ -0,0 +1,221 @@
+"""
+Concurrent, de-duplicated probing of sample input files
+
+Every path is checked once per run, however many samples refer to it, and the
+checks run in a bounded thread pool. Directories holding many of the probed
+paths are listed once with os.scandir instead of checking the paths one by one,
+which saves a lookup per path, and most notably per missing path,
+on network filesystems.
+"""
+
+import os
+import stat
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from threading import Lock
+from typing import Iterable
+
+from ubiquerg import size
+
+_LOGGER = getLogger(__name__)
+
+DEFAULT_PROBE_WORKERS = 16
+
+# number of probed paths in a directory from which the directory is listed
+DEFAULT_INDEX_THRESHOLD = 32
+
+# number of paths checked one by one in a single thread pool task
+_BATCH_SIZE = 256
+
+# total sizes of directories by path and modification time, shared by all runs
+_DIRECTORY_SIZES = {}
+_DIRECTORY_SIZES_LOCK = Lock()
+
+
+def _exists(path):
+    try:
+        return os.path.exists(path)
+    except (TypeError, ValueError):
+        return False
+
+
+def _check_paths(paths):
+    return {p: _exists(p) for p in paths}
+
+
+def _fold_name(name):
+    return unicodedata.normalize("NFC", name).casefold()
+
+
+def _check_paths_in_directory(directory, paths):
+    """
+    Check the existence of paths in a directory by listing it once
+
+    :param str directory: directory to list
+    :param Iterable[str] paths: paths to check, all in the directory
+    :return dict[str, bool]: existence of every path
+    """
+    try:
+        with os.scandir(directory or os.curdir) as it:
+            entries = {e.name: e for e in it}
+    except OSError:
+        return _check_paths(paths)
+    # names as a case-insensitive filesystem may match them
+    folded = {_fold_name(name) for name in entries}
+    found = {}
+    for p in paths:
+        name = os.path.basename(p)
+        entry = entries.get(name)
+        if entry is not None and not entry.is_symlink():
+            found[p] = True
+        elif entry is not None or name in ("", ".", "..") or _fold_name(name) in folded:
+            # symlinks may be dangling, trailing slashes and dot components
+            # have no listed name, and the filesystem may ignore the case
+            found[p] = _exists(p)
+        else:
+            found[p] = False
+    return found
+
+
+class StatCache:
+    """
+    Per-run cache of file existence checks and file sizes
+
+    :param int workers: maximum number of threads to probe paths with
+    :param int index_threshold: number of probed paths in a directory from
+        which the directory is listed with os.scandir instead of checking
+        the paths one by one
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_PROBE_WORKERS,
+        index_threshold: int = DEFAULT_INDEX_THRESHOLD,
+    ):
+        self.workers = workers
+        self.index_threshold = index_threshold
+        self._exists = {}
+        self._stats = {}
+        self._lock = Lock()
+
+    def probe(self, paths: Iterable[str]) -> None:
+        """
+        Check the existence of paths, every unique one only once
+
+        :param Iterable[str] paths: paths to check
+        """
+        with self._lock:
+            todo = {p for p in paths if p not in self._exists}
+        if not todo:
+            return
+        by_directory = defaultdict(list)
+        for p in todo:
+            by_directory[os.path.dirname(p) if isinstance(p, str) else None].append(p)
+        listed, single = [], []
+        for directory, dir_paths in by_directory.items():
+            if directory is not None and len(dir_paths) >= self.index_threshold:
+                listed.append((directory, dir_paths))
+            else:
+                single.extend(dir_paths)
+        batches = [
+            single[i : i + _BATCH_SIZE] for i in range(0, len(single), _BATCH_SIZE)
+        ]
+        _LOGGER.debug(
+            f"Probing {len(todo)} paths: {len(listed)} directories listed, "
+            f"{len(single)} paths checked one by one"
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(_check_paths_in_directory, directory, dir_paths)
+                for directory, dir_paths in listed
+            ] + [executor.submit(_check_paths, batch) for batch in batches]
+            for future in futures:
+                found = future.result()
+                with self._lock:
+                    self._exists.update(found)
+
+    def exists(self, path: str) -> bool:
+        """
+        Check whether a path exists, probing it if it was not probed yet
+
+        :param str path: path to check
+        :return bool: whether the path exists
+        """
+        if path not in self._exists:
+            self.probe([path])
+        return self._exists[path]
+
+    def missing(self, paths: Iterable[str]) -> list:
+        """
+        Get the paths that do not exist
+
+        :param Iterable[str] paths: paths to check
+        :return list[str]: paths that do not exist, in the order given
+        """
+        paths = list(paths)
+        self.probe(paths)
+        return [p for p in paths if not self._exists[p]]
+
+    def stat(self, path: str):
+        """
+        Get the status of a path, following symlinks
+
+        :param str path: path to get the status of
+        :return os.stat_result | None: status of the path, None if it does
+            not exist
+        """
+        if path in self._stats:
+            return self._stats[path]
+        st = None
+        if self.exists(path):
+            try:
+                st = os.stat(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._stats[path] = st
+        return st
+
+    def size(self, path: str):
+        """
+        Get the size of a file or the total size of the files in a directory
+
+        Directory sizes are cached for the whole process by path and
+        modification time, so a directory is walked again only once entries
+        are added to or removed from it.
+
+        :param str path: path to the file or directory
+        :return int | None: size in bytes, None if the path does not exist
+            or is neither a file nor a directory
+        """
+        st = self.stat(path)
+        if st is None:
+            return None
+        if stat.S_ISREG(st.st_mode):
+            return st.st_size
+        if not stat.S_ISDIR(st.st_mode):
+            return None
+        key = (path, st.st_mtime_ns)
+        with _DIRECTORY_SIZES_LOCK:
+            if key in _DIRECTORY_SIZES:
+                return _DIRECTORY_SIZES[key]
+        s = size(path, size_str=False)
+        with _DIRECTORY_SIZES_LOCK:
+            _DIRECTORY_SIZES[key] = s
+        return s
+
+    def sizes(self, paths: Iterable[str]) -> dict:
+        """
+        Get the sizes of files and directories, concurrently
+
+        :param Iterable[str] paths: paths to the files or directories
+        :return dict[str, int | None]: size in bytes of every unique path
+        """
+        paths = set(paths)
+        self.probe(paths)
+        existing = [p for p in paths if self._exists[p]]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            sizes = dict(zip(existing, executor.map(self.size, existing)))
+        return {p: sizes.get(p) for p in paths}
@@ -1,22 +1,20 @@
-import os
 from logging import getLogger
 
-from warnings import catch_warnings
-from ubiquerg import size
-
+import pandas as pd
 
 from .const import (
     ALL_INPUTS_KEY,
     INPUT_FILE_SIZE_KEY,
     MISSING_KEY,
-    PROP_KEY,
     REQUIRED_INPUTS_KEY,
-    SIZING_KEY,
-    TANGIBLE_KEY,
-    SAMPLES_KEY,
 )
+from .file_probe import DEFAULT_PROBE_WORKERS, StatCache
 from .schema import read_schema
-from .validation import _validate_sample_object, _get_attr_values
+from .validation import (
+    _get_sample_inputs,
+    _validate_sample_object,
+    get_missing_input_files,
+)
 
 _LOGGER = getLogger(__name__)
 
@@ -43,7 +41,7 @@ def inspect_project(p, sample_names=None, max_attr=10):
     return
 
 
-def get_input_files_size(sample, schema):
+def get_input_files_size(sample, schema, stat_cache=None):
     """
     Determine which of this Sample's required attributes/files are missing
     and calculate sizes of the files (inputs).
@@ -55,6 +53,8 @@ def get_input_files_size(sample, schema):
 
     :param peppy.Sample sample: sample to investigate
     :param list[dict] | str schema: schema dict to validate against or a path to one
+    :param StatCache stat_cache: cache of file checks to reuse, e.g. the one
+        filled by validate_input_files for the whole project
     :return dict: dictionary with validation data, i.e missing,
         required_inputs, all_inputs, input_file_size
     :raise ValidationError: if any required sample attribute is missing
@@ -65,34 +65,72 @@ def get_input_files_size(sample, schema):
     # first, validate attrs existence using jsonschema
     _validate_sample_object(schemas=schema, sample=sample)
 
-    all_inputs = set()
-    required_inputs = set()
-    schema = schema[-1]  # use only first schema, in case there are imports
-    sample_schema_dict = schema[PROP_KEY][SAMPLES_KEY]["items"]
-    if SIZING_KEY in sample_schema_dict:
-        all_inputs.update(_get_attr_values(sample, sample_schema_dict[SIZING_KEY]))
-    if TANGIBLE_KEY in sample_schema_dict:
-        required_inputs = set(
-            _get_attr_values(sample, sample_schema_dict[TANGIBLE_KEY])
+    # use only first schema, in case there are imports
+    required_inputs, all_inputs = _get_sample_inputs(sample, schema[-1])
+    stat_cache = stat_cache or StatCache()
+    sizes = [stat_cache.size(f) for f in all_inputs if f != "" and f != None]
+    input_file_size = sum(s or 0 for s in sizes) / (1024**3)
+    n_missing = sizes.count(None)
+    if n_missing:
+        _LOGGER.warning(
+            f"{n_missing} input files missing, job input size was "
+            f"not calculated accurately"
         )
-        all_inputs.update(required_inputs)
-    with catch_warnings(record=True) as w:
-        input_file_size = sum(
-            [
-                size(f, size_str=False) or 0.0
-                for f in all_inputs
-                if f != "" and f != None
-            ]
-        ) / (1024**3)
-        if w:
-            _LOGGER.warning(
-                f"{len(w)} input files missing, job input size was "
-                f"not calculated accurately"
-            )
 
     return {
-        MISSING_KEY: [i for i in required_inputs if not os.path.exists(i)],
+        MISSING_KEY: stat_cache.missing(required_inputs),
         REQUIRED_INPUTS_KEY: required_inputs,
         ALL_INPUTS_KEY: all_inputs,
         INPUT_FILE_SIZE_KEY: input_file_size,
     }
+
+
+def get_project_input_files_size(
+    project, schema, workers=DEFAULT_PROBE_WORKERS, stat_cache=None
+):
+    """
+    Determine the missing required inputs and input sizes of all samples
+
+    The schema is read and every sample validated once, then all unique
+    input paths of the project are checked and sized concurrently.
+
+    :param peppy.Project project: project to investigate
+    :param list[dict] | str schema: schema dict to validate against or a path to one
+    :param int workers: maximum number of threads to check files with
+    :param StatCache stat_cache: cache of file checks to use and fill,
+        e.g. the one filled by validate_input_files for the project
+    :return pandas.DataFrame: table indexed by sample name with the missing
+        required inputs, the numbers of required and all inputs and the total
+        size of the inputs in GiB of every sample
+    :raise ValidationError: if any sample is invalid
+    """
+    stat_cache = stat_cache or StatCache(workers=workers)
+    report = get_missing_input_files(project, schema, stat_cache=stat_cache)
+    sizes = stat_cache.sizes(
+        f
+        for sample_report in report.values()
+        for f in sample_report[ALL_INPUTS_KEY]
+        if f != "" and f != None
+    )
+    n_missing = sum(s is None for s in sizes.values())
+    if n_missing:
+        _LOGGER.warning(
+            f"{n_missing} input files missing, job input sizes were "
+            f"not calculated accurately"
+        )
+    return pd.DataFrame.from_dict(
+        {
+            name: {
+                MISSING_KEY: sample_report[MISSING_KEY],
+                REQUIRED_INPUTS_KEY: len(sample_report[REQUIRED_INPUTS_KEY]),
+                ALL_INPUTS_KEY: len(sample_report[ALL_INPUTS_KEY]),
+                INPUT_FILE_SIZE_KEY: sum(
+                    sizes.get(f) or 0 for f in sample_report[ALL_INPUTS_KEY]
+                )
+                / (1024**3),
+            }
+            for name, sample_report in report.items()
+        },
+        orient="index",
+        columns=[MISSING_KEY, REQUIRED_INPUTS_KEY, ALL_INPUTS_KEY, INPUT_FILE_SIZE_KEY],
+    )
@@ -0,0 +1,255 @@
+"""
+Lightweight timing of the phases of eido runs
+
+The phases are wrapped in spans, which are timed and passed to the registered
+callbacks when they end. Without any callback registered, `span` returns a
+shared no-op context manager, so the instrumentation costs a function call
+and a check per phase.
+
+    recorder = SpanRecorder()
+    add_span_callback(recorder)
+    validate_project(project, schema)
+    print(recorder.summary())
+
+Spans are recorded in the process they run in: the samples validated in
+worker processes are reported as a single span of the parent process.
+"""
+
+import json
+import time
+from functools import wraps
+from contextvars import ContextVar
+from logging import getLogger
+from threading import Lock
+from typing import Callable, Dict, List
+
+_LOGGER = getLogger(__name__)
+
+# callbacks called with every span that ends
+_SPAN_CALLBACKS = []
+_SPAN_CALLBACKS_LOCK = Lock()
+# innermost span of the current thread or task
+_CURRENT_SPAN = ContextVar("eido_current_span", default=None)
+
+
+class Span:
+    """
+    A timed phase of an eido run
+
+    :param str name: name of the phase, e.g. 'validation.evaluate'
+    :param dict attributes: details of the phase, e.g. the schema location
+    """
+
+    __slots__ = ("name", "attributes", "parent", "start", "end", "_token")
+
+    def __init__(self, name: str, attributes: Dict = None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.parent = None
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self) -> float:
+        """
+        Wall time of the phase in seconds
+        """
+        return self.end - self.start
+
+    @property
+    def path(self) -> str:
+        """
+        Names of the enclosing spans and of this one, separated with '/'
+        """
+        names = []
+        span = self
+        while span is not None:
+            names.append(span.name)
+            span = span.parent
+        return "/".join(reversed(names))
+
+    def __enter__(self):
+        self.parent = _CURRENT_SPAN.get()
+        self._token = _CURRENT_SPAN.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.end = time.perf_counter()
+        _CURRENT_SPAN.reset(self._token)
+        for callback in list(_SPAN_CALLBACKS):
+            try:
+                callback(self)
+            except Exception as e:
+                _LOGGER.warning(f"Span callback {callback!r} failed: {e}")
+        return False
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class _NullSpan:
+    """
+    Span used while no callback is registered, it records nothing
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **attributes):
+    """
+    Time a phase, if any span callback is registered
+
+    :param str name: name of the phase
+    :param attributes: details of the phase, passed on to the callbacks
+    :return Span: context manager timing the phase
+    """
+    if not _SPAN_CALLBACKS:
+        return _NULL_SPAN
+    return Span(name, attributes)
+
+
+def instrumented(name: str):
+    """
+    Decorate a function to time its calls as a phase
+
+    :param str name: name of the phase
+    :return callable: decorator
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        def _wrapper(*args, **kwargs):
+            if not _SPAN_CALLBACKS:
+                return func(*args, **kwargs)
+            with Span(name):
+                return func(*args, **kwargs)
+
+        return _wrapper
+
+    return _decorator
+
+
+def add_span_callback(callback: Callable[[Span], None]) -> None:
+    """
+    Register a function to call with every span that ends
+
+    Registering a callback enables the instrumentation. Callbacks are called
+    in the thread the span ended in, and their errors are logged and ignored.
+
+    :param callable callback: function taking a Span
+    """
+    with _SPAN_CALLBACKS_LOCK:
+        if callback not in _SPAN_CALLBACKS:
+            _SPAN_CALLBACKS.append(callback)
+
+
+def remove_span_callback(callback: Callable[[Span], None]) -> None:
+    """
+    Unregister a span callback
+
+    :param callable callback: function registered with add_span_callback
+    """
+    with _SPAN_CALLBACKS_LOCK:
+        if callback in _SPAN_CALLBACKS:
+            _SPAN_CALLBACKS.remove(callback)
+
+
+class SpanRecorder:
+    """
+    Span callback that keeps the spans, to summarize them
+
+    :param int max_spans: maximum number of spans to keep, the later ones
+        are only counted in the summary
+    """
+
+    def __init__(self, max_spans: int = 10000):
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self._totals = {}
+        self._lock = Lock()
+
+    def __call__(self, span: Span) -> None:
+        path = span.path
+        with self._lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            total = self._totals.setdefault(
+                path, {"name": span.name, "count": 0, "total": 0.0, "children": 0.0}
+            )
+            total["count"] += 1
+            total["total"] += span.duration
+            if span.parent is not None:
+                parent = self._totals.setdefault(
+                    span.parent.path,
+                    {
+                        "name": span.parent.name,
+                        "count": 0,
+                        "total": 0.0,
+                        "children": 0.0,
+                    },
+                )
+                parent["children"] += span.duration
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        Get the time spent in every phase
+
+        :return dict[str, dict]: number of spans, total time and self time,
+            i.e. not spent in the nested phases, by span path
+        """
+        with self._lock:
+            return {
+                path: {
+                    "name": t["name"],
+                    "count": t["count"],
+                    "total": t["total"],
+                    "self": t["total"] - t["children"],
+                }
+                for path, t in self._totals.items()
+                if t["count"]
+            }
+
+    def to_json(self) -> str:
+        """
+        Get the summary and the kept spans as JSON
+
+        :return str: JSON with the 'summary' and the 'spans'
+        """
+        with self._lock:
+            spans = [s.to_dict() for s in self.spans]
+        return json.dumps(
+            {"summary": self.summary(), "spans": spans}, indent=2, default=str
+        )
+
+    def format_summary(self) -> str:
+        """
+        Get the summary as a table, the nested phases after their parents
+
+        :return str: table of the count, total and self time of every phase
+        """
+        summary = self.summary()
+        width = max([len(p) for p in summary] + [5])
+        lines = [
+            f"{'phase':<{width}}  {'count':>7}  {'total (s)':>10}  {'self (s)':>10}"
+        ]
+        for path, t in sorted(summary.items()):
+            lines.append(
+                f"{path:<{width}}  {t['count']:>7}  {t['total']:>10.4f}  {t['self']:>10.4f}"
+            )
+        return "\n".join(lines)
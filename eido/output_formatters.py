@@ -1,8 +1,19 @@
+import csv
+import io
 from abc import ABC, abstractmethod
-from typing import Iterable, List, Union
+from itertools import chain
+from logging import getLogger
+from typing import Dict, Iterable, List, Union
 
+import numpy as np
+import pandas as pd
 from peppy.sample import Sample
 
+_LOGGER = getLogger(__name__)
+
+# number of rows written to the output buffer at a time
+_CHUNK_ROWS = 10000
+
 
 class BaseOutputFormatter(ABC):
     @staticmethod
@@ -14,118 +25,288 @@ class BaseOutputFormatter(ABC):
         pass
 
 
+def _fit_to_length(value, n: int) -> list:
+    """
+    Turn a cell into a list of n values, to explode it along with the others
+
+    :param value: a single value, repeated on every row, or a list of values
+    :param int n: number of rows the sample is exploded to
+    :return list: n values, missing ones are None
+    """
+    if not isinstance(value, list):
+        return [value] * n
+    return [value[i] if i < len(value) else None for i in range(n)]
+
+
 class MultilineOutputFormatter(BaseOutputFormatter):
+    """
+    CSV formatter that writes one row per value of the multi-value attributes
+
+    Attributes holding lists, i.e. merged from subsample tables, are exploded
+    to one row per value with the other attributes repeated. The number of
+    rows of a sample is the length of its first list attribute.
+    """
+
+    @staticmethod
+    def format(samples: Union[List[Sample], pd.DataFrame]) -> str:
+        return "".join(MultilineOutputFormatter.iter_format(samples))
+
     @staticmethod
-    def format(samples: List[Sample]) -> str:
-        output_rows = []
+    def iter_format(
+        samples: Union[List[Sample], pd.DataFrame], chunk_size: int = _CHUNK_ROWS
+    ) -> Iterable[str]:
+        """
+        Convert the samples to CSV, in chunks of lines.
+
+        :param list[peppy.Sample] | pandas.DataFrame samples: samples, or a table
+            of them like project.sample_table
+        :param int chunk_size: number of rows in a chunk
+        :return Iterable[str]: chunks of the CSV
+        """
+        table = MultilineOutputFormatter._get_table(samples)
+        values = MultilineOutputFormatter._explode(table)
+        values[pd.isna(values)] = ""
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(table.columns)
+        for start in range(0, max(len(values), 1), chunk_size):
+            writer.writerows(values[start : start + chunk_size].tolist())
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    @staticmethod
+    def _get_table(samples: Union[List[Sample], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Get a columnar view of the samples, without private attributes
+
+        :param list[peppy.Sample] | pandas.DataFrame samples: samples, or a table
+        :return pandas.DataFrame: table with one column per sample attribute
+        """
+        if isinstance(samples, pd.DataFrame):
+            columns = samples.columns
+        else:
+            columns = samples[0].keys()
         sample_attributes = [
             attribute
-            for attribute in samples[0].keys()
+            for attribute in columns
             if not attribute.startswith("_") and not attribute == "subsample_name"
         ]
-        header = MultilineOutputFormatter._get_header(sample_attributes)
+        if isinstance(samples, pd.DataFrame):
+            return samples[sample_attributes]
+        # peppy.Sample keeps its attributes in a plain dict
+        records = [getattr(sample, "attributes", sample) for sample in samples]
+        return pd.DataFrame(records, columns=sample_attributes)
 
-        for sample in samples:
-            attribute_with_multiple_properties = MultilineOutputFormatter._get_the_name_of_the_first_attribute_with_multiple_properties(
-                sample, sample_attributes
+    @staticmethod
+    def _explode(table: pd.DataFrame) -> np.ndarray:
+        """
+        Explode the list cells of a table to one row per value
+
+        :param pandas.DataFrame table: table with lists in some cells
+        :return numpy.ndarray: values of the exploded table, without lists
+        """
+        lengths = {}
+        for c in table.columns:
+            if table[c].dtype != object:
+                continue
+            column_lengths = np.fromiter(
+                (len(v) if isinstance(v, list) else -1 for v in table[c]),
+                dtype=np.int64,
+                count=len(table),
             )
-            if attribute_with_multiple_properties:
-                sample_rows = MultilineOutputFormatter._split_sample_to_multiple_rows(
-                    sample, sample_attributes, attribute_with_multiple_properties
-                )
-                output_rows.extend(sample_rows)
-            else:
-                one_sample_row = MultilineOutputFormatter._convert_sample_to_row(
-                    sample, sample_attributes
-                )
-                output_rows.append(one_sample_row)
+            if (column_lengths >= 0).any():
+                lengths[c] = column_lengths
+        if not lengths:
+            return table.to_numpy(dtype=object, copy=True)
+        lengths_matrix = np.column_stack(list(lengths.values()))
+        has_list = (lengths_matrix >= 0).any(axis=1)
+        # the first list of a row sets its number of rows
+        n = np.where(
+            has_list,
+            lengths_matrix[
+                np.arange(len(lengths_matrix)), (lengths_matrix >= 0).argmax(axis=1)
+            ],
+            1,
+        )
+        rows = np.repeat(np.arange(len(table)), n)
+        values = table.to_numpy(dtype=object)[rows]
+        for j, c in enumerate(table.columns):
+            if c not in lengths:
+                continue
+            regular = ~has_list | (lengths[c] == n)
+            cells = table[c].to_numpy(dtype=object)
+            # repeat single values and pad or trim lists of other lengths
+            values[:, j] = np.fromiter(
+                chain.from_iterable(
+                    (
+                        (v if isinstance(v, list) else [v])
+                        if is_regular
+                        else _fit_to_length(v, k)
+                    )
+                    for v, k, is_regular in zip(cells, n, regular)
+                ),
+                dtype=object,
+                count=len(rows),
+            )
+        return values
 
-        return "\n".join(header + output_rows) + "\n"
 
-    @staticmethod
-    def _get_header(header_column_names: List[str]):
-        return [",".join(header_column_names)]
+class SampleSubsampleOutputFormatter(BaseOutputFormatter):
+    """
+    CSV formatter that writes the samples and their subsamples as separate tables
+
+    The sample table holds one row per sample, without the attributes merged
+    from the subsample tables. Every subsample table is written with its rows
+    grouped by sample, in the order of the samples. The sample keys are hashed
+    once and every subsample row is looked up once, then the rows are written
+    in chunks as they are joined. Subsample rows of unknown samples are left out.
+    """
 
     @staticmethod
-    def _get_the_name_of_the_first_attribute_with_multiple_properties(
-        sample: Sample, sample_attributes: List[str]
-    ) -> Union[str, None]:
-        for attribute in sample_attributes:
-            if MultilineOutputFormatter._sample_attribute_is_list(sample, attribute):
-                return attribute
+    def format(
+        samples: Union[List[Sample], pd.DataFrame],
+        subsample_tables: Union[pd.DataFrame, List[pd.DataFrame]] = None,
+        sample_key: str = "sample_name",
+        subsample_key: str = None,
+        sample_attributes: Iterable[str] = None,
+    ) -> Dict[str, str]:
+        return {
+            name: "".join(chunks)
+            for name, chunks in SampleSubsampleOutputFormatter.iter_format(
+                samples, subsample_tables, sample_key, subsample_key, sample_attributes
+            ).items()
+        }
 
     @staticmethod
-    def _split_sample_to_multiple_rows(
-        sample: Sample, sample_attributes: List, attribute_with_multiple_properties: str
-    ) -> Iterable[str]:
+    def iter_format(
+        samples: Union[List[Sample], pd.DataFrame],
+        subsample_tables: Union[pd.DataFrame, List[pd.DataFrame]] = None,
+        sample_key: str = "sample_name",
+        subsample_key: str = None,
+        sample_attributes: Iterable[str] = None,
+        chunk_size: int = _CHUNK_ROWS,
+    ) -> Dict[str, Iterable[str]]:
         """
-        If one sample object contains array properties instead of single value, then it will be converted
-        to multiple rows.
-
-        Args:
-            sample: Sample from project.
-            sample_attributes: List of all sample properties names (name of columns from sample_table).
+        Convert the samples and subsamples to CSV tables, in chunks of lines.
 
-        Returns:
-            List of rows created from given sample object.
+        :param list[peppy.Sample] | pandas.DataFrame samples: samples, or a table
+            of them like project.sample_table
+        :param pandas.DataFrame | list[pandas.DataFrame] subsample_tables:
+            subsample tables, like project.subsample_table
+        :param str sample_key: name of the attribute identifying the samples
+        :param str subsample_key: name of the column of the subsample tables
+            referring to the samples. Defaults to sample_key
+        :param Iterable[str] sample_attributes: sample attributes to join
+            to every subsample row
+        :param int chunk_size: number of rows in a chunk
+        :return dict[str, Iterable[str]]: chunks of the tables, by name:
+            'samples' and 'subsamples', or 'subsamples_1', 'subsamples_2'...
+            if there are many subsample tables
         """
-        number_of_samples_after_split = len(
-            getattr(sample, attribute_with_multiple_properties)
-        )
-        sample_rows_after_split = []
+        if subsample_tables is None:
+            subsample_tables = []
+        elif isinstance(subsample_tables, pd.DataFrame):
+            subsample_tables = [subsample_tables]
+        subsample_key = subsample_key or sample_key
+        sample_attributes = list(sample_attributes or [])
 
-        for sample_index in range(number_of_samples_after_split):
-            sample_row = MultilineOutputFormatter._convert_sample_to_row(
-                sample, sample_attributes, sample_index
-            )
-            sample_rows_after_split.append(sample_row)
+        table = MultilineOutputFormatter._get_table(samples)
+        merged = {c for t in subsample_tables for c in t.columns} - {sample_key}
+        sample_table = table[[c for c in table.columns if c not in merged]]
+        keys = table[sample_key].to_numpy(dtype=object)
 
-        return sample_rows_after_split
+        tables = {"samples": _iter_csv(sample_table.columns, sample_table, chunk_size)}
+        for i, subsample_table in enumerate(subsample_tables, 1):
+            name = "subsamples" if len(subsample_tables) == 1 else f"subsamples_{i}"
+            tables[name] = SampleSubsampleOutputFormatter._iter_joined_rows(
+                keys,
+                table[sample_attributes],
+                subsample_table,
+                subsample_key,
+                chunk_size,
+            )
+        return tables
 
     @staticmethod
-    def _convert_sample_to_row(
-        sample: Sample, sample_attributes: List, sample_index: int = 0
-    ) -> str:
+    def _iter_joined_rows(
+        keys: np.ndarray,
+        sample_attributes: pd.DataFrame,
+        subsample_table: pd.DataFrame,
+        subsample_key: str,
+        chunk_size: int,
+    ) -> Iterable[str]:
         """
-        Converts single sample object to CSV row.
-
-        Some samples have a list of values instead of single value for given attribute (column), and
-        sample_index indicates index of the value that will be used to create a row. For samples that don't
-        have any attributes with given names this will always be zero.
+        Write the rows of a subsample table in the order of the samples
 
-        Args:
-            sample: Single sample object.
-            sample_attributes: Array of all attributes names (column names) for given sample.
-            sample_index: Number indicating which value will be used to create row. Some samples
-
-        Returns:
-            Representation of sample as a CSV row.
+        :param numpy.ndarray keys: keys of the samples, in order
+        :param pandas.DataFrame sample_attributes: sample attributes to join
+            to the subsample rows, one row per sample
+        :param pandas.DataFrame subsample_table: subsample table
+        :param str subsample_key: column of the subsample table with the keys
+        :param int chunk_size: number of rows in a chunk
+        :return Iterable[str]: chunks of the joined table
         """
-        sample_row = []
-
-        for attribute in sample_attributes:
-            if (
-                MultilineOutputFormatter._sample_attribute_is_list(sample, attribute)
-                and sample[attribute]
-            ):
-                value = sample[attribute][sample_index]
-            else:
-                value = sample.get(attribute)
+        # hash index of the samples by key, the first sample of a key wins
+        first = ~pd.Index(keys).duplicated()
+        index = pd.Index(keys[first])
+        sample_positions = np.flatnonzero(first)
+        found = index.get_indexer(subsample_table[subsample_key].to_numpy(dtype=object))
+        matched = np.flatnonzero(found >= 0)
+        if len(matched) < len(subsample_table):
+            _LOGGER.warning(
+                f"Skipped {len(subsample_table) - len(matched)} subsample rows "
+                f"that do not match any sample by '{subsample_key}'"
+            )
+        sample_rows = sample_positions[found[matched]]
+        # group the rows by sample, keeping their order within a sample
+        order = np.argsort(sample_rows, kind="stable")
+        subsample_rows, sample_rows = matched[order], sample_rows[order]
 
-            if isinstance(value, float) and value != value:
-                # pandas (>=3.0) yields float('nan') instead of None for missing
-                # values when a Sample's attributes originate from a DataFrame
-                value = None
+        columns = list(subsample_table.columns) + [
+            c for c in sample_attributes.columns if c not in subsample_table.columns
+        ]
+        subsample_values = subsample_table.to_numpy(dtype=object)
+        attribute_values = sample_attributes[columns[subsample_table.shape[1] :]]
+        attribute_values = attribute_values.to_numpy(dtype=object)
 
-            sample_row.append(value or "")
+        def _joined_chunks():
+            for start in range(0, len(subsample_rows), chunk_size):
+                stop = start + chunk_size
+                yield np.hstack(
+                    [
+                        subsample_values[subsample_rows[start:stop]],
+                        attribute_values[sample_rows[start:stop]],
+                    ]
+                )
 
-        return ",".join(sample_row)
+        yield from _iter_csv(columns, _joined_chunks(), chunk_size)
 
-    @staticmethod
-    def _sample_attribute_is_list(sample: Sample, attribute: str) -> bool:
-        return isinstance(getattr(sample, attribute, ""), list)
 
+def _iter_csv(columns, values, chunk_size: int) -> Iterable[str]:
+    """
+    Write a table to CSV, in chunks of lines
 
-class SampleSubsampleOutputFormatter(BaseOutputFormatter):
-    def format(self, samples: List[Sample]):
-        pass
+    :param Iterable[str] columns: header of the table
+    :param pandas.DataFrame | Iterable[numpy.ndarray] values: the table,
+        or chunks of its rows
+    :param int chunk_size: number of rows in a chunk of a table
+    :return Iterable[str]: chunks of the CSV
+    """
+    if isinstance(values, pd.DataFrame):
+        table = values.to_numpy(dtype=object)
+        values = (table[i : i + chunk_size] for i in range(0, len(table), chunk_size))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for chunk in values:
+        chunk = chunk.copy()
+        chunk[pd.isna(chunk)] = ""
+        writer.writerows(chunk.tolist())
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # the header of a table without rows
+        yield buffer.getvalue()
@@ -1,12 +1,41 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy as dpcpy
 from logging import getLogger
+from threading import Lock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
-from peppy.utils import load_yaml
+import yaml
+from peppy.exceptions import RemoteYAMLError
+from peppy.utils import expand_paths, is_url, load_yaml
 
 from .const import SAMPLES_KEY, PROP_KEY
+from .debug_trace import trace_event
+from .exceptions import EidoSchemaInvalidError
+from .instrumentation import instrumented
+from .schema_cache import (
+    is_offline,
+    load_cached_schemas,
+    schema_cache_enabled,
+    store_schemas,
+)
 
 _LOGGER = getLogger(__name__)
 
+# parsed schemas by absolute path or URL, stored with the file modification
+# time or the HTTP ETag they were read with
+_SCHEMA_CACHE = {}
+_SCHEMA_CACHE_LOCK = Lock()
 
+# maximum number of imports fetched at the same time
+_MAX_IMPORT_WORKERS = 8
+
+# seconds to wait for a remote schema server to connect or send data
+_REMOTE_TIMEOUT = 30
+
+
+@instrumented("schema.preprocess")
 def preprocess_schema(schema_dict):
     """
     Preprocess schema before validation for user's convenience
@@ -20,7 +49,8 @@ def preprocess_schema(schema_dict):
     :param dict schema_dict: schema dictionary to preprocess
     :return dict: preprocessed schema
     """
-    _LOGGER.debug(f"schema ori: {schema_dict}")
+    _LOGGER.debug("schema ori: %s", schema_dict)
+    trace_event("schema.original", schema=schema_dict)
     if "project" not in schema_dict[PROP_KEY]:
         _LOGGER.debug("No project section found in schema")
 
@@ -36,40 +66,181 @@ def preprocess_schema(schema_dict):
                     s_props[prop]["anyOf"] = [val, {"type": "array", "items": val}]
     else:
         _LOGGER.debug("No samples section found in schema")
-    _LOGGER.debug(f"schema processed: {schema_dict}")
+    _LOGGER.debug("schema processed: %s", schema_dict)
+    trace_event("schema.preprocessed", schema=schema_dict)
     return schema_dict
 
 
+def _get_schema_location(schema):
+    """
+    Get the canonical location of a schema: absolute path or URL
+
+    :param str schema: path to the schema file or URL to a remote one
+    :return str: canonical location of the schema
+    """
+    return schema if is_url(schema) else os.path.abspath(schema)
+
+
+def _fetch_remote_schema(url, etag=None):
+    """
+    Fetch a remote schema, unless it has not changed since it was last read
+
+    :param str url: URL of the schema
+    :param str etag: ETag the schema was last read with
+    :return (str, dict | None): ETag of the schema and the schema,
+        or None if it has not changed
+    :raise RemoteYAMLError: if the schema can't be fetched
+    """
+    request = Request(url)
+    if etag is not None:
+        request.add_header("If-None-Match", etag)
+    try:
+        with urlopen(request, timeout=_REMOTE_TIMEOUT) as response:
+            data = response.read().decode("utf-8")
+            new_etag = response.headers.get("ETag")
+    except Exception as e:
+        if isinstance(e, HTTPError) and e.code == 304:
+            return etag, None
+        raise RemoteYAMLError(
+            f"Could not load remote file: {url}. "
+            f"Original exception: {getattr(e, 'message', repr(e))}"
+        )
+    return new_etag, expand_paths(yaml.safe_load(data))
+
+
+@instrumented("schema.load_file")
+def _load_schema_file(location):
+    """
+    Load a schema, reusing the parsed one if its source has not changed
+
+    Local schemas are reused as long as the file modification time is the
+    same, remote ones as long as the server confirms the ETag is current.
+
+    :param str location: absolute path to the schema file or URL
+    :return dict: a copy of the parsed schema
+    """
+    with _SCHEMA_CACHE_LOCK:
+        token, schema = _SCHEMA_CACHE.get(location, (None, None))
+    if is_url(location):
+        if is_offline():
+            if schema is None:
+                raise RemoteYAMLError(f"Could not load remote file offline: {location}")
+            return dpcpy(schema)
+        new_token, new_schema = _fetch_remote_schema(
+            location, token if schema is not None else None
+        )
+    else:
+        new_token = os.stat(location).st_mtime_ns
+        if schema is not None and new_token == token:
+            new_schema = None
+        else:
+            new_schema = load_yaml(location)
+    if new_schema is None:
+        _LOGGER.debug("Reusing parsed schema: %s", location)
+        return dpcpy(schema)
+    _LOGGER.debug("Read schema: %s", location)
+    if new_token is not None:
+        with _SCHEMA_CACHE_LOCK:
+            _SCHEMA_CACHE[location] = (new_token, new_schema)
+    return dpcpy(new_schema)
+
+
+def clear_schema_cache() -> None:
+    """
+    Remove all parsed schemas from the schema cache
+    """
+    with _SCHEMA_CACHE_LOCK:
+        _SCHEMA_CACHE.clear()
+
+
+@instrumented("schema.read")
 def read_schema(schema):
     """
     Safely read schema from YAML-formatted file.
 
     If the schema imports any other schemas, they will be read recursively.
+    Every schema in the import graph is read once, even if it is imported
+    by several schemas, and independent imports are fetched concurrently.
+    If the on-disk schema cache is enabled, schemas read from a file or URL
+    are loaded from it until any of their sources change; remote sources
+    are checked with the server using their ETag.
 
     :param str | Mapping schema: path to the schema file
         or schema in a dict form
-    :return list[dict]: read schemas
+    :return list[dict]: read schemas, every schema preceded by its imports
     :raise TypeError: if the schema arg is neither a Mapping nor a file path or
         if the 'imports' sections in any of the schemas is not a list
+    :raise EidoSchemaInvalidError: if the schemas import each other in a cycle
     """
+    schema_list = []
+    resolved = set()
+
+    def _load_imports(imports):
+        locations = {
+            _get_schema_location(i)
+            for i in imports
+            if isinstance(i, str) and _get_schema_location(i) not in resolved
+        }
+        if len(locations) < 2:
+            return {loc: _load_schema_file(loc) for loc in locations}
+        workers = min(_MAX_IMPORT_WORKERS, len(locations))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                loc: executor.submit(_load_schema_file, loc) for loc in locations
+            }
+        return {loc: f.result() for loc, f in futures.items()}
 
-    def _recursively_read_schemas(x, lst):
+    def _recursively_read_schemas(x, location, chain):
         if "imports" in x:
-            if isinstance(x["imports"], list):
-                for sch in x["imports"]:
-                    lst.extend(read_schema(sch))
-            else:
+            if not isinstance(x["imports"], list):
                 raise TypeError("In schema the 'imports' section has to be a list")
-        lst.append(x)
-        return lst
+            loaded = _load_imports(x["imports"])
+            for sch in x["imports"]:
+                if not isinstance(sch, str):
+                    _recursively_read_schemas(_check_schema_type(sch), None, chain)
+                    continue
+                sch_location = _get_schema_location(sch)
+                if sch_location in chain:
+                    cycle = chain[chain.index(sch_location) :] + [sch_location]
+                    raise EidoSchemaInvalidError(
+                        f"Schema imports form a cycle: {' -> '.join(cycle)}"
+                    )
+                if sch_location in resolved:
+                    continue
+                _recursively_read_schemas(
+                    loaded[sch_location], sch_location, chain + [sch_location]
+                )
+        if location is not None:
+            resolved.add(location)
+        schema_list.append(x)
 
-    schema_list = []
+    location = None
     if isinstance(schema, str):
-        _LOGGER.debug(f"Reading schema: {schema}")
-        schema = load_yaml(schema)
+        _LOGGER.debug("Reading schema: %s", schema)
+        location = _get_schema_location(schema)
+        if schema_cache_enabled():
+            cached = load_cached_schemas(location)
+            if cached is not None:
+                return cached
+        schema = _load_schema_file(location)
+    _recursively_read_schemas(
+        _check_schema_type(schema), location, [location] if location else []
+    )
+    if location is not None and schema_cache_enabled():
+        with _SCHEMA_CACHE_LOCK:
+            etags = {
+                loc: _SCHEMA_CACHE[loc][0]
+                for loc in resolved
+                if is_url(loc) and loc in _SCHEMA_CACHE
+            }
+        store_schemas(location, resolved, schema_list, etags)
+    return schema_list
+
+
+def _check_schema_type(schema):
     if not isinstance(schema, dict):
         raise TypeError(
             f"schema has to be a dict, path to an existing file or URL to a remote one. "
             f"Got: {type(schema)}"
         )
-    return _recursively_read_schemas(schema, schema_list)
+    return schema
@@ -0,0 +1,278 @@
+"""
+Persistent on-disk cache of resolved schemas
+
+Every entry holds the whole resolved import chain of a schema as JSON, which
+loads much faster than the YAML sources. The schemas are stored as they were
+loaded, so a cached read returns the same as an uncached one; schemas with
+values JSON cannot represent, e.g. dates, are not cached. Entries are keyed by
+the schema location and store content hashes of all the local sources they
+were made of, so they are invalidated as soon as any of the files changes.
+Remote sources are revalidated with the server using their ETag, unless they
+were fetched less than the configured time ago; offline they are trusted
+indefinitely.
+"""
+
+import hashlib
+import json
+import os
+import time
+from logging import getLogger
+
+_LOGGER = getLogger(__name__)
+
+CACHE_DIR_ENV = "EIDO_CACHE_DIR"
+SCHEMA_CACHE_ENV = "EIDO_SCHEMA_CACHE"
+OFFLINE_ENV = "EIDO_OFFLINE"
+
+DEFAULT_MAX_SIZE = 64 * 1024**2
+DEFAULT_REMOTE_TTL = 0
+
+_CACHE_FORMAT_VERSION = 2
+
+
+def _env_flag(name):
+    return os.environ.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+_SETTINGS = {
+    "enabled": _env_flag(SCHEMA_CACHE_ENV),
+    "offline": _env_flag(OFFLINE_ENV),
+    "cache_dir": None,
+    "max_size": DEFAULT_MAX_SIZE,
+    "remote_ttl": DEFAULT_REMOTE_TTL,
+}
+
+
+def configure_schema_cache(
+    enabled: bool = None,
+    cache_dir: str = None,
+    offline: bool = None,
+    max_size: int = None,
+    remote_ttl: int = None,
+) -> None:
+    """
+    Configure the on-disk schema cache for the current process
+
+    The cache is disabled by default, unless the EIDO_SCHEMA_CACHE environment
+    variable is set; the command line interface enables it.
+
+    :param bool enabled: whether read_schema should use the cache
+    :param str cache_dir: directory to keep the cache in. Defaults to
+        $EIDO_CACHE_DIR or the 'eido' directory in the user cache directory
+    :param bool offline: whether to avoid any network access: remote schemas
+        are then read from the cache only, however old the entries are
+    :param int max_size: maximum size of the cache in bytes, the least
+        recently used entries are evicted above it
+    :param int remote_ttl: number of seconds remote schemas are trusted for
+        without asking the server whether they changed, 0 by default
+    """
+    for key, value in [
+        ("enabled", enabled),
+        ("cache_dir", cache_dir),
+        ("offline", offline),
+        ("max_size", max_size),
+        ("remote_ttl", remote_ttl),
+    ]:
+        if value is not None:
+            _SETTINGS[key] = value
+
+
+def schema_cache_enabled() -> bool:
+    return _SETTINGS["enabled"]
+
+
+def is_offline() -> bool:
+    return _SETTINGS["offline"]
+
+
+def get_cache_root() -> str:
+    """
+    Get the directory all eido caches are kept in
+
+    :return str: path to the eido cache directory
+    """
+    cache_dir = _SETTINGS["cache_dir"] or os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        cache_dir = os.path.join(cache_home, "eido")
+    return cache_dir
+
+
+def get_cache_dir() -> str:
+    """
+    Get the directory the schema cache entries are kept in
+
+    :return str: path to the schema cache directory
+    """
+    return os.path.join(get_cache_root(), "schemas")
+
+
+def _entry_path(location):
+    key = hashlib.sha256(location.encode("utf-8")).hexdigest()
+    return os.path.join(get_cache_dir(), f"{key}.json")
+
+
+def _hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _get_source_state(location, etag=None):
+    """
+    Describe the state of a schema source, to detect changes later on
+
+    :param str location: absolute path to the schema file or URL
+    :param str etag: ETag a remote source was fetched with
+    :return dict: content hash of a local source, or fetch time and ETag
+        of a remote one
+    """
+    from peppy.utils import is_url
+
+    if is_url(location):
+        return {"fetched": time.time(), "etag": etag}
+    return {"sha256": _hash_file(location)}
+
+
+def _is_source_current(location, state):
+    from peppy.exceptions import RemoteYAMLError
+    from peppy.utils import is_url
+
+    if is_url(location):
+        if is_offline() or time.time() - state["fetched"] < _SETTINGS["remote_ttl"]:
+            return True
+        if not state.get("etag"):
+            return False
+        from .schema import _fetch_remote_schema
+
+        try:
+            _, schema = _fetch_remote_schema(location, state["etag"])
+        except RemoteYAMLError:
+            return False
+        return schema is None
+    try:
+        return _hash_file(location) == state["sha256"]
+    except OSError:
+        return False
+
+
+def load_cached_schemas(location: str):
+    """
+    Get the resolved schemas cached for a location
+
+    :param str location: absolute path to the schema file or URL
+    :return list[dict] | None: cached schemas, or None if there is no entry
+        for the location or any of its sources changed
+    """
+    path = _entry_path(location)
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("version") != _CACHE_FORMAT_VERSION or entry["location"] != location:
+        return None
+    if not all(_is_source_current(loc, st) for loc, st in entry["sources"].items()):
+        _LOGGER.debug("Cached schema is stale: %s", location)
+        return None
+    _LOGGER.debug("Using cached schema: %s", location)
+    # mark the entry as recently used, for the eviction
+    os.utime(path)
+    return entry["schemas"]
+
+
+def store_schemas(location: str, sources, schemas, etags=None) -> None:
+    """
+    Cache the resolved schemas for a location
+
+    Schemas that do not survive a round-trip through JSON are not cached.
+
+    :param str location: absolute path to the schema file or URL
+    :param Iterable[str] sources: locations of all the schemas in the chain
+    :param list[dict] schemas: resolved schemas, as loaded
+    :param dict[str, str] etags: ETags the remote sources were fetched with
+    """
+    path = _entry_path(location)
+    entry = {
+        "version": _CACHE_FORMAT_VERSION,
+        "location": location,
+        "sources": {
+            loc: _get_source_state(loc, (etags or {}).get(loc)) for loc in sources
+        },
+        "schemas": schemas,
+    }
+    try:
+        data = json.dumps(entry, separators=(",", ":"))
+        round_trip = json.loads(data)["schemas"]
+    except (TypeError, ValueError):
+        round_trip = None
+    if round_trip != schemas:
+        _LOGGER.debug("Schema is not representable as JSON, not cached: %s", location)
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        _LOGGER.warning(f"Could not cache schema {location}: {e}")
+        return
+    prune_schema_cache()
+
+
+def list_cached_schemas():
+    """
+    List the schema cache entries, the most recently used first
+
+    :return list[dict]: location, path, size in bytes and time of last use
+        of every cache entry
+    """
+    cache_dir = get_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for dir_entry in os.scandir(cache_dir):
+        if not dir_entry.name.endswith(".json"):
+            continue
+        try:
+            with open(dir_entry.path) as f:
+                location = json.load(f).get("location")
+            st = dir_entry.stat()
+        except (OSError, ValueError):
+            location, st = None, dir_entry.stat()
+        entries.append(
+            {
+                "location": location,
+                "path": dir_entry.path,
+                "size": st.st_size,
+                "last_used": st.st_mtime,
+            }
+        )
+    return sorted(entries, key=lambda e: e["last_used"], reverse=True)
+
+
+def prune_schema_cache(max_size: int = None) -> int:
+    """
+    Evict the least recently used schema cache entries above the size limit
+
+    :param int max_size: maximum size of the cache in bytes, use 0 to clear
+        the cache. Defaults to the configured maximum size
+    :return int: number of evicted entries
+    """
+    max_size = _SETTINGS["max_size"] if max_size is None else max_size
+    entries = list_cached_schemas()
+    total = sum(e["size"] for e in entries)
+    evicted = 0
+    while entries and total > max_size:
+        entry = entries.pop()
+        try:
+            os.remove(entry["path"])
+        except OSError:
+            continue
+        total -= entry["size"]
+        evicted += 1
+    if evicted:
+        _LOGGER.debug("Evicted %d schema cache entries", evicted)
+    return evicted
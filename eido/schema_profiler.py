@@ -0,0 +1,216 @@
+"""
+Cost of every rule of a schema during validation
+
+While a SchemaProfiler is active, the validators eido compiles time every
+schema keyword they evaluate. The calls and times are summed by schema
+location, a JSON pointer to the keyword in the preprocessed schema, and
+ranked by self time, i.e. the time not spent in the nested keywords:
+
+    with SchemaProfiler() as profiler:
+        validate_project(project, schema)
+    print(profiler.format_report())
+
+The timing adds an overhead to every keyword, which is included in the self
+time of the enclosing ones, so the report is meant to rank the rules rather
+than to measure the validation time. Only the validation in the current
+process is profiled, not the one in worker processes.
+"""
+
+from contextvars import ContextVar
+from copy import deepcopy as dpcpy
+from logging import getLogger
+from threading import Lock, local
+from time import perf_counter
+from typing import Dict, List, Mapping
+
+_LOGGER = getLogger(__name__)
+
+# profiler the validators of the current thread or task are compiled for
+_SCHEMA_PROFILER = ContextVar("eido_schema_profiler", default=None)
+
+
+def get_schema_profiler():
+    """
+    Get the schema profiler active in the current context
+
+    :return SchemaProfiler | None: active profiler, if any
+    """
+    return _SCHEMA_PROFILER.get()
+
+
+def _escape(token) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _get_locations(schema, pointer="#", locations=None) -> Dict[int, str]:
+    """
+    Map all the subschemas of a schema to their JSON pointers
+
+    :param dict | list schema: schema to walk
+    :param str pointer: JSON pointer to the schema
+    :param dict[int, str] locations: mapping to update
+    :return dict[int, str]: JSON pointers by id of the subschema dicts
+    """
+    if locations is None:
+        locations = {}
+    if isinstance(schema, dict):
+        locations.setdefault(id(schema), pointer)
+        items = schema.items()
+    elif isinstance(schema, list):
+        items = enumerate(schema)
+    else:
+        return locations
+    for key, value in items:
+        _get_locations(value, f"{pointer}/{_escape(key)}", locations)
+    return locations
+
+
+class SchemaProfiler:
+    """
+    Record the number of evaluations and the time of every schema rule
+
+    Use as a context manager around the validation to profile.
+    """
+
+    def __init__(self):
+        self._validators = {}
+        self._locations = {}
+        self._totals = {}
+        self._lock = Lock()
+        self._local = local()
+        self._validator_class = None
+        self._token = None
+
+    def __enter__(self):
+        self._token = _SCHEMA_PROFILER.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _SCHEMA_PROFILER.reset(self._token)
+        return False
+
+    def get_validator(self, schema: Mapping):
+        """
+        Get a validator for a schema that times the keywords it evaluates
+
+        :param Mapping schema: preprocessed schema
+        :return jsonschema.Draft7Validator: timing validator for the schema
+        """
+        from .validation import _schema_fingerprint
+
+        key = _schema_fingerprint(schema)
+        with self._lock:
+            validator = self._validators.get(key)
+            if validator is not None:
+                return validator
+            if self._validator_class is None:
+                self._validator_class = self._make_validator_class()
+            # the copy is kept by the validator, so the ids of its subschemas
+            # stay valid as keys of the locations
+            schema = dpcpy(schema)
+            _get_locations(schema, locations=self._locations)
+            validator = self._validator_class(schema)
+            self._validators[key] = validator
+        return validator
+
+    def _make_validator_class(self):
+        from jsonschema import Draft7Validator, validators
+
+        return validators.extend(
+            Draft7Validator,
+            {
+                keyword: self._time_keyword(keyword, func)
+                for keyword, func in Draft7Validator.VALIDATORS.items()
+            },
+        )
+
+    def _time_keyword(self, keyword, func):
+        """
+        Wrap a keyword function to time its evaluation
+
+        The keyword functions yield their errors lazily, so the evaluation
+        is timed call by call, excluding the time the errors are consumed.
+        """
+
+        def _timed(validator, value, instance, schema):
+            location = self._locations.get(id(schema), "?") + "/" + _escape(keyword)
+            errors = self._timed_call(
+                location, 1, func, validator, value, instance, schema
+            )
+            if errors is None:
+                return
+            errors = iter(errors)
+            while True:
+                try:
+                    error = self._timed_call(location, 0, next, errors)
+                except StopIteration:
+                    return
+                yield error
+
+        return _timed
+
+    def _timed_call(self, location, count, func, *args):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        # time spent in the keywords nested in this call
+        nested = [0.0]
+        stack.append(nested)
+        start = perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self._lock:
+                totals = self._totals.get(location)
+                if totals is None:
+                    totals = self._totals[location] = [0, 0.0, 0.0]
+                totals[0] += count
+                totals[1] += elapsed
+                totals[2] += elapsed - nested[0]
+
+    def report(self) -> List[Dict]:
+        """
+        Get the cost of every evaluated schema rule, the most expensive first
+
+        :return list[dict]: location, keyword, number of evaluations, total
+            time, self time and share of the self time of all the rules
+        """
+        with self._lock:
+            totals = {k: list(v) for k, v in self._totals.items()}
+        overall = sum(t[2] for t in totals.values()) or 1.0
+        rows = [
+            {
+                "location": location,
+                "keyword": location.rsplit("/", 1)[-1],
+                "count": count,
+                "total": total,
+                "self": self_time,
+                "share": self_time / overall,
+            }
+            for location, (count, total, self_time) in totals.items()
+        ]
+        return sorted(rows, key=lambda r: r["self"], reverse=True)
+
+    def format_report(self, limit: int = None) -> str:
+        """
+        Get the report as a table
+
+        :param int limit: maximum number of rules to list
+        :return str: table of the most expensive schema rules
+        """
+        rows = self.report()[:limit]
+        width = max([len(r["location"]) for r in rows] + [8])
+        lines = [
+            f"{'location':<{width}}  {'count':>9}  {'total (s)':>10}  "
+            f"{'self (s)':>10}  {'self %':>6}"
+        ]
+        for r in rows:
+            lines.append(
+                f"{r['location']:<{width}}  {r['count']:>9}  {r['total']:>10.4f}  "
+                f"{r['self']:>10.4f}  {100 * r['share']:>6.1f}"
+            )
+        return "\n".join(lines)
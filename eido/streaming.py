@@ -0,0 +1,234 @@
+"""
+Bounded-memory validation of sample tables read in chunks
+
+The sample table is never loaded as a whole and no peppy.Project is created,
+so the peak memory depends on the chunk size rather than the project size.
+Sample modifiers defined in the project config are not applied, the rows are
+validated as they appear in the table.
+"""
+
+import csv
+from copy import deepcopy as dpcpy
+from logging import getLogger
+from typing import Iterable, TextIO, Union
+
+import pandas as pd
+from peppy.const import (
+    CFG_SAMPLE_TABLE_KEY,
+    CFG_SUBSAMPLE_TABLE_KEY,
+    SAMPLE_NAME_ATTR,
+    SAMPLE_TABLE_INDEX_KEY,
+)
+from peppy.utils import load_yaml, make_abs_via_cfg
+
+from .const import PROP_KEY, SAMPLES_KEY
+from .exceptions import EidoValidationError
+from .schema import preprocess_schema, read_schema
+from .table_validation import _get_labeled_sample_schemas, _iter_table_errors
+from .validation import (
+    _compose_schemas,
+    _get_config_schema,
+    _get_object_errors,
+    _group_schemas,
+)
+
+_LOGGER = getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# number of errors of each type kept in the exception raised at the end
+_MAX_KEPT_ERRORS = 49
+
+# the same parsing settings peppy uses for sample tables
+_READ_CSV_KWARGS = {
+    "dtype": str,
+    "index_col": False,
+    "keep_default_na": False,
+    "na_values": [""],
+}
+
+
+def _infer_separator(path: str) -> str:
+    """
+    Infer the separator of a sample table from its header
+
+    :param str path: path to the table
+    :return str: ',' or a tab, taken from the extension if the header
+        has a single column
+    """
+    with open(path, newline="") as f:
+        header = f.readline()
+    try:
+        return csv.Sniffer().sniff(header, delimiters=",\t").delimiter
+    except csv.Error:
+        return "\t" if path.endswith((".tsv", ".txt")) else ","
+
+
+def _read_table_chunks(path: str, chunk_size: int) -> Iterable[pd.DataFrame]:
+    """
+    Read a CSV or TSV sample table in chunks of rows
+
+    :param str path: path to the table
+    :param int chunk_size: number of rows in a chunk
+    :return Iterable[pandas.DataFrame]: chunks of the table
+    """
+    sep = _infer_separator(path)
+    with pd.read_csv(path, sep=sep, chunksize=chunk_size, **_READ_CSV_KWARGS) as r:
+        yield from r
+
+
+def _read_table_header(path: str) -> list:
+    """
+    Read the column names of a sample table
+
+    :param str path: path to the table
+    :return list[str]: column names
+    """
+    return list(pd.read_csv(path, sep=_infer_separator(path), nrows=0).columns)
+
+
+def _drop_required(sample_schema: dict, attributes) -> dict:
+    """
+    Get a sample schema that does not require the given attributes
+
+    :param dict sample_schema: sample-level schema
+    :param Iterable[str] attributes: attributes not to require
+    :return dict: the schema, or a shallow copy of it with fewer required
+    """
+    required = sample_schema.get("required")
+    if not required or not set(required) & set(attributes):
+        return sample_schema
+    return dict(sample_schema, required=[a for a in required if a not in attributes])
+
+
+def _get_pep_tables(pep: str):
+    """
+    Locate the sample and subsample tables of a PEP without reading them
+
+    :param str pep: path to a PEP config file or directly to a sample table
+    :return (dict | None, str | None, list[str]): project config, path to the
+        sample table and paths to the subsample tables
+    """
+    if pep.endswith((".csv", ".tsv")):
+        return None, pep, []
+    config = load_yaml(pep)
+    sample_table = config.get(CFG_SAMPLE_TABLE_KEY)
+    subsample_tables = config.get(CFG_SUBSAMPLE_TABLE_KEY) or []
+    if isinstance(subsample_tables, str):
+        subsample_tables = [subsample_tables]
+    return (
+        config,
+        make_abs_via_cfg(sample_table, pep) if sample_table else None,
+        [make_abs_via_cfg(t, pep) for t in subsample_tables],
+    )
+
+
+def iter_streamed_validation_errors(
+    pep: str,
+    schema: Union[str, dict],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    sample_table_index: str = None,
+) -> Iterable[dict]:
+    """
+    Validate a PEP reading its sample table in chunks and yield the errors
+
+    The config and the subsample tables are validated once, the sample table
+    is validated chunk by chunk. Subsample rows are validated against the
+    sample properties, with the required attributes not enforced. The sample
+    table rows are not required to have the attributes the subsample tables
+    provide.
+
+    :param str pep: path to a PEP config file or directly to a sample table
+    :param str | dict schema: schema dict to validate against or a path to one
+    :param int chunk_size: number of sample table rows validated at a time
+    :param str sample_table_index: name of the sample name column. Taken from
+        the config if not provided, 'sample_name' otherwise
+    :return Iterable[dict]: errors with type, message and sample name,
+        as they are found
+    """
+    schema_dicts = [preprocess_schema(s) for s in read_schema(schema=schema)]
+    config, sample_table, subsample_tables = _get_pep_tables(pep)
+    sample_table_index = (
+        sample_table_index
+        or (config or {}).get(SAMPLE_TABLE_INDEX_KEY)
+        or SAMPLE_NAME_ATTR
+    )
+
+    if config is not None:
+        config_schemas = [_get_config_schema(dpcpy(s)) for s in schema_dicts]
+        for group in _group_schemas(config_schemas):
+            config_schema, labels = _compose_schemas(group)
+            yield from _get_object_errors(
+                {"project": config}, config_schema, labels=labels
+            )
+    sample_schemas = _get_labeled_sample_schemas(schema_dicts)
+    if not sample_schemas:
+        return
+
+    subsample_schemas = [
+        ({"type": "object", PROP_KEY: s.get(PROP_KEY, {})}, label)
+        for s, label in sample_schemas
+    ]
+    # the attributes from the subsample tables are merged into the samples,
+    # so the sample table rows are not required to have them
+    subsample_columns = {
+        c for path in subsample_tables for c in _read_table_header(path)
+    }
+    sample_schemas = [
+        (_drop_required(s, subsample_columns), label) for s, label in sample_schemas
+    ]
+    for path in subsample_tables:
+        _LOGGER.debug("Validating subsample table: %s", path)
+        for chunk in _read_table_chunks(path, chunk_size):
+            for subsample_schema, label in subsample_schemas:
+                yield from _iter_table_errors(
+                    chunk, subsample_schema, sample_table_index, label
+                )
+
+    if sample_table is None:
+        return
+    _LOGGER.debug(
+        "Validating sample table in chunks of %d: %s", chunk_size, sample_table
+    )
+    for chunk in _read_table_chunks(sample_table, chunk_size):
+        for sample_schema, label in sample_schemas:
+            yield from _iter_table_errors(
+                chunk, sample_schema, sample_table_index, label
+            )
+
+
+def validate_project_stream(
+    pep: str,
+    schema: Union[str, dict],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    sample_table_index: str = None,
+    output: TextIO = None,
+) -> None:
+    """
+    Validate a PEP reading its sample table in chunks, with bounded memory
+
+    :param str pep: path to a PEP config file or directly to a sample table
+    :param str | dict schema: schema dict to validate against or a path to one
+    :param int chunk_size: number of sample table rows validated at a time
+    :param str sample_table_index: name of the sample name column
+    :param TextIO output: file to write the error messages to as they are found
+    :raises EidoValidationError: if validation is unsuccessful. To bound the
+        memory use, at most 49 errors of each type are kept in errors_by_type,
+        the total number of errors is reported in the message
+    """
+    errors_by_type = {}
+    n_errors = 0
+    for error in iter_streamed_validation_errors(
+        pep, schema, chunk_size=chunk_size, sample_table_index=sample_table_index
+    ):
+        n_errors += 1
+        if output is not None:
+            output.write(error["message"] + "\n")
+        kept = errors_by_type.setdefault(error["type"], [])
+        if len(kept) < _MAX_KEPT_ERRORS:
+            kept.append(error)
+    if errors_by_type:
+        raise EidoValidationError(
+            f"Validation failed, {n_errors} errors found", errors_by_type
+        )
+    _LOGGER.debug("Streamed validation successful")
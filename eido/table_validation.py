@@ -0,0 +1,370 @@
+"""
+Column-wise validation of sample tables
+
+Simple per-column schema keywords are checked for the whole column at once
+with pandas. Cells that fail the vectorized checks are re-validated with
+jsonschema, so error messages are identical to the row-wise validation.
+Keywords that can't be vectorized are validated row by row.
+"""
+
+from logging import getLogger
+from numbers import Number
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import peppy
+from peppy.const import SAMPLE_NAME_ATTR
+
+from .const import PROP_KEY, SAMPLES_KEY
+from .exceptions import EidoValidationError
+from .schema import preprocess_schema, read_schema
+from .validation import _get_schema_labels, _make_error, get_validator
+
+_LOGGER = getLogger(__name__)
+
+# keywords of the sample schema that are handled column-wise or ignored by
+# jsonschema altogether (eido-specific sections)
+_TABLE_KEYWORDS = {
+    "type",
+    "properties",
+    "required",
+    "tangible",
+    "sizing",
+    "files",
+    "required_files",
+    "description",
+    "title",
+    "$comment",
+}
+
+# keywords of a property schema that can be checked column-wise
+_VECTORIZABLE_KEYWORDS = {
+    "type",
+    "enum",
+    "pattern",
+    "minimum",
+    "maximum",
+    "exclusiveMinimum",
+    "exclusiveMaximum",
+    "minLength",
+    "maxLength",
+    "description",
+    "title",
+    "$comment",
+    "default",
+    "examples",
+}
+
+_VECTORIZABLE_TYPES = {"string", "number", "integer", "boolean"}
+
+
+def _elementwise(values: pd.Series, predicate) -> pd.Series:
+    return values.map(predicate).astype(bool)
+
+
+def _is_number(v):
+    return isinstance(v, Number) and not isinstance(v, bool)
+
+
+def _is_integer(v):
+    if isinstance(v, float):
+        return v.is_integer()
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+def _type_mask(values: pd.Series, type_name: str) -> pd.Series:
+    """
+    Check which values are instances of the JSON schema type
+
+    :param pandas.Series values: non-missing scalar values
+    :param str type_name: JSON schema type name
+    :return pandas.Series: boolean mask of values of the type
+    """
+    dtype = values.dtype
+    is_bool = pd.api.types.is_bool_dtype(dtype)
+    is_numeric = pd.api.types.is_numeric_dtype(dtype) and not is_bool
+    if type_name == "string":
+        if dtype != object and pd.api.types.is_string_dtype(dtype):
+            return pd.Series(True, index=values.index)
+        if is_numeric or is_bool:
+            return pd.Series(False, index=values.index)
+        return _elementwise(values, lambda v: isinstance(v, str))
+    if type_name == "number":
+        if is_numeric:
+            return pd.Series(True, index=values.index)
+        return _elementwise(values, _is_number)
+    if type_name == "integer":
+        if pd.api.types.is_integer_dtype(dtype) and not is_bool:
+            return pd.Series(True, index=values.index)
+        if pd.api.types.is_float_dtype(dtype):
+            return pd.Series(
+                np.isfinite(values) & (values == np.floor(values)), index=values.index
+            )
+        return _elementwise(values, _is_integer)
+    if type_name == "boolean":
+        if is_bool:
+            return pd.Series(True, index=values.index)
+        return _elementwise(values, lambda v: isinstance(v, bool))
+    raise ValueError(f"Type can't be checked column-wise: {type_name}")
+
+
+def _check_values(values: pd.Series, schema: dict) -> pd.Series:
+    """
+    Check the values against a vectorizable property schema
+
+    The check is conservative: a value may be flagged even though it is
+    valid, but a value that is not flagged is always valid.
+
+    :param pandas.Series values: scalar values to check
+    :param dict schema: vectorizable property schema
+    :return pandas.Series: boolean mask of the values that passed the checks
+    """
+    ok = pd.Series(True, index=values.index)
+    if values.empty:
+        return ok
+    types = schema.get("type")
+    if types is not None:
+        types = types if isinstance(types, list) else [types]
+        type_ok = pd.Series(False, index=values.index)
+        for type_name in types:
+            type_ok |= _type_mask(values, type_name)
+        ok &= type_ok
+    str_mask = _type_mask(values, "string")
+    if "enum" in schema:
+        ok &= str_mask & values.isin(schema["enum"])
+    if any(k in schema for k in ["pattern", "minLength", "maxLength"]):
+        strings = values[str_mask].astype(object)
+        if "pattern" in schema:
+            matched = strings.str.contains(schema["pattern"], regex=True)
+            ok &= ~str_mask | matched.reindex(values.index, fill_value=False)
+        lengths = strings.str.len().reindex(values.index, fill_value=0)
+        if "minLength" in schema:
+            ok &= ~str_mask | (lengths >= schema["minLength"])
+        if "maxLength" in schema:
+            ok &= ~str_mask | (lengths <= schema["maxLength"])
+    bounds = {
+        "minimum": lambda x, b: x >= b,
+        "maximum": lambda x, b: x <= b,
+        "exclusiveMinimum": lambda x, b: x > b,
+        "exclusiveMaximum": lambda x, b: x < b,
+    }
+    if any(k in schema for k in bounds):
+        num_mask = _type_mask(values, "number")
+        numbers = pd.to_numeric(values.where(num_mask), errors="coerce")
+        for keyword, compare in bounds.items():
+            if keyword in schema:
+                ok &= ~num_mask | compare(numbers, schema[keyword]).fillna(False)
+    return ok
+
+
+def _split_property_schema(prop_schema):
+    """
+    Determine how a property schema can be checked column-wise
+
+    Preprocessed schemas wrap simple types in an 'anyOf', which allows either
+    a value or an array of such values (that come from subsample tables).
+
+    :param dict prop_schema: preprocessed property schema
+    :return (dict, bool) | None: the scalar value schema and whether lists
+        of values are allowed, or None if the schema can't be vectorized
+    """
+    value_schema, allow_lists = prop_schema, False
+    any_of = prop_schema.get("anyOf")
+    if (
+        set(prop_schema) == {"anyOf"}
+        and isinstance(any_of, list)
+        and len(any_of) == 2
+        and any_of[1] == {"type": "array", "items": any_of[0]}
+    ):
+        value_schema, allow_lists = any_of[0], True
+    if not isinstance(value_schema, dict) or not value_schema:
+        return None
+    if set(value_schema) - _VECTORIZABLE_KEYWORDS:
+        return None
+    types = value_schema.get("type", [])
+    types = types if isinstance(types, list) else [types]
+    if set(types) - _VECTORIZABLE_TYPES:
+        return None
+    if "enum" in value_schema and not all(
+        isinstance(e, str) for e in value_schema["enum"]
+    ):
+        return None
+    return value_schema, allow_lists
+
+
+def _plan_sample_schema(sample_schema):
+    """
+    Split a sample schema into the column-wise and the row-wise parts
+
+    :param dict sample_schema: preprocessed sample-level schema
+    :return (dict, dict | None): vectorizable properties as a mapping of
+        property names to (property schema, value schema, allow lists)
+        tuples, and the residual schema to validate row by row, if any
+    """
+    residual = {k: v for k, v in sample_schema.items() if k not in _TABLE_KEYWORDS}
+    if sample_schema.get("type", "object") != "object":
+        residual["type"] = sample_schema["type"]
+    properties = sample_schema.get(PROP_KEY, {})
+    if "additionalProperties" in residual or "patternProperties" in residual:
+        # these depend on the whole set of properties, validate row-wise
+        return {}, dict(residual, **{PROP_KEY: properties})
+    vectorized, row_wise = {}, {}
+    for prop, prop_schema in properties.items():
+        split = _split_property_schema(prop_schema)
+        if split is None:
+            row_wise[prop] = prop_schema
+        else:
+            vectorized[prop] = (prop_schema, *split)
+    if row_wise:
+        residual[PROP_KEY] = row_wise
+    return vectorized, residual or None
+
+
+def _is_list(v):
+    return isinstance(v, list)
+
+
+def _to_native(v):
+    # jsonschema does not consider numpy scalars instances of JSON types
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def _get_table_errors(table: pd.DataFrame, sample_schema):
+    """
+    Validate a sample table against a sample schema, column by column
+
+    :param pandas.DataFrame table: sample table, one sample per row
+    :param dict sample_schema: preprocessed sample-level schema
+    :return list[(int, tuple, str)]: row index, path and message of every
+        error, in the order jsonschema would report them
+    """
+    table = table.reset_index(drop=True)
+    errors = []
+    vectorized, residual = _plan_sample_schema(sample_schema)
+
+    for attr in sample_schema.get("required", []):
+        if attr in table.columns:
+            col = table[attr]
+            missing = col.isna() & ~_elementwise(col, _is_list)
+        else:
+            missing = pd.Series(True, index=table.index)
+        if missing.any():
+            message = next(get_validator({"required": [attr]}).iter_errors({}))
+            for row in missing.index[missing]:
+                errors.append((row, (), message.message))
+
+    for prop, (prop_schema, value_schema, allow_lists) in vectorized.items():
+        if prop not in table.columns:
+            continue
+        col = table[prop]
+        if col.dtype == object:
+            is_list = _elementwise(col, _is_list)
+        else:
+            is_list = pd.Series(False, index=col.index)
+        scalars = ~col.isna() & ~is_list
+        suspect = ~_check_values(col[scalars], value_schema).reindex(
+            col.index, fill_value=True
+        )
+        if is_list.any():
+            if allow_lists:
+                exploded = col[is_list].explode()
+                lists_ok = _check_values(exploded, value_schema).groupby(level=0).all()
+                suspect |= ~lists_ok.reindex(col.index, fill_value=True)
+            else:
+                suspect |= is_list
+        if suspect.any():
+            validator = get_validator(prop_schema)
+            for row in suspect.index[suspect]:
+                for error in validator.iter_errors(_to_native(col.iat[row])):
+                    errors.append((row, (prop, *error.path), error.message))
+
+    if residual is not None:
+        _LOGGER.debug("Validating row-wise: %s", list(residual))
+        validator = get_validator(residual)
+        for row, record in enumerate(table.to_dict(orient="records")):
+            record = {k: v for k, v in record.items() if _is_list(v) or not pd.isna(v)}
+            for error in validator.iter_errors(record):
+                errors.append((row, tuple(error.path), error.message))
+
+    errors.sort(key=lambda e: (e[0], e[1]))
+    return errors
+
+
+def _iter_table_errors(
+    table: pd.DataFrame, sample_schema, sample_name_colname, schema_label=None
+):
+    """
+    Validate a sample table and yield the structured errors in row order
+
+    :param pandas.DataFrame table: sample table, one sample per row
+    :param dict sample_schema: preprocessed sample-level schema
+    :param str sample_name_colname: name of the sample name column
+    :param str schema_label: label of the schema to attribute the errors to
+    :return Iterable[dict]: errors with type, message and sample name
+    """
+    errors = _get_table_errors(table, sample_schema)
+    if not errors:
+        return
+    if sample_name_colname in table.columns:
+        names = table[sample_name_colname].tolist()
+    else:
+        names = ["project"] * len(table)
+    for row, _, message in errors:
+        name = names[row]
+        if not isinstance(name, str) and pd.isna(name):
+            name = "project"
+        yield _make_error(message, name, schema_label)
+
+
+def _get_labeled_sample_schemas(schema_dicts):
+    """
+    Extract the sample-level parts of preprocessed schemas
+
+    The schemas are labeled the same way as when they are combined for
+    row-wise validation, so that the errors are attributed the same way.
+
+    :param list[dict] schema_dicts: preprocessed schemas
+    :return list[(dict, str | None)]: sample schemas and their labels
+    """
+    labels = _get_schema_labels(schema_dicts) if len(schema_dicts) > 1 else None
+    return [
+        (s[PROP_KEY][SAMPLES_KEY]["items"], labels[idx] if labels else None)
+        for idx, s in enumerate(schema_dicts)
+        if "items" in s.get(PROP_KEY, {}).get(SAMPLES_KEY, {})
+    ]
+
+
+def validate_sample_table(
+    table: Union[pd.DataFrame, peppy.Project],
+    schema: Union[str, dict],
+    sample_name_colname: str = None,
+) -> None:
+    """
+    Validate a sample table against the samples section of a schema
+
+    Simple per-column rules (type, enum, pattern, minimum/maximum, required)
+    are checked for whole columns at once, all the other rules are checked
+    row by row. Missing values are treated as absent attributes.
+
+    :param pandas.DataFrame | peppy.Project table: sample table to validate or
+        a project to validate the sample table of
+    :param str | dict schema: schema dict to validate against or a path to one
+    :param str sample_name_colname: name of the column that holds sample names.
+        Taken from the project if not provided, 'sample_name' otherwise
+    :raises EidoValidationError: if validation is unsuccessful
+    """
+    if isinstance(table, peppy.Project):
+        sample_name_colname = sample_name_colname or table.sample_name_colname
+        table = table.sample_table
+    sample_name_colname = sample_name_colname or SAMPLE_NAME_ATTR
+    schema_dicts = [preprocess_schema(s) for s in read_schema(schema=schema)]
+    errors_by_type = {}
+    for sample_schema, label in _get_labeled_sample_schemas(schema_dicts):
+        for error in _iter_table_errors(
+            table, sample_schema, sample_name_colname, label
+        ):
+            errors_by_type.setdefault(error["type"], []).append(error)
+    if errors_by_type:
+        raise EidoValidationError("Validation failed", errors_by_type)
+    _LOGGER.debug("Sample table validation successful")
@@ -1,5 +1,14 @@
+from __future__ import annotations
+
+import hashlib
+import json
 import os
-from typing import Mapping, Union
+from collections import OrderedDict, namedtuple
+from collections.abc import Iterable
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from threading import Lock
+from typing import TYPE_CHECKING, Iterator, Mapping, Union
 from copy import deepcopy as dpcpy
 from logging import getLogger
 
@@ -7,97 +16,571 @@ from warnings import warn
 
 from .exceptions import EidoValidationError
 
-from pandas.core.common import flatten
-from jsonschema import Draft7Validator
-import peppy
-
-from .const import PROP_KEY, SIZING_KEY, TANGIBLE_KEY, SAMPLES_KEY
+from .const import (
+    ALL_INPUTS_KEY,
+    MISSING_INPUTS_KEY,
+    MISSING_KEY,
+    PROP_KEY,
+    REQUIRED_INPUTS_KEY,
+    SAMPLES_KEY,
+    SIZING_KEY,
+    TANGIBLE_KEY,
+)
+from .debug_trace import trace_event
 from .exceptions import PathAttrNotFoundError
+from .file_probe import StatCache
+from .instrumentation import instrumented, span
 from .schema import preprocess_schema, read_schema
+from .schema_profiler import get_schema_profiler
+
+if TYPE_CHECKING:
+    import peppy
+    from jsonschema import Draft7Validator
 
 _LOGGER = getLogger(__name__)
 
+ValidatorCacheInfo = namedtuple(
+    "ValidatorCacheInfo", ["hits", "misses", "maxsize", "currsize"]
+)
+
+_VALIDATOR_CACHE = OrderedDict()
+_VALIDATOR_CACHE_LOCK = Lock()
+_VALIDATOR_CACHE_STATS = {"hits": 0, "misses": 0, "maxsize": 128}
+
+# keywords that describe a schema without constraining the instances
+_ANNOTATION_KEYWORDS = frozenset(
+    {
+        "$comment",
+        "$id",
+        "$schema",
+        "default",
+        "description",
+        "examples",
+        "readOnly",
+        "title",
+        "writeOnly",
+    }
+)
+
+
+def _schema_fingerprint(schema: Mapping) -> str:
+    """
+    Compute a canonical content hash of a schema
+
+    Key order does not affect the result, so two equal schemas always
+    share a fingerprint regardless of how they were constructed.
+
+    :param Mapping schema: schema to fingerprint
+    :return str: hex digest of the canonical JSON serialization of the schema
+    """
+    canonical = json.dumps(schema, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def get_validator(schema: Mapping) -> Draft7Validator:
+    """
+    Get a compiled validator for a schema, reusing a cached one if possible
+
+    Validators are kept in a process-wide, size-bounded LRU cache keyed by
+    the schema fingerprint. The schema is expected to be preprocessed already.
+    While a SchemaProfiler is active, its timing validators are used instead.
+
+    :param Mapping schema: schema to compile a validator for
+    :return jsonschema.Draft7Validator: validator for the schema
+    """
+    profiler = get_schema_profiler()
+    if profiler is not None:
+        return profiler.get_validator(schema)
+    key = _schema_fingerprint(schema)
+    with _VALIDATOR_CACHE_LOCK:
+        validator = _VALIDATOR_CACHE.get(key)
+        if validator is not None:
+            _VALIDATOR_CACHE.move_to_end(key)
+            _VALIDATOR_CACHE_STATS["hits"] += 1
+            return validator
+        _VALIDATOR_CACHE_STATS["misses"] += 1
+    from jsonschema import Draft7Validator
+
+    # compile on a private copy, so later changes to the caller's dict
+    # do not leak into the cached validator
+    validator = Draft7Validator(dpcpy(schema))
+    with _VALIDATOR_CACHE_LOCK:
+        _VALIDATOR_CACHE[key] = validator
+        _VALIDATOR_CACHE.move_to_end(key)
+        while len(_VALIDATOR_CACHE) > _VALIDATOR_CACHE_STATS["maxsize"]:
+            _VALIDATOR_CACHE.popitem(last=False)
+    return validator
+
+
+def validator_cache_info() -> ValidatorCacheInfo:
+    """
+    Report compiled validator cache statistics
+
+    :return ValidatorCacheInfo: hits, misses, maxsize and current size
+    """
+    with _VALIDATOR_CACHE_LOCK:
+        return ValidatorCacheInfo(
+            hits=_VALIDATOR_CACHE_STATS["hits"],
+            misses=_VALIDATOR_CACHE_STATS["misses"],
+            maxsize=_VALIDATOR_CACHE_STATS["maxsize"],
+            currsize=len(_VALIDATOR_CACHE),
+        )
+
+
+def clear_validator_cache(maxsize: int = None) -> None:
+    """
+    Remove all compiled validators from the cache and reset its statistics
+
+    :param int maxsize: new maximum number of cached validators, if provided
+    """
+    if maxsize is not None and maxsize < 1:
+        raise ValueError(f"Validator cache size has to be positive, got: {maxsize}")
+    with _VALIDATOR_CACHE_LOCK:
+        _VALIDATOR_CACHE.clear()
+        _VALIDATOR_CACHE_STATS["hits"] = 0
+        _VALIDATOR_CACHE_STATS["misses"] = 0
+        if maxsize is not None:
+            _VALIDATOR_CACHE_STATS["maxsize"] = maxsize
+
+
+def _get_instance_name(error, obj, sample_name_colname):
+    """
+    Determine the name of the instance a validation error was found in
+
+    :param jsonschema.ValidationError error: validation error
+    :param Mapping obj: the validated object
+    :param str sample_name_colname: name of the sample name attribute
+    :return str: sample name or 'project'
+    """
+    try:
+        return error.instance[sample_name_colname]
+    except KeyError:
+        return "project"
+    except TypeError:
+        return obj["samples"][error.absolute_path[1]][sample_name_colname]
+
+
+def _has_refs(schema) -> bool:
+    if isinstance(schema, dict):
+        return "$ref" in schema or any(_has_refs(v) for v in schema.values())
+    if isinstance(schema, list):
+        return any(_has_refs(v) for v in schema)
+    return False
+
+
+def _group_schemas(schemas):
+    """
+    Group schemas that can be combined and validated against in one pass
+
+    All the schemas of an import chain form a single group, unless any of
+    them uses references, which are resolved against the root of the schema
+    they come from. Such schemas are validated against one by one.
+
+    :param list[dict] schemas: preprocessed schemas
+    :return list[list[dict]]: groups of schemas
+    """
+    if any(_has_refs(schema) for schema in schemas):
+        return [[schema] for schema in schemas]
+    return [list(schemas)] if schemas else []
+
+
+def _get_schema_labels(schemas):
+    """
+    Label schemas with their descriptions or positions in the import chain
+
+    :param list[dict] schemas: preprocessed schemas
+    :return list[str]: labels of the schemas
+    """
+    return [
+        schema.get("description") or f"schema {idx}"
+        for idx, schema in enumerate(schemas)
+    ]
+
+
+def _compose_schemas(schemas, labels=None):
+    """
+    Combine a group of schemas into a single 'allOf' schema
+
+    :param list[dict] schemas: preprocessed schemas
+    :param list[str] labels: labels of the schemas, if the schemas are parts
+        of the labeled ones
+    :return (dict, list[str] | None): combined schema and the labels of the
+        schemas it is made of, in order, used to attribute the errors
+    """
+    if len(schemas) == 1:
+        return schemas[0], None
+    return {"allOf": schemas}, labels or _get_schema_labels(schemas)
+
+
+def _get_error_schema(error, labels):
+    """
+    Get the label of the schema a validation error comes from
+
+    :param jsonschema.ValidationError error: validation error
+    :param list[str] labels: labels of the schemas in the combined schema
+    :return str | None: label of the schema, if the schema was combined
+    """
+    if labels is None:
+        return None
+    return labels[error.absolute_schema_path[1]]
+
+
+def _get_object_errors(
+    obj: Mapping, schema: dict, sample_name_colname=False, labels=None
+):
+    """
+    Validate object against a schema and yield the structured errors
+
+    :param Mapping obj: an object to validate
+    :param dict schema: preprocessed schema dict to validate against
+    :param str sample_name_colname: name of the sample name attribute
+    :param list[str] labels: labels of the schemas in a combined schema
+    :return Iterable[dict]: errors with type, message and sample name
+    """
+    for error in get_validator(schema).iter_errors(obj):
+        yield _make_error(
+            error.message,
+            _get_instance_name(error, obj, sample_name_colname),
+            _get_error_schema(error, labels),
+        )
 
-def _validate_object(obj: Mapping, schema: Union[str, dict], sample_name_colname=False):
+
+def _validate_object(
+    obj: Mapping,
+    schema: Union[str, dict],
+    sample_name_colname=False,
+    max_errors: int = None,
+    labels=None,
+):
     """
     Generic function to validate object against a schema
 
+    The object is walked once and the validation stops as soon as
+    the maximum number of errors is reached.
+
     :param Mapping obj: an object to validate
     :param str | dict schema: schema dict to validate against or a path to one
         from the error. Useful when used ith large projects
+    :param int max_errors: maximum number of errors to collect
+    :param list[str] labels: labels of the schemas in a combined schema
 
     :raises EidoValidationError: if validation is unsuccessful
     """
-    validator = Draft7Validator(schema)
-    _LOGGER.debug(f"{obj},\n {schema}")
-    if not validator.is_valid(obj):
-        errors = sorted(validator.iter_errors(obj), key=lambda e: e.path)
-        errors_by_type = {}
-
-        # Accumulate and restructure error objects by error type
+    # the object may be a whole project, so it is only rendered if logged
+    _LOGGER.debug("%s,\n %s", obj, schema)
+    with span("validation.evaluate"):
+        errors = list(
+            islice(
+                _get_object_errors(obj, schema, sample_name_colname, labels),
+                max_errors,
+            )
+        )
+    trace_event("validation.object", object=obj, schema=schema, errors=errors)
+    errors_by_type = {}
+    # Accumulate and restructure error objects by error type
+    with span("validation.group_errors"):
         for error in errors:
-            if not error.message in errors_by_type:
-                errors_by_type[error.message] = []
-
-            try:
-                instance_name = error.instance[sample_name_colname]
-            except KeyError:
-                instance_name = "project"
-            except TypeError:
-                instance_name = obj["samples"][error.absolute_path[1]][
-                    sample_name_colname
-                ]
-            errors_by_type[error.message].append(
-                {
-                    "type": error.message,
-                    "message": f"{error.message} on instance {instance_name}",
-                    "sample_name": instance_name,
-                }
+            errors_by_type.setdefault(error["type"], []).append(error)
+    if errors_by_type:
+        raise EidoValidationError("Validation failed", errors_by_type)
+    _LOGGER.debug("Validation was successful...")
+
+
+def iter_validation_errors(
+    project: peppy.Project,
+    schema: Union[str, dict],
+    fail_fast: bool = False,
+    max_errors: int = None,
+) -> Iterator[dict]:
+    """
+    Validate a project object against a schema and yield the errors
+
+    The schema and its imports are combined, so the project is walked once
+    and errors are yielded as they are found. The validation can be stopped
+    at any point.
+
+    :param peppy.Project project: a project object to validate
+    :param str | dict schema: schema dict to validate against or a path to one
+    :param bool fail_fast: whether to stop at the first error
+    :param int max_errors: maximum number of errors to yield
+    :return Iterator[dict]: errors with type, message and sample name
+    """
+    if fail_fast:
+        max_errors = 1
+
+    def _iter_project_errors():
+        schema_dicts = [preprocess_schema(s) for s in read_schema(schema=schema)]
+        with span("validation.to_dict"):
+            project_dict = project.to_dict()
+        for group in _group_schemas(schema_dicts):
+            schema_dict, labels = _compose_schemas(group)
+            yield from _get_object_errors(
+                project_dict, schema_dict, project.sample_name_colname, labels
             )
 
-        raise EidoValidationError("Validation failed", errors_by_type)
-    else:
-        _LOGGER.debug("Validation was successful...")
+    return islice(_iter_project_errors(), max_errors)
+
 
+def _make_error(message, instance_name, schema=None):
+    """
+    Structure a validation error
 
-def validate_project(project: peppy.Project, schema: Union[str, dict]) -> None:
+    :param str message: error message, used as the error type
+    :param str instance_name: name of the instance the error was found in
+    :param str schema: label of the schema the error comes from, reported
+        only if several schemas were validated against at once
+    :return dict: error with type, message and sample name
+    """
+    error = {
+        "type": message,
+        "message": f"{message} on instance {instance_name}",
+        "sample_name": instance_name,
+    }
+    if schema is not None:
+        error["schema"] = schema
+    return error
+
+
+@instrumented("validation.project")
+def validate_project(
+    project: peppy.Project,
+    schema: Union[str, dict],
+    workers: int = None,
+    chunk_size: int = None,
+    max_errors: int = None,
+) -> None:
     """
     Validate a project object against a schema
 
+    The schema and its imports are combined, so the project is walked once.
+    With more than one worker the config is validated once and the samples
+    are validated in chunks, in a pool of processes.
+
     :param peppy.Project project: a project object to validate
     :param str | dict schema: schema dict to validate against or a path to one
     from the error. Useful when used ith large projects
+    :param int workers: number of worker processes to validate samples with.
+        Use a non-positive number to use all available CPUs. Validate in a
+        single pass in the current process by default
+    :param int chunk_size: number of samples validated by one worker at a time
+    :param int max_errors: maximum number of errors to collect before
+        the validation is stopped
 
     :return: None
     :raises EidoValidationError: if validation is unsuccessful
+    :raises ValueError: if chunk_size or max_errors is not positive
     """
+    for name, value in (("chunk_size", chunk_size), ("max_errors", max_errors)):
+        if value is not None and value < 1:
+            raise ValueError(f"{name} has to be a positive integer, got: {value}")
     sample_name_colname = project.sample_name_colname
-    schema_dicts = read_schema(schema=schema)
-    for schema_dict in schema_dicts:
+    schema_dicts = [preprocess_schema(s) for s in read_schema(schema=schema)]
+    if workers is not None and workers <= 0:
+        workers = os.cpu_count() or 1
+    if workers is not None and workers > 1:
+        for group in _group_schemas(schema_dicts):
+            _validate_project_parallel(project, group, workers, chunk_size, max_errors)
+            _LOGGER.debug("Project validation successful")
+        return
+    with span("validation.to_dict"):
         project_dict = project.to_dict()
+    for group in _group_schemas(schema_dicts):
+        schema_dict, labels = _compose_schemas(group)
         _validate_object(
-            project_dict, preprocess_schema(schema_dict), sample_name_colname
+            project_dict,
+            schema_dict,
+            sample_name_colname,
+            max_errors=max_errors,
+            labels=labels,
         )
         _LOGGER.debug("Project validation successful")
 
 
-def _validate_sample_object(sample: peppy.Sample, schemas):
+def _get_config_schema(schema_cpy):
+    """
+    Remove the samples section from a preprocessed schema, in place
+
+    :param dict schema_cpy: a copy of the preprocessed schema
+    :return dict: schema that validates just the config part of a project
+    """
+    try:
+        del schema_cpy[PROP_KEY][SAMPLES_KEY]
+    except KeyError:
+        pass
+    if "required" in schema_cpy:
+        try:
+            schema_cpy["required"].remove(SAMPLES_KEY)
+        except ValueError:
+            pass
+    return schema_cpy
+
+
+def _validate_sample_chunk(
+    sample_dicts, sample_schema, sample_name_colname, max_errors=None, labels=None
+):
+    """
+    Validate a chunk of sample dicts against a sample schema
+
+    This is the unit of work for the worker processes, so it takes and
+    returns only picklable objects.
+
+    :param list[dict] sample_dicts: samples to validate
+    :param dict sample_schema: preprocessed sample-level schema
+    :param str sample_name_colname: name of the sample name attribute
+    :param int max_errors: maximum number of errors to collect
+    :param list[str] labels: labels of the schemas in a combined schema
+    :return list[dict]: errors found in the chunk
+    """
+    validator = get_validator(sample_schema)
+    errors = (
+        _make_error(
+            error.message,
+            sample_dict.get(sample_name_colname, "project"),
+            _get_error_schema(error, labels),
+        )
+        for sample_dict in sample_dicts
+        for error in validator.iter_errors(sample_dict)
+    )
+    return list(islice(errors, max_errors))
+
+
+@instrumented("validation.parallel")
+def _validate_project_parallel(
+    project, schema_dicts, workers, chunk_size=None, max_errors=None
+):
+    """
+    Validate the config once and the samples in chunks in a process pool
+
+    Schemas that constrain the samples array itself (e.g. with minItems) need
+    all the samples at once, so they are validated in a single pass instead.
+    Annotations, e.g. a description of the array, do not count.
+
+    :param peppy.Project project: a project object to validate
+    :param list[dict] schema_dicts: preprocessed schemas to validate against,
+        combined
+    :param int workers: number of worker processes
+    :param int chunk_size: number of samples validated by one worker at a time
+    :param int max_errors: maximum number of errors to collect, no more chunks
+        are submitted once this many errors were found
+    :raises EidoValidationError: if validation is unsuccessful
+    """
+    sample_name_colname = project.sample_name_colname
+    samples_schemas = [s.get(PROP_KEY, {}).get(SAMPLES_KEY) or {} for s in schema_dicts]
+    array_keywords = set().union(*samples_schemas) - {"type", "items"}
+    array_keywords -= _ANNOTATION_KEYWORDS
+    if array_keywords:
+        _LOGGER.debug(
+            f"Samples array constrained by {', '.join(sorted(array_keywords))}, "
+            "validating in a single process"
+        )
+        schema_dict, labels = _compose_schemas(schema_dicts)
+        _validate_object(
+            project.to_dict(),
+            schema_dict,
+            sample_name_colname,
+            max_errors=max_errors,
+            labels=labels,
+        )
+        return
+
+    labels = _get_schema_labels(schema_dicts) if len(schema_dicts) > 1 else None
+    config_schema, _ = _compose_schemas(
+        [_get_config_schema(dpcpy(s)) for s in schema_dicts]
+    )
+    errors = list(
+        islice(
+            _get_object_errors(
+                {"project": project.config}, config_schema, labels=labels
+            ),
+            max_errors,
+        )
+    )
+
+    def _limit_reached():
+        if max_errors is None:
+            return False
+        found = len(errors) + sum(
+            len(f.result()) for f in futures if f.done() and not f.exception()
+        )
+        return found >= max_errors
+
+    samples = project.samples
+    futures = []
+    if any("items" in s for s in samples_schemas) and samples:
+        sample_schema, _ = _compose_schemas(
+            [s.get("items", {}) for s in samples_schemas]
+        )
+        if chunk_size is None:
+            chunk_size = min(1000, -(-len(samples) // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # keep a bounded number of chunks in flight, so that sample dicts
+            # are not materialized for the whole project at once
+            pending = set()
+            for start in range(0, len(samples), chunk_size):
+                if len(pending) >= workers * 2:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                if _limit_reached():
+                    break
+                future = executor.submit(
+                    _validate_sample_chunk,
+                    [s.to_dict() for s in samples[start : start + chunk_size]],
+                    sample_schema,
+                    sample_name_colname,
+                    max_errors,
+                    labels,
+                )
+                pending.add(future)
+                futures.append(future)
+    # merge in chunk order, so that errors are reported in sample order
+    for future in futures:
+        errors.extend(future.result())
+
+    errors_by_type = {}
+    for error in islice(errors, max_errors):
+        errors_by_type.setdefault(error["type"], []).append(error)
+    if errors_by_type:
+        raise EidoValidationError("Validation failed", errors_by_type)
+
+
+def _get_sample_schemas(schemas):
+    """
+    Preprocess the schemas and combine the sample-level parts of them
+
+    :param list[dict] schemas: list of schemas to extract sample schemas from
+    :return list[(dict, list[str] | None)]: combined sample schemas, with the
+        labels of the schemas they are made of
+    """
+    schemas = [preprocess_schema(schema_dict) for schema_dict in schemas]
+    sample_schemas = [s[PROP_KEY][SAMPLES_KEY]["items"] for s in schemas]
+    groups = _group_schemas(sample_schemas)
+    if len(groups) == 1:
+        return [_compose_schemas(groups[0], _get_schema_labels(schemas))]
+    return [_compose_schemas(group) for group in groups]
+
+
+def _validate_sample_object(sample: peppy.Sample, schemas, sample_schemas=None):
     """
     Internal function that allows to validate a peppy.Sample object without
     requiring a reference to peppy.Project.
 
     :param peppy.Sample sample: a sample object to validate
     :param list[dict] schemas: list of schemas to validate against or a path to one
+    :param list[(dict, list[str] | None)] sample_schemas: already combined
+        sample schemas, as returned by _get_sample_schemas, used instead of the
+        schemas to avoid preprocessing them for every sample
     """
-    for schema_dict in schemas:
-        schema_dict = preprocess_schema(schema_dict)
-        sample_schema_dict = schema_dict[PROP_KEY][SAMPLES_KEY]["items"]
-        _validate_object(sample.to_dict(), sample_schema_dict)
+    if sample_schemas is None:
+        sample_schemas = _get_sample_schemas(schemas)
+    with span("validation.to_dict"):
+        sample_dict = sample.to_dict()
+    for sample_schema_dict, labels in sample_schemas:
+        _validate_object(sample_dict, sample_schema_dict, labels=labels)
         _LOGGER.debug(
-            f"{getattr(sample, 'sample_name', '')} sample validation successful"
+            "%s sample validation successful", getattr(sample, "sample_name", "")
         )
 
 
+@instrumented("validation.sample")
 def validate_sample(
     project: peppy.Project, sample_name: Union[str, int], schema: Union[str, dict]
 ) -> None:
@@ -121,6 +604,7 @@ def validate_sample(
     )
 
 
+@instrumented("validation.config")
 def validate_config(
     project: Union[peppy.Project, dict], schema: Union[str, dict]
 ) -> None:
@@ -130,25 +614,33 @@ def validate_config(
     :param peppy.Project project: a project object to validate
     :param str | dict schema: schema dict to validate against or a path to one
     """
-    schema_dicts = read_schema(schema=schema)
-    for schema_dict in schema_dicts:
-        schema_cpy = preprocess_schema(dpcpy(schema_dict))
-        try:
-            del schema_cpy[PROP_KEY][SAMPLES_KEY]
-        except KeyError:
-            pass
-        if "required" in schema_cpy:
-            try:
-                schema_cpy["required"].remove(SAMPLES_KEY)
-            except ValueError:
-                pass
-        if isinstance(project, dict):
-            _validate_object({"project": project}, schema_cpy)
+    config_schemas = [
+        _get_config_schema(preprocess_schema(dpcpy(schema_dict)))
+        for schema_dict in read_schema(schema=schema)
+    ]
+    if isinstance(project, dict):
+        project_dict = {"project": project}
+    else:
+        with span("validation.to_dict"):
+            project_dict = project.to_dict()
+    for group in _group_schemas(config_schemas):
+        schema_cpy, labels = _compose_schemas(group)
+        _validate_object(project_dict, schema_cpy, labels=labels)
+        _LOGGER.debug("Config validation successful")
+
+
+def _flatten(values):
+    """
+    Flatten nested iterables of values, leaving strings intact
 
+    :param Iterable values: values to flatten
+    :return Iterable: flattened values
+    """
+    for value in values:
+        if isinstance(value, Iterable) and not isinstance(value, str):
+            yield from _flatten(value)
         else:
-            project_dict = project.to_dict()
-            _validate_object(project_dict, schema_cpy)
-            _LOGGER.debug("Config validation successful")
+            yield value
 
 
 def _get_attr_values(obj, attrlist):
@@ -169,33 +661,53 @@ def _get_attr_values(obj, attrlist):
     if not isinstance(attrlist, list):
         attrlist = [attrlist]
     # Strings contained here are appended later so shouldn't be null.
-    return list(flatten([getattr(obj, attr, "") for attr in attrlist]))
+    return list(_flatten([getattr(obj, attr, "") for attr in attrlist]))
 
 
-def validate_input_files(
+def _get_sample_inputs(sample, schema):
+    """
+    Get the required and all input files of a sample
+
+    :param peppy.Sample sample: sample to get the inputs of
+    :param dict schema: schema that defines the input attributes
+    :return (set[str], set[str]): required inputs and all inputs
+    """
+    all_inputs = set()
+    required_inputs = set()
+    sample_schema_dict = schema[PROP_KEY][SAMPLES_KEY]["items"]
+    if SIZING_KEY in sample_schema_dict:
+        all_inputs.update(_get_attr_values(sample, sample_schema_dict[SIZING_KEY]))
+    if TANGIBLE_KEY in sample_schema_dict:
+        required_inputs = set(
+            _get_attr_values(sample, sample_schema_dict[TANGIBLE_KEY])
+        )
+        all_inputs.update(required_inputs)
+    return required_inputs, all_inputs
+
+
+@instrumented("validation.input_files")
+def get_missing_input_files(
     project: peppy.Project,
     schemas: Union[str, dict],
     sample_name: Union[str, int] = None,
-):
+    stat_cache: StatCache = None,
+) -> dict:
     """
-    Determine which of the required and optional files are missing.
-
-    The names of the attributes that are required and/or deemed as inputs
-    are sourced from the schema, more specifically from `required_files`
-    and `files` sections in samples section:
-
-    - If any of the required files are missing, this function raises an error.
-    - If any of the optional files are missing, the function raises a warning.
+    Determine which of the required and optional files are missing, per sample
 
-    Note, this function also performs Sample object validation with jsonschema.
+    All samples are validated first, then every unique input path of all of
+    them is probed once, concurrently.
 
-    :param peppy.Project project: project that defines the samples to validate
+    :param peppy.Project project: project that defines the samples to check
     :param str | dict schema: schema dict to validate against or a path to one
-    :param str | int sample_name: name or index of the sample to validate. If None,
-        validate all samples in the project
-    :raise PathAttrNotFoundError: if any required sample attribute is missing
+    :param str | int sample_name: name or index of the sample to check. If None,
+        check all samples in the project
+    :param StatCache stat_cache: cache of file checks to use and fill, it can be
+        reused by get_input_files_size afterwards
+    :return dict[str, dict]: mapping of sample names to the missing required
+        inputs, missing inputs, required inputs and all inputs of the sample
+    :raise EidoValidationError: if any sample is invalid
     """
-
     if sample_name is None:
         samples = project.samples
     else:
@@ -208,32 +720,66 @@ def validate_input_files(
 
     if isinstance(schemas, str):
         schemas = read_schema(schemas)
+    sample_schemas = _get_sample_schemas(schemas)
+    stat_cache = stat_cache or StatCache()
 
+    inputs = []
     for sample in samples:
         # validate attrs existence first
-        _validate_sample_object(schemas=schemas, sample=sample)
-
-        all_inputs = set()
-        required_inputs = set()
-        schema = schemas[-1]  # use only first schema, in case there are imports
-        sample_schema_dict = schema[PROP_KEY][SAMPLES_KEY]["items"]
-        if SIZING_KEY in sample_schema_dict:
-            all_inputs.update(_get_attr_values(sample, sample_schema_dict[SIZING_KEY]))
-        if TANGIBLE_KEY in sample_schema_dict:
-            required_inputs = set(
-                _get_attr_values(sample, sample_schema_dict[TANGIBLE_KEY])
-            )
-            all_inputs.update(required_inputs)
+        _validate_sample_object(
+            sample=sample, schemas=schemas, sample_schemas=sample_schemas
+        )
+        # use only first schema, in case there are imports
+        inputs.append((sample, *_get_sample_inputs(sample, schemas[-1])))
 
-        missing_required_inputs = [i for i in required_inputs if not os.path.exists(i)]
-        missing_inputs = [i for i in all_inputs if not os.path.exists(i)]
-        if missing_inputs:
+    stat_cache.probe(path for _, _, all_inputs in inputs for path in all_inputs)
+    return {
+        getattr(sample, project.sample_table_index): {
+            MISSING_KEY: stat_cache.missing(required_inputs),
+            MISSING_INPUTS_KEY: stat_cache.missing(all_inputs),
+            REQUIRED_INPUTS_KEY: required_inputs,
+            ALL_INPUTS_KEY: all_inputs,
+        }
+        for sample, required_inputs, all_inputs in inputs
+    }
+
+
+def validate_input_files(
+    project: peppy.Project,
+    schemas: Union[str, dict],
+    sample_name: Union[str, int] = None,
+    stat_cache: StatCache = None,
+):
+    """
+    Determine which of the required and optional files are missing.
+
+    The names of the attributes that are required and/or deemed as inputs
+    are sourced from the schema, more specifically from `required_files`
+    and `files` sections in samples section:
+
+    - If any of the required files are missing, this function raises an error.
+    - If any of the optional files are missing, the function raises a warning.
+
+    Note, this function also performs Sample object validation with jsonschema.
+
+    :param peppy.Project project: project that defines the samples to validate
+    :param str | dict schema: schema dict to validate against or a path to one
+    :param str | int sample_name: name or index of the sample to validate. If None,
+        validate all samples in the project
+    :param StatCache stat_cache: cache of file checks to use and fill
+    :raise PathAttrNotFoundError: if any required sample attribute is missing
+    """
+    report = get_missing_input_files(
+        project, schemas, sample_name=sample_name, stat_cache=stat_cache
+    )
+    for name, sample_report in report.items():
+        if sample_report[MISSING_INPUTS_KEY]:
             warn(
-                f"For sample '{getattr(sample, project.sample_table_index)}'. "
-                f"Optional inputs not found: {missing_inputs}"
+                f"For sample '{name}'. "
+                f"Optional inputs not found: {sample_report[MISSING_INPUTS_KEY]}"
             )
-        if missing_required_inputs:
+        if sample_report[MISSING_KEY]:
             raise PathAttrNotFoundError(
-                f"For sample '{getattr(sample, project.sample_table_index)}'. "
-                f"Required inputs not found: {required_inputs}"
+                f"For sample '{name}'. "
+                f"Required inputs not found: {sample_report[REQUIRED_INPUTS_KEY]}"
             )
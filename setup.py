@@ -19,6 +19,9 @@ with open("requirements/requirements-all.txt", "r") as reqs_file:
 
 extra["install_requires"] = DEPENDENCIES
 
+# Optional dependencies of the columnar output filters
+extra["extras_require"] = {"arrow": ["pyarrow"]}
+
 
 # Additional files to include with package
 def get_static(name, condition=None):
@@ -72,6 +75,11 @@ setup(
             "yaml=eido.conversion_plugins:yaml_pep_filter",
             "csv=eido.conversion_plugins:csv_pep_filter",
             "yaml-samples=eido.conversion_plugins:yaml_samples_pep_filter",
+            "parquet=eido.conversion_plugins:parquet_pep_filter",
+            "arrow=eido.conversion_plugins:arrow_pep_filter",
+            "feather=eido.conversion_plugins:feather_pep_filter",
+            "jsonl=eido.conversion_plugins:jsonl_pep_filter",
+            "ndjson=eido.conversion_plugins:jsonl_pep_filter",
         ],
     },
     scripts=scripts,
@@ -1,10 +1,35 @@
+import gzip
+import json
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import EntryPoint
+
+import pytest
+import yaml
+
+import eido.conversion
+import eido.conversion_plugins
 from eido.conversion import (
+    clear_filter_registry,
+    configure_filter_index,
     run_filter,
     get_available_pep_filters,
+    get_pep_filter,
     pep_conversion_plugins,
     convert_project,
+    convert_project_multi,
+    get_filter_context,
 )
-from eido.output_formatters import MultilineOutputFormatter
+from eido.conversion_plugins import yaml_pep_filter, yaml_samples_pep_filter
+from eido.exceptions import EidoFilterError
+from eido.output_formatters import (
+    MultilineOutputFormatter,
+    SampleSubsampleOutputFormatter,
+)
+import eido.schema_cache
+import pandas as pd
 import peppy
 
 
@@ -107,6 +132,293 @@ class TestConversionInfrastructure:
         assert isinstance(conversion["samples"], str)
 
 
+@pytest.fixture
+def fake_filters(mocker):
+    eps = [
+        EntryPoint("csv", "eido.conversion_plugins:csv_pep_filter", "pep.filters"),
+        EntryPoint("broken", "not_an_installed_module:f", "pep.filters"),
+    ]
+    clear_filter_registry()
+    yield mocker.patch.object(eido.conversion, "entry_points", return_value=eps)
+    configure_filter_index(False)
+    clear_filter_registry()
+
+
+class TestFilterRegistry:
+    def test_filters_are_listed_without_loading(self, fake_filters):
+        assert get_available_pep_filters() == ["csv", "broken"]
+        assert callable(get_pep_filter("csv"))
+        with pytest.raises(ModuleNotFoundError):
+            get_pep_filter("broken")
+
+    def test_entry_points_are_scanned_once(self, fake_filters):
+        get_available_pep_filters()
+        assert get_pep_filter("csv") is get_pep_filter("csv")
+        assert fake_filters.call_count == 1
+
+    def test_unknown_filter(self, fake_filters):
+        with pytest.raises(EidoFilterError, match="Available: csv, broken"):
+            get_pep_filter("xml")
+
+    def test_index_is_reused_until_distributions_change(
+        self, fake_filters, tmp_path, mocker
+    ):
+        mocker.patch.dict(eido.schema_cache._SETTINGS, {"cache_dir": str(tmp_path)})
+        configure_filter_index(True)
+        mocker.patch.object(
+            eido.conversion, "_get_distributions_fingerprint", return_value="a"
+        )
+        get_available_pep_filters()
+        clear_filter_registry()
+        assert get_available_pep_filters() == ["csv", "broken"]
+        assert fake_filters.call_count == 1
+        eido.conversion._get_distributions_fingerprint.return_value = "b"
+        clear_filter_registry()
+        get_available_pep_filters()
+        assert fake_filters.call_count == 2
+
+
+class TestStreamingFilters:
+    def test_streamed_result_is_written(
+        self, tmp_path, taxprofiler_project, taxprofiler_csv_multiline_output
+    ):
+        path = tmp_path / "samples.csv"
+        conv_result = run_filter(
+            taxprofiler_project,
+            "csv",
+            verbose=False,
+            plugin_kwargs={"paths": {"samples": str(path)}, "stream": True},
+        )
+        assert conv_result == {"samples": None}
+        assert path.read_text() == taxprofiler_csv_multiline_output
+
+    def test_streamed_result_is_printed(
+        self, capsys, taxprofiler_project, taxprofiler_csv_multiline_output
+    ):
+        run_filter(taxprofiler_project, "csv", plugin_kwargs={"stream": True})
+        assert capsys.readouterr().out == taxprofiler_csv_multiline_output
+
+    def test_unconsumed_stream_is_joined(
+        self, taxprofiler_project, taxprofiler_csv_multiline_output
+    ):
+        conv_result = run_filter(
+            taxprofiler_project, "csv", verbose=False, plugin_kwargs={"stream": True}
+        )
+        assert conv_result == {"samples": taxprofiler_csv_multiline_output}
+
+
+class TestYamlFilters:
+    @pytest.mark.parametrize("chunk_size", [1, 2, 100])
+    def test_streamed_samples_match_single_dump(
+        self, mocker, chunk_size, taxprofiler_project
+    ):
+        mocker.patch.object(eido.conversion_plugins, "_YAML_CHUNK_SAMPLES", chunk_size)
+        expected = yaml.dump(
+            [s.to_dict() for s in taxprofiler_project.samples],
+            default_flow_style=False,
+        )
+        chunks = list(
+            yaml_samples_pep_filter(taxprofiler_project, stream=True)["samples"]
+        )
+        n_samples = len(taxprofiler_project.samples)
+        assert len(chunks) == -(-n_samples // chunk_size)
+        assert "".join(chunks) == expected
+
+    def test_pure_python_dumper_gives_same_output(self, mocker, project_object):
+        results = [
+            (yaml_samples_pep_filter(project_object), yaml_pep_filter(project_object))
+        ]
+        mocker.patch.object(
+            eido.conversion_plugins, "_get_yaml_dumper", return_value=yaml.Dumper
+        )
+        results.append(
+            (yaml_samples_pep_filter(project_object), yaml_pep_filter(project_object))
+        )
+        assert results[0] == results[1]
+
+    def test_no_samples(self):
+        assert "".join(eido.conversion_plugins._iter_yaml_samples([])) == "[]\n"
+
+
+class TestJsonLinesFilter:
+    def test_one_object_per_sample(self, taxprofiler_project):
+        conv_result = run_filter(taxprofiler_project, "jsonl", verbose=False)
+        records = [json.loads(x) for x in conv_result["samples"].splitlines()]
+        assert [r["sample"] for r in records] == [
+            s["sample"] for s in taxprofiler_project.samples
+        ]
+        assert records[0]["run_accession"] == ["runaccession1", "runaccession2"]
+
+    def test_subsamples_are_expanded(
+        self, taxprofiler_project, taxprofiler_csv_multiline_output
+    ):
+        conv_result = run_filter(
+            taxprofiler_project,
+            "ndjson",
+            verbose=False,
+            plugin_kwargs={"subsamples": "expand"},
+        )
+        records = [json.loads(x) for x in conv_result["samples"].splitlines()]
+        # one record per row of the multiline CSV
+        assert len(records) == len(taxprofiler_csv_multiline_output.splitlines()) - 1
+        assert [r["run_accession"] for r in records[:2]] == [
+            "runaccession1",
+            "runaccession2",
+        ]
+
+    def test_gzip_stream_is_readable_chunk_by_chunk(self, taxprofiler_project):
+        chunks = eido.conversion_plugins._iter_gzip(
+            eido.conversion_plugins._iter_json_lines(
+                taxprofiler_project.samples, chunk_size=1
+            )
+        )
+        first = zlib.decompressobj(wbits=31).decompress(next(chunks))
+        assert json.loads(first)["sample"] == "WT_REP1"
+
+    def test_gzip_output(self, taxprofiler_project):
+        conv_result = run_filter(
+            taxprofiler_project,
+            "jsonl",
+            verbose=False,
+            plugin_kwargs={"compression": "gzip"},
+        )
+        assert (
+            gzip.decompress(conv_result["samples"]).decode()
+            == run_filter(taxprofiler_project, "jsonl", verbose=False)["samples"]
+        )
+
+    @pytest.mark.parametrize(
+        "plugin_kwargs", [{"subsamples": "nested"}, {"compression": "zstd"}]
+    )
+    def test_invalid_options(self, plugin_kwargs, taxprofiler_project):
+        with pytest.raises(EidoFilterError):
+            run_filter(
+                taxprofiler_project,
+                "jsonl",
+                verbose=False,
+                plugin_kwargs=plugin_kwargs,
+            )
+
+
+class TestFilterContext:
+    def test_concurrent_runs_see_their_own_environment(self, mocker, tmp_path):
+        n = 8
+        barrier = threading.Barrier(n)
+
+        def env_pep_filter(p, **kwargs):
+            # all the runs are in progress at the same time from here on
+            barrier.wait(timeout=10)
+            context = get_filter_context()
+            assert context.paths == kwargs["paths"]
+            # streamed chunks are produced lazily, still within the run
+            return {
+                "result": (context.expandvars(x) for x in ["$EIDO_RUN", ":${EIDO_RUN}"])
+            }
+
+        mocker.patch.object(
+            eido.conversion, "get_pep_filter", return_value=env_pep_filter
+        )
+
+        def _run(i):
+            path = tmp_path / f"{i}.txt"
+            run_filter(
+                None,
+                "env",
+                verbose=False,
+                plugin_kwargs={
+                    "env": {"EIDO_RUN": str(i)},
+                    "paths": {"result": str(path)},
+                },
+            )
+            return path.read_text()
+
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            results = list(executor.map(_run, range(n)))
+        assert results == [f"{i}:{i}" for i in range(n)]
+        assert "EIDO_RUN" not in os.environ
+
+    def test_process_environment_is_a_fallback(self, monkeypatch):
+        monkeypatch.setenv("EIDO_TEST_HOME", "/home")
+        context = get_filter_context()
+        assert context.expandvars("$EIDO_TEST_HOME/$EIDO_UNSET") == (
+            "/home/$EIDO_UNSET"
+        )
+        assert context.getenv("EIDO_UNSET", "x") == "x"
+
+
+class TestMultiFormatConversion:
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_results_are_routed_to_filter_paths(
+        self, tmp_path, workers, taxprofiler_project, taxprofiler_csv_multiline_output
+    ):
+        paths = {
+            "csv": {"samples": str(tmp_path / "samples.csv")},
+            "yaml": {"project": str(tmp_path / "project.yaml")},
+            "yaml-samples": {"samples": str(tmp_path / "samples.yaml")},
+        }
+        conv_results = convert_project_multi(
+            taxprofiler_project,
+            ["csv", "yaml", "yaml-samples"],
+            {"stream": True},
+            paths=paths,
+            workers=workers,
+        )
+        assert list(conv_results) == ["csv", "yaml", "yaml-samples"]
+        assert (tmp_path / "samples.csv").read_text() == (
+            taxprofiler_csv_multiline_output
+        )
+        for f in ["yaml", "yaml-samples"]:
+            ((result_key, path),) = paths[f].items()
+            assert (
+                open(path).read() == convert_project(taxprofiler_project, f)[result_key]
+            )
+
+    def test_parallel_results_are_returned(self, capsys, taxprofiler_project):
+        conv_results = convert_project_multi(
+            taxprofiler_project, ["basic", "yaml"], workers=2
+        )
+        assert capsys.readouterr().out == ""
+        assert conv_results["yaml"]["project"].startswith("pep_version")
+
+    def test_shared_path_is_rejected_in_parallel(self, tmp_path, taxprofiler_project):
+        path = tmp_path / "out.txt"
+        with pytest.raises(EidoFilterError, match="would both write"):
+            convert_project_multi(
+                taxprofiler_project,
+                ["csv", "yaml-samples"],
+                {"paths": {"samples": str(path)}},
+                workers=2,
+            )
+        assert not path.exists()
+
+    def test_cli_prints_parallel_results_in_order(
+        self, monkeypatch, capsys, project_file_path
+    ):
+        from eido.cli import main
+
+        monkeypatch.setattr(
+            "sys.argv",
+            ["eido", "--no-cache", "convert", project_file_path, "-f", "csv"]
+            + ["-f", "yaml", "-j", "2"],
+        )
+        with pytest.raises(SystemExit):
+            main()
+        out = capsys.readouterr().out
+        csv_output = convert_project(peppy.Project(project_file_path), "csv")
+        assert out.startswith(csv_output["samples"])
+        assert "pep_version" in out[len(csv_output["samples"]) :]
+
+    def test_unknown_filter_fails_before_running(self, tmp_path, taxprofiler_project):
+        path = tmp_path / "project.yaml"
+        with pytest.raises(EidoFilterError):
+            convert_project_multi(
+                taxprofiler_project,
+                ["yaml", "nonexistent"],
+                paths={"yaml": {"project": str(path)}},
+            )
+        assert not path.exists()
+
+
 class TestMultilineOutputFormatterMissingValues:
     """
     Under pandas >=3.0 a missing attribute reaches the formatter as float('nan')
@@ -132,3 +444,168 @@ class TestMultilineOutputFormatterMissingValues:
             MultilineOutputFormatter.format([sample])
             == "sample,fasta\nfrog_1,\nfrog_1,\n"
         )
+
+
+class TestMultilineOutputFormatter:
+    def test_values_with_commas_are_quoted(self):
+        sample = peppy.Sample({"sample": "frog_1", "desc": 'a, "b"'})
+
+        assert (
+            MultilineOutputFormatter.format([sample])
+            == 'sample,desc\nfrog_1,"a, ""b"""\n'
+        )
+
+    def test_lists_are_exploded_along_the_first_one(self):
+        sample = peppy.Sample(
+            {"sample": "frog_1", "file": ["a", "b"], "size": ["1"], "kind": "x"}
+        )
+
+        assert MultilineOutputFormatter.format([sample]) == (
+            "sample,file,size,kind\nfrog_1,a,1,x\nfrog_1,b,,x\n"
+        )
+
+    def test_sample_table_gives_same_output(self, taxprofiler_project):
+        assert MultilineOutputFormatter.format(
+            taxprofiler_project.sample_table
+        ) == MultilineOutputFormatter.format(taxprofiler_project.samples)
+
+
+class TestSampleSubsampleOutputFormatter:
+    def test_tables_are_separate(self, taxprofiler_project, peps_path):
+        tables = SampleSubsampleOutputFormatter.format(
+            taxprofiler_project.sample_table,
+            taxprofiler_project.subsample_table,
+            sample_key="sample",
+        )
+        table_dir = os.path.join(peps_path, "multiline_output")
+        with open(os.path.join(table_dir, "samplesheet.csv")) as f:
+            assert tables["samples"] == f.read()
+        with open(os.path.join(table_dir, "subsamplesheet.csv")) as f:
+            assert tables["subsamples"] == f.read()
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 1000])
+    def test_subsamples_are_joined_in_sample_order(self, caplog, chunk_size):
+        samples = pd.DataFrame(
+            {"sample_name": ["b", "a", "c"], "protocol": ["x", "y", "z"]}
+        )
+        subsamples = pd.DataFrame(
+            {
+                "sample_name": ["a", "b", "orphan", "a", "b"],
+                "file": ["a1", "b1", "o1", "a2", "b2"],
+            }
+        )
+        tables = SampleSubsampleOutputFormatter.iter_format(
+            samples, subsamples, sample_attributes=["protocol"], chunk_size=chunk_size
+        )
+        assert "".join(tables["subsamples"]) == (
+            "sample_name,file,protocol\nb,b1,x\nb,b2,x\na,a1,y\na,a2,y\n"
+        )
+        assert "Skipped 1 subsample rows" in caplog.text
+
+    def test_many_subsample_tables(self, test_multiple_subs):
+        p = peppy.Project(
+            test_multiple_subs,
+            sample_table_index="sample_id",
+            subsample_table_index="sample_id",
+        )
+        conv_result = eido.conversion_plugins.processed_pep_filter(p)
+        assert list(conv_result) == [
+            "project",
+            "samples",
+            "subsamples_1",
+            "subsamples_2",
+        ]
+        samples_header = conv_result["samples"].splitlines()[0]
+        assert "file_path" not in samples_header.split(",")
+        assert conv_result["subsamples_1"].startswith("sample_id,file_path")
+
+    def test_subsamples_joined_with_default_indexes(self, test_file_existing_pep):
+        p = peppy.Project(test_file_existing_pep)
+        conv_result = eido.conversion_plugins.processed_pep_filter(p)
+        subsamples = pd.read_csv(
+            os.path.join(os.path.dirname(test_file_existing_pep), "subsample_table.csv")
+        )
+        rows = conv_result["subsamples"].splitlines()
+        assert rows[0].split(",")[0] == p.st_index
+        assert len(rows) - 1 == len(subsamples)
+
+
+class TestArrowFilters:
+    @pytest.mark.parametrize(
+        ["filter_name", "compression"],
+        [("parquet", "zstd"), ("arrow", None), ("feather", "lz4")],
+    )
+    def test_tables_are_written(
+        self, tmp_path, test_file_existing_pep, filter_name, compression
+    ):
+        pa = pytest.importorskip("pyarrow")
+        from pyarrow import feather, parquet
+
+        project = peppy.Project(test_file_existing_pep)
+        paths = {
+            "samples": str(tmp_path / "samples.out"),
+            "subsamples": str(tmp_path / "subsamples.out"),
+        }
+        kwargs = {"paths": paths}
+        if compression:
+            kwargs["compression"] = compression
+        conv_result = run_filter(
+            project, filter_name, verbose=False, plugin_kwargs=kwargs
+        )
+        assert isinstance(conv_result["samples"], bytes)
+        read = {
+            "parquet": parquet.read_table,
+            "feather": feather.read_table,
+            "arrow": lambda path: pa.ipc.open_file(pa.memory_map(path)).read_all(),
+        }[filter_name]
+        samples = read(paths["samples"])
+        assert samples.column("sample_name").to_pylist() == [
+            s.sample_name for s in project.samples
+        ]
+        assert samples.column("file_path").to_pylist()[0] == [
+            "file/a.txt",
+            "file/b.txt",
+            "file/c.txt",
+        ]
+        assert read(paths["subsamples"]).num_rows == len(project.subsample_table)
+
+    def test_invalid_codec(self, test_file_existing_pep):
+        pytest.importorskip("pyarrow")
+        with pytest.raises(EidoFilterError):
+            run_filter(
+                peppy.Project(test_file_existing_pep),
+                "parquet",
+                verbose=False,
+                plugin_kwargs={"compression": "not-a-codec"},
+            )
+
+    def test_mixed_type_columns_are_written_as_text(self):
+        pytest.importorskip("pyarrow")
+        from eido.conversion_plugins import _to_arrow_table
+
+        table = pd.DataFrame(
+            {
+                "sample_name": ["a", "b", "c", "d"],
+                "mixed": ["x", 1, 2.5, None],
+                "numbers": [1, 2.5, None, 3],
+                "files": [["f1", 2], "f3", None, "f4"],
+            }
+        )
+        arrow_table = _to_arrow_table(table)
+        assert arrow_table.column("mixed").to_pylist() == ["x", "1", "2.5", None]
+        assert arrow_table.column("numbers").to_pylist()[:2] == [1, 2.5]
+        assert arrow_table.column("files").to_pylist() == [
+            ["f1", "2"],
+            ["f3"],
+            None,
+            ["f4"],
+        ]
+
+    def test_conversion_errors_are_filter_errors(self, mocker, test_file_existing_pep):
+        pa = pytest.importorskip("pyarrow")
+        mocker.patch(
+            "eido.conversion_plugins._to_arrow_table",
+            side_effect=pa.ArrowTypeError("cannot convert"),
+        )
+        with pytest.raises(EidoFilterError, match="cannot convert"):
+            run_filter(peppy.Project(test_file_existing_pep), "parquet", verbose=False)
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["pandas", "jsonschema", "peppy"]
+
+
+def _imported_heavy_modules(code):
+    check = (
+        f"import sys; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", f"{code}\n{check}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return out.stdout.split()
+
+
+class TestLazyImports:
+    @pytest.mark.parametrize(
+        "code",
+        [
+            "import eido",
+            "import eido; eido.PROP_KEY; eido.EidoValidationError",
+            "import eido.argparser; eido.argparser.build_argparser()",
+        ],
+    )
+    def test_heavy_dependencies_not_imported(self, code):
+        assert _imported_heavy_modules(code) == []
+
+    def test_public_api_is_imported_on_access(self):
+        import eido
+        from eido.validation import validate_project
+
+        assert eido.validate_project is validate_project
+        assert set(eido.__all__) <= set(dir(eido))
+        with pytest.raises(AttributeError):
+            eido.not_an_attribute
@@ -1,6 +1,21 @@
-from yaml import safe_load
+import datetime
+import os
+from urllib.error import HTTPError
 
-from eido import read_schema
+import pytest
+from peppy.exceptions import RemoteYAMLError
+from yaml import safe_dump, safe_load
+
+import eido.schema
+import eido.schema_cache
+from eido import (
+    clear_schema_cache,
+    configure_schema_cache,
+    list_cached_schemas,
+    prune_schema_cache,
+    read_schema,
+)
+from eido.exceptions import EidoSchemaInvalidError
 
 
 class TestSchemaReading:
@@ -14,3 +29,205 @@ class TestSchemaReading:
             s = read_schema(safe_load(f))
         assert isinstance(s, list)
         assert len(s) == 2
+
+
+def _write_schemas(directory, imports_by_name):
+    for name, imports in imports_by_name.items():
+        schema = {"description": name}
+        if imports:
+            schema["imports"] = [str(directory / f"{i}.yaml") for i in imports]
+        with open(directory / f"{name}.yaml", "w") as f:
+            safe_dump(schema, f)
+    return str(directory / "top.yaml")
+
+
+class TestImportGraphResolution:
+    def test_diamond_imports_are_read_once(self, tmp_path, mocker):
+        clear_schema_cache()
+        top = _write_schemas(
+            tmp_path,
+            {"top": ["left", "right"], "left": ["base"], "right": ["base"], "base": []},
+        )
+        spy = mocker.spy(eido.schema, "load_yaml")
+        s = read_schema(top)
+        assert [x["description"] for x in s] == ["base", "left", "right", "top"]
+        assert spy.call_count == 4
+
+    @pytest.mark.parametrize(
+        "imports_by_name",
+        [
+            {"top": ["a"], "a": ["b"], "b": ["a"]},
+            {"top": ["top"]},
+        ],
+    )
+    def test_cycles_are_detected(self, tmp_path, imports_by_name):
+        top = _write_schemas(tmp_path, imports_by_name)
+        with pytest.raises(EidoSchemaInvalidError, match="cycle"):
+            read_schema(top)
+
+    def test_parsed_schemas_are_reused_until_modified(self, tmp_path, mocker):
+        clear_schema_cache()
+        top = _write_schemas(tmp_path, {"top": ["base"], "base": []})
+        spy = mocker.spy(eido.schema, "load_yaml")
+        read_schema(top)
+        read_schema(top)
+        assert spy.call_count == 2
+        base = str(tmp_path / "base.yaml")
+        st = os.stat(base)
+        os.utime(base, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        read_schema(top)
+        assert spy.call_count == 3
+
+    def test_returned_schemas_are_copies(self, tmp_path):
+        top = _write_schemas(tmp_path, {"top": []})
+        read_schema(top)[0]["description"] = "changed"
+        assert read_schema(top)[0]["description"] == "top"
+
+
+@pytest.fixture
+def schema_cache_dir(tmp_path):
+    settings = dict(eido.schema_cache._SETTINGS)
+    cache_dir = tmp_path / "cache"
+    configure_schema_cache(enabled=True, cache_dir=str(cache_dir))
+    clear_schema_cache()
+    yield cache_dir
+    eido.schema_cache._SETTINGS.update(settings)
+
+
+class _FakeResponse:
+    def __init__(self, body, etag):
+        self.body = body
+        self.headers = {"ETag": etag}
+
+    def read(self):
+        return self.body.encode("utf-8")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _serve_schema(mocker, served):
+    """
+    Serve a remote schema with an ETag, replying 304 when it is unchanged
+
+    :param dict served: body and ETag of the schema, updated by the test
+    :return list[str]: If-None-Match headers of the requests made
+    """
+    requests = []
+
+    def _urlopen(request, **kwargs):
+        etag = request.get_header("If-none-match")
+        requests.append(etag)
+        if etag == served["etag"]:
+            raise HTTPError(request.full_url, 304, "Not Modified", {}, None)
+        return _FakeResponse(served["body"], served["etag"])
+
+    mocker.patch.object(eido.schema, "urlopen", side_effect=_urlopen)
+    return requests
+
+
+class TestRemoteSchemaReading:
+    def test_response_is_closed_and_timed(self, mocker):
+        response = _FakeResponse("description: remote\n", '"1"')
+        close = mocker.spy(response, "close")
+        urlopen = mocker.patch.object(eido.schema, "urlopen", return_value=response)
+        s = read_schema("https://example.com/closed.yaml")
+        assert s[0]["description"] == "remote"
+        assert close.call_count == 1
+        assert urlopen.call_args.kwargs["timeout"] == eido.schema._REMOTE_TIMEOUT
+
+    def test_timeout_is_remote_yaml_error(self, mocker):
+        mocker.patch.object(
+            eido.schema, "urlopen", side_effect=TimeoutError("timed out")
+        )
+        with pytest.raises(RemoteYAMLError, match="timed out"):
+            read_schema("https://example.com/slow.yaml")
+
+
+class TestPersistentSchemaCache:
+    def test_cached_schemas_match_loaded_ones(self, tmp_path, schema_cache_dir):
+        top = str(tmp_path / "top.yaml")
+        with open(top, "w") as f:
+            safe_dump(
+                {
+                    "properties": {
+                        "samples": {
+                            "items": {"properties": {"genome": {"type": "string"}}}
+                        }
+                    }
+                },
+                f,
+            )
+        loaded = read_schema(top)
+        clear_schema_cache()
+        assert len(list_cached_schemas()) == 1
+        assert read_schema(top) == loaded
+
+    def test_schemas_not_representable_as_json_are_not_cached(
+        self, tmp_path, schema_cache_dir
+    ):
+        top = str(tmp_path / "top.yaml")
+        with open(top, "w") as f:
+            f.write("description: dated\nversion_date: 2024-01-31\n")
+        loaded = read_schema(top)
+        assert list_cached_schemas() == []
+        clear_schema_cache()
+        assert read_schema(top) == loaded
+        assert isinstance(loaded[0]["version_date"], datetime.date)
+
+    def test_cache_is_used_across_processes(self, tmp_path, schema_cache_dir, mocker):
+        top = _write_schemas(tmp_path, {"top": ["base"], "base": []})
+        read_schema(top)
+        # an empty in-memory cache, as in a new process
+        clear_schema_cache()
+        spy = mocker.spy(eido.schema, "load_yaml")
+        s = read_schema(top)
+        assert [x["description"] for x in s] == ["base", "top"]
+        assert spy.call_count == 0
+
+    def test_modified_import_invalidates_entry(self, tmp_path, schema_cache_dir):
+        top = _write_schemas(tmp_path, {"top": ["base"], "base": []})
+        read_schema(top)
+        with open(tmp_path / "base.yaml", "w") as f:
+            safe_dump({"description": "changed"}, f)
+        assert read_schema(top)[0]["description"] == "changed"
+
+    def test_prune_evicts_least_recently_used(self, tmp_path, schema_cache_dir):
+        a = _write_schemas(tmp_path, {"top": []})
+        b = str(tmp_path / "other.yaml")
+        with open(b, "w") as f:
+            safe_dump({"description": "other"}, f)
+        read_schema(a)
+        read_schema(b)
+        entries = list_cached_schemas()
+        assert len(entries) == 2
+        [entry_a] = [e for e in entries if e["location"] == a]
+        os.utime(entry_a["path"], (0, 0))
+        total = sum(e["size"] for e in entries)
+        assert prune_schema_cache(max_size=total - 1) == 1
+        assert [e["location"] for e in list_cached_schemas()] == [b]
+        assert prune_schema_cache(max_size=0) == 1
+        assert list_cached_schemas() == []
+
+    def test_remote_schema_is_revalidated_with_etag(self, schema_cache_dir, mocker):
+        url = "https://example.com/schema.yaml"
+        served = {"body": "description: first\n", "etag": '"1"'}
+        requests = _serve_schema(mocker, served)
+        assert read_schema(url)[0]["description"] == "first"
+        clear_schema_cache()
+        assert read_schema(url)[0]["description"] == "first"
+        assert requests == [None, '"1"']
+        served.update(body="description: second\n", etag='"2"')
+        clear_schema_cache()
+        assert read_schema(url)[0]["description"] == "second"
+
+    def test_offline_remote_schema_not_cached(self, schema_cache_dir):
+        configure_schema_cache(offline=True)
+        with pytest.raises(RemoteYAMLError, match="offline"):
+            read_schema("https://example.com/schema.yaml")
@@ -1,9 +1,19 @@
+import copy
+import io
+import json
+import logging
+import os
 import urllib
 
+import pandas as pd
 import pytest
+import yaml
 from peppy import Project
 from peppy.utils import load_yaml
 
+import eido.file_probe
+import eido.schema_profiler
+import eido.validation
 from eido import *
 from eido.exceptions import EidoValidationError, PathAttrNotFoundError
 
@@ -151,3 +161,601 @@ class TestProjectWithoutConfigValidation:
         prj = Project(test_file_value_check)
         with pytest.raises(EidoValidationError):
             validate_project(project=prj, schema=schema_path)
+
+
+class TestValidatorCache:
+    def test_validators_are_reused_across_samples(
+        self, test_file_existing_pep, test_file_existing_schema
+    ):
+        clear_validator_cache()
+        prj = Project(test_file_existing_pep)
+        with pytest.raises(PathAttrNotFoundError):
+            validate_input_files(prj, test_file_existing_schema)
+        info = validator_cache_info()
+        assert info.misses == 1
+        assert info.currsize == 1
+
+    def test_equal_schemas_share_a_validator(self):
+        clear_validator_cache()
+        v1 = get_validator({"type": "object", "required": ["a"]})
+        v2 = get_validator({"required": ["a"], "type": "object"})
+        assert v1 is v2
+        assert validator_cache_info().hits == 1
+
+    def test_cache_is_size_bounded(self):
+        clear_validator_cache(maxsize=2)
+        try:
+            for i in range(5):
+                get_validator({"type": "object", "minProperties": i})
+            assert validator_cache_info().currsize == 2
+        finally:
+            clear_validator_cache(maxsize=128)
+
+    def test_clear_resets_stats(self, project_object, schema_file_path):
+        validate_project(project=project_object, schema=schema_file_path)
+        clear_validator_cache()
+        assert validator_cache_info() == (0, 0, 128, 0)
+
+
+class TestParallelProjectValidation:
+    @pytest.mark.parametrize("chunk_size", [None, 1])
+    def test_validate_works(self, project_object, schema_file_path, chunk_size):
+        validate_project(
+            project=project_object,
+            schema=schema_file_path,
+            workers=2,
+            chunk_size=chunk_size,
+        )
+
+    @pytest.mark.parametrize(
+        "kwargs", [{"chunk_size": 0}, {"chunk_size": -1}, {"max_errors": 0}]
+    )
+    def test_non_positive_sizes_are_rejected(
+        self, project_object, schema_file_path, kwargs
+    ):
+        with pytest.raises(ValueError):
+            validate_project(
+                project=project_object, schema=schema_file_path, workers=2, **kwargs
+            )
+
+    def test_cli_rejects_non_positive_sizes(self):
+        from eido.argparser import build_argparser
+
+        parser, _ = build_argparser()
+        for option in ["--chunk-size", "--max-errors"]:
+            with pytest.raises(SystemExit):
+                parser.parse_args(["validate", "pep.yaml", "-s", "s.yaml", option, "0"])
+
+    def test_errors_match_single_process_validation(
+        self, test_schema_value_check, test_file_value_check
+    ):
+        prj = Project(test_file_value_check)
+        with pytest.raises(EidoValidationError) as serial:
+            validate_project(project=prj, schema=test_schema_value_check)
+        with pytest.raises(EidoValidationError) as parallel:
+            validate_project(
+                project=prj, schema=test_schema_value_check, workers=2, chunk_size=1
+            )
+        assert parallel.value.errors_by_type == serial.value.errors_by_type
+
+    def test_samples_annotations_keep_the_process_pool(
+        self, project_object, mocker, caplog
+    ):
+        schema = {
+            "properties": {
+                "samples": {
+                    "type": "array",
+                    "title": "Samples",
+                    "description": "annotated",
+                    "$comment": "not a constraint",
+                    "items": {"type": "object"},
+                }
+            }
+        }
+        pool = mocker.spy(eido.validation, "ProcessPoolExecutor")
+        validate_project(project=project_object, schema=schema, workers=2)
+        assert pool.call_count == 1
+        schema["properties"]["samples"]["minItems"] = 1
+        caplog.set_level(logging.DEBUG, logger="eido")
+        validate_project(project=project_object, schema=schema, workers=2)
+        assert pool.call_count == 1
+        assert "constrained by minItems" in caplog.text
+
+    def test_validate_detects_invalid_config(self, project_object):
+        schema = {
+            "properties": {
+                "project": {"type": "object", "required": ["bogus_attr"]},
+                "samples": {"type": "array", "items": {"type": "object"}},
+            }
+        }
+        with pytest.raises(EidoValidationError) as e:
+            validate_project(project=project_object, schema=schema, workers=2)
+        assert list(e.value.errors_by_type) == ["'bogus_attr' is a required property"]
+
+
+class TestSampleTableValidation:
+    def test_errors_match_project_validation(
+        self, test_schema_value_check, test_file_value_check
+    ):
+        prj = Project(test_file_value_check)
+        with pytest.raises(EidoValidationError) as by_row:
+            validate_project(project=prj, schema=test_schema_value_check)
+        with pytest.raises(EidoValidationError) as by_column:
+            validate_sample_table(prj, schema=test_schema_value_check)
+        assert by_column.value.errors_by_type == by_row.value.errors_by_type
+
+    def test_subsample_lists_and_row_wise_fallback(self, test_multiple_subs):
+        prj = Project(test_multiple_subs, sample_table_index="sample_id")
+        sample_schema = {
+            "type": "object",
+            "properties": {
+                "file_path": {"type": "string", "pattern": "^file/[ab]"},
+                "protocol": {"enum": ["anySampleType"]},
+                "identifier": {"not": {"const": "frog2"}},
+            },
+            "required": ["sample_id", "bogus_attr"],
+        }
+        schema = {"properties": {"samples": {"type": "array", "items": sample_schema}}}
+        with pytest.raises(EidoValidationError) as by_row:
+            validate_project(project=prj, schema=copy.deepcopy(schema))
+        with pytest.raises(EidoValidationError) as by_column:
+            validate_sample_table(prj, schema=copy.deepcopy(schema))
+        assert by_column.value.errors_by_type == by_row.value.errors_by_type
+        assert len(by_column.value.errors_by_type) == 3
+
+    def test_validates_bare_data_frame(self):
+        table = pd.DataFrame(
+            {"sample_name": ["a", "b", "c"], "n": [1, 5, -1], "f": [1.0, 2.5, None]}
+        )
+        schema = {
+            "properties": {
+                "samples": {
+                    "items": {
+                        "properties": {
+                            "n": {"type": "integer", "minimum": 0},
+                            "f": {"type": "integer"},
+                        },
+                        "required": ["f"],
+                    }
+                }
+            }
+        }
+        with pytest.raises(EidoValidationError) as e:
+            validate_sample_table(table, schema=schema)
+        assert {
+            t: [x["sample_name"] for x in errs]
+            for t, errs in e.value.errors_by_type.items()
+        } == {
+            "2.5 is not of type 'integer'": ["b"],
+            "'f' is a required property": ["c"],
+            "-1 is less than the minimum of 0": ["c"],
+        }
+
+    def test_valid_table_passes(self, project_object, schema_file_path):
+        validate_sample_table(project_object, schema=schema_file_path)
+
+
+class TestStreamedValidation:
+    @pytest.mark.parametrize("chunk_size", [1, 2, 1000])
+    def test_errors_match_project_validation(
+        self, test_schema_value_check, test_file_value_check, chunk_size
+    ):
+        with pytest.raises(EidoValidationError) as whole:
+            validate_project(
+                project=Project(test_file_value_check), schema=test_schema_value_check
+            )
+        with pytest.raises(EidoValidationError) as streamed:
+            validate_project_stream(
+                test_file_value_check, test_schema_value_check, chunk_size=chunk_size
+            )
+        assert streamed.value.errors_by_type == whole.value.errors_by_type
+
+    def test_errors_are_written_as_found(
+        self, test_schema_value_check, test_file_value_check
+    ):
+        output = io.StringIO()
+        with pytest.raises(EidoValidationError):
+            validate_project_stream(
+                test_file_value_check, test_schema_value_check, output=output
+            )
+        assert output.getvalue().splitlines() == [
+            "'tssPeak' is not valid under any of the given schemas on instance encode_20",
+            "'tssPeak' is not valid under any of the given schemas on instance encode_23",
+            "'tssPeak1' is not valid under any of the given schemas on instance encode_24",
+        ]
+
+    def test_validate_works(self, project_file_path, schema_file_path):
+        validate_project_stream(project_file_path, schema_file_path, chunk_size=1)
+
+    def test_subsample_tables_are_validated(self, test_multiple_subs):
+        schema = {
+            "properties": {
+                "samples": {
+                    "type": "array",
+                    "items": {"properties": {"file_path": {"pattern": "^file/a"}}},
+                }
+            }
+        }
+        errors = list(
+            iter_streamed_validation_errors(
+                test_multiple_subs, schema, sample_table_index="sample_id"
+            )
+        )
+        assert [e["sample_name"] for e in errors] == ["frog_1", "frog_1", "frog_2"]
+
+    def test_required_attributes_from_subsample_tables(self, tmp_path):
+        (tmp_path / "samples.csv").write_text("sample_name,protocol\ns1,x\ns2,y\n")
+        (tmp_path / "subsamples.csv").write_text(
+            "sample_name,input_file\ns1,a.fq\ns1,b.fq\ns2,c.fq\n"
+        )
+        (tmp_path / "config.yaml").write_text(
+            "pep_version: 2.1.0\nsample_table: samples.csv\n"
+            "subsample_table: subsamples.csv\n"
+        )
+        schema = {
+            "properties": {
+                "samples": {
+                    "type": "array",
+                    "items": {
+                        "properties": {
+                            "protocol": {"type": "string"},
+                            "input_file": {"type": "string"},
+                        },
+                        "required": ["protocol", "input_file"],
+                    },
+                }
+            }
+        }
+        pep = str(tmp_path / "config.yaml")
+        validate_project(Project(pep), schema)
+        validate_project_stream(pep, schema, chunk_size=1)
+
+    def test_cli_rejects_options_ignored_by_stream(self):
+        from eido.argparser import build_argparser
+        from eido.cli import _get_stream_conflicts
+
+        parser, _ = build_argparser()
+        args = parser.parse_args(
+            ["validate", "pep.yaml", "-s", "s.yaml", "--stream", "-c"]
+            + ["--amendments", "a", "--sst-index", "subsample_name"]
+        )
+        assert _get_stream_conflicts(args) == [
+            "--just-config",
+            "--amendments",
+            "--sst-index",
+        ]
+        args = parser.parse_args(["validate", "pep.yaml", "-s", "s.yaml", "--stream"])
+        assert _get_stream_conflicts(args) == []
+
+    def test_separator_is_inferred_from_content(
+        self, tmp_path, test_file_value_check, test_schema_value_check
+    ):
+        table = pd.read_csv(
+            os.path.join(os.path.dirname(test_file_value_check), "sample_table.csv")
+        )
+        table.to_csv(tmp_path / "samples.csv", sep="\t", index=False)
+        with pytest.raises(EidoValidationError) as whole:
+            validate_project_stream(
+                test_file_value_check, test_schema_value_check, chunk_size=2
+            )
+        with pytest.raises(EidoValidationError) as tabbed:
+            validate_project_stream(
+                str(tmp_path / "samples.csv"), test_schema_value_check, chunk_size=2
+            )
+        assert tabbed.value.errors_by_type == whole.value.errors_by_type
+
+
+class TestValidationErrorIterator:
+    def test_yields_all_errors(self, test_schema_value_check, test_file_value_check):
+        errors = list(
+            iter_validation_errors(
+                Project(test_file_value_check), test_schema_value_check
+            )
+        )
+        assert [e["sample_name"] for e in errors] == [
+            "encode_20",
+            "encode_23",
+            "encode_24",
+        ]
+
+    def test_no_errors_for_valid_project(self, project_object, schema_file_path):
+        assert list(iter_validation_errors(project_object, schema_file_path)) == []
+
+    @pytest.mark.parametrize(
+        ["kwargs", "expected"], [({"fail_fast": True}, 1), ({"max_errors": 2}, 2)]
+    )
+    def test_stops_early(
+        self, test_schema_value_check, test_file_value_check, kwargs, expected
+    ):
+        errors = iter_validation_errors(
+            Project(test_file_value_check), test_schema_value_check, **kwargs
+        )
+        assert len(list(errors)) == expected
+
+    @pytest.mark.parametrize("workers", [None, 2])
+    def test_validate_project_max_errors(
+        self, test_schema_value_check, test_file_value_check, workers
+    ):
+        with pytest.raises(EidoValidationError) as e:
+            validate_project(
+                Project(test_file_value_check),
+                test_schema_value_check,
+                workers=workers,
+                chunk_size=1,
+                max_errors=1,
+            )
+        assert sum(len(v) for v in e.value.errors_by_type.values()) == 1
+
+
+class TestCombinedImportsValidation:
+    @pytest.fixture
+    def imports_schema_path(self, tmp_path):
+        base = {
+            "description": "base schema",
+            "properties": {
+                "samples": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"protocol": {"type": "string"}},
+                        "required": ["sample_name"],
+                    },
+                }
+            },
+        }
+        pipeline = {
+            "description": "pipeline schema",
+            "imports": [str(tmp_path / "base.yaml")],
+            "properties": {
+                "samples": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"protocol": {"enum": ["GRO"]}},
+                    },
+                }
+            },
+        }
+        for name, schema in [("base", base), ("pipeline", pipeline)]:
+            with open(tmp_path / f"{name}.yaml", "w") as f:
+                yaml.safe_dump(schema, f)
+        return str(tmp_path / "pipeline.yaml")
+
+    def test_imports_are_validated_in_one_pass(
+        self, project_object, imports_schema_path
+    ):
+        clear_validator_cache()
+        with pytest.raises(EidoValidationError):
+            validate_project(project_object, imports_schema_path)
+        assert validator_cache_info().misses == 1
+
+    @pytest.mark.parametrize("workers", [None, 2])
+    def test_errors_are_attributed_to_schemas(
+        self, project_object, imports_schema_path, workers
+    ):
+        with pytest.raises(EidoValidationError) as e:
+            validate_project(project_object, imports_schema_path, workers=workers)
+        errors = [x for v in e.value.errors_by_type.values() for x in v]
+        assert [(x["sample_name"], x["schema"]) for x in errors] == [
+            ("GSM1480327", "pipeline schema")
+        ]
+
+    def test_schemas_with_references_are_validated_separately(self, project_object):
+        clear_validator_cache()
+        validate_config(
+            project_object,
+            {
+                "imports": [
+                    {
+                        "definitions": {"config": {"type": "object"}},
+                        "properties": {"project": {"$ref": "#/definitions/config"}},
+                    }
+                ],
+                "properties": {"project": {"type": "object"}},
+            },
+        )
+        assert validator_cache_info().misses == 2
+
+
+class TestInputFileProbing:
+    def test_missing_files_reported_per_sample(
+        self, test_file_existing_pep, test_file_existing_schema
+    ):
+        prj = Project(test_file_existing_pep)
+        report = get_missing_input_files(prj, test_file_existing_schema)
+        assert set(report) == {"frog_1", "frog_2", "frog_3", "frog_4"}
+        assert all(r["missing"] for r in report.values() if r["required_inputs"])
+
+    def test_paths_are_probed_once(self, tmp_path, mocker):
+        (tmp_path / "a.txt").write_text("a")
+        (tmp_path / "dangling").symlink_to(tmp_path / "nowhere")
+        paths = [str(tmp_path / n) for n in ["a.txt", "b.txt", "dangling"]]
+        spy = mocker.spy(eido.file_probe, "_check_paths")
+        cache = StatCache(index_threshold=len(paths) + 1)
+        cache.probe(paths + paths)
+        cache.probe(paths)
+        assert spy.call_count == 1
+        assert cache.missing(paths) == paths[1:]
+
+    def test_crowded_directories_are_listed(self, tmp_path, mocker):
+        (tmp_path / "a.txt").write_text("a")
+        (tmp_path / "dangling").symlink_to(tmp_path / "nowhere")
+        paths = [str(tmp_path / n) for n in ["a.txt", "b.txt", "dangling"]]
+        spy = mocker.spy(eido.file_probe, "_exists")
+        cache = StatCache(index_threshold=2)
+        assert cache.missing(paths) == paths[1:]
+        # only the symlink is checked on its own
+        assert spy.call_count == 1
+        assert cache.size(paths[0]) == 1
+
+    def test_listed_directories_match_os_path_exists(self, tmp_path):
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "a.txt").write_text("a")
+        paths = [
+            str(tmp_path / "sub") + os.sep,
+            str(tmp_path / "sub" / "."),
+            str(tmp_path / "A.TXT"),
+            str(tmp_path / "a.txt"),
+            str(tmp_path / "b.txt"),
+        ]
+        cache = StatCache(index_threshold=1)
+        cache.probe(paths)
+        assert cache.missing(paths) == [p for p in paths if not os.path.exists(p)]
+        assert str(tmp_path / "sub") + os.sep not in cache.missing(paths)
+
+
+class TestProjectInputSizing:
+    def test_sizes_are_reported_per_sample(self, tmp_path):
+        (tmp_path / "a.txt").write_text("a" * 1024)
+        (tmp_path / "dir").mkdir()
+        (tmp_path / "dir" / "b.txt").write_text("b" * 2048)
+        (tmp_path / "samples.csv").write_text(
+            "sample_name,file\n"
+            f"s1,{tmp_path / 'a.txt'}\n"
+            f"s2,{tmp_path / 'dir'}\n"
+            f"s3,{tmp_path / 'missing.txt'}\n"
+        )
+        (tmp_path / "config.yaml").write_text(
+            "pep_version: 2.1.0\nsample_table: samples.csv\n"
+        )
+        schema = {
+            "properties": {
+                "samples": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string"}},
+                        "tangible": ["file"],
+                        "sizing": ["file"],
+                    },
+                }
+            }
+        }
+        table = get_project_input_files_size(
+            Project(str(tmp_path / "config.yaml")), [schema]
+        )
+        assert list(table.index) == ["s1", "s2", "s3"]
+        assert list(table["input_file_size"] * 1024**3) == [1024, 2048, 0]
+        assert table.loc["s3", "missing"] == [str(tmp_path / "missing.txt")]
+        assert table["required_inputs"].tolist() == [1, 1, 1]
+
+
+class TestInstrumentation:
+    def test_recorder_times_validation_phases(self, project_object, schema_file_path):
+        recorder = SpanRecorder()
+        add_span_callback(recorder)
+        try:
+            validate_project(project=project_object, schema=schema_file_path)
+        finally:
+            remove_span_callback(recorder)
+        summary = recorder.summary()
+        assert "validation.project" in summary
+        assert "validation.project/schema.read" in summary
+        assert "validation.project/validation.to_dict" in summary
+        assert "validation.project/validation.evaluate" in summary
+        total = summary["validation.project"]
+        assert 0 <= total["self"] <= total["total"]
+        assert json.loads(recorder.to_json())["summary"] == summary
+
+    def test_no_spans_after_callback_removed(self, project_object, schema_file_path):
+        recorder = SpanRecorder()
+        add_span_callback(recorder)
+        remove_span_callback(recorder)
+        validate_project(project=project_object, schema=schema_file_path)
+        assert recorder.spans == []
+
+    def test_failing_callback_does_not_break_validation(
+        self, project_object, schema_invalid_file_path
+    ):
+        def _callback(span):
+            raise RuntimeError("metrics backend down")
+
+        add_span_callback(_callback)
+        try:
+            with pytest.raises(EidoValidationError):
+                validate_project(
+                    project=project_object, schema=schema_invalid_file_path
+                )
+        finally:
+            remove_span_callback(_callback)
+
+
+class TestSchemaProfiler:
+    def test_rules_are_ranked_by_self_time(self, tmp_path):
+        (tmp_path / "samples.csv").write_text(
+            "sample_name,read1\n" + "".join(f"s{i},r{i}.fq\n" for i in range(20))
+        )
+        (tmp_path / "config.yaml").write_text(
+            "pep_version: 2.1.0\nsample_table: samples.csv\n"
+        )
+        schema = {
+            "properties": {
+                "samples": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "read1": {"type": "string", "pattern": "^r[0-9]+\\.fq$"}
+                        },
+                    },
+                }
+            }
+        }
+        project = Project(str(tmp_path / "config.yaml"))
+        with SchemaProfiler() as profiler:
+            validate_project(project, schema)
+        report = profiler.report()
+        rules = {r["location"]: r for r in report}
+        pattern = rules["#/properties/samples/items/properties/read1/anyOf/0/pattern"]
+        assert pattern["keyword"] == "pattern"
+        assert pattern["count"] == 20
+        assert 0 <= pattern["self"] <= pattern["total"]
+        assert [r["self"] for r in report] == sorted(
+            (r["self"] for r in report), reverse=True
+        )
+        assert sum(r["share"] for r in report) == pytest.approx(1)
+        assert "read1/anyOf/0/pattern" in profiler.format_report(limit=len(report))
+
+    def test_errors_are_still_reported(self, project_object, schema_invalid_file_path):
+        with SchemaProfiler() as profiler:
+            with pytest.raises(EidoValidationError):
+                validate_project(project_object, schema_invalid_file_path)
+        assert profiler.report()
+        assert eido.schema_profiler.get_schema_profiler() is None
+
+
+class TestDebugLogging:
+    def test_payloads_are_not_rendered_unless_logged(self, caplog):
+        class _Payload(dict):
+            rendered = 0
+
+            def __repr__(self):
+                _Payload.rendered += 1
+                return dict.__repr__(self)
+
+        caplog.set_level(logging.INFO, logger="eido")
+        eido.validation._validate_object(_Payload(a=1), {"type": "object"})
+        assert _Payload.rendered == 0
+        caplog.set_level(logging.DEBUG, logger="eido")
+        eido.validation._validate_object(_Payload(a=1), {"type": "object"})
+        assert _Payload.rendered > 0
+
+    def test_trace_is_written_as_json_lines(
+        self, tmp_path, project_object, schema_invalid_file_path
+    ):
+        handler = start_debug_trace(str(tmp_path / "trace.jsonl"))
+        try:
+            with pytest.raises(EidoValidationError):
+                validate_project(project_object, schema_invalid_file_path)
+        finally:
+            stop_debug_trace(handler)
+        with pytest.raises(EidoValidationError):
+            validate_config(project_object, schema_invalid_file_path)
+        with open(tmp_path / "trace.jsonl") as f:
+            records = [json.loads(line) for line in f]
+        events = [r["event"] for r in records]
+        assert "schema.preprocessed" in events
+        assert events.count("validation.object") == 1
+        record = records[events.index("validation.object")]
+        assert record["object"]["samples"]
+        assert record["errors"]